@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Compares reporting a build matrix with one puncover process per build and with one
+--report-manifest run.
+
+Generates synthetic firmware (see synthetic.py) and reports it under a number of tags into
+one JSON file, like CI does for each configuration of a build matrix. "separate" starts a
+process per build that imports the CLI, analyzes the build and adds its report to the file.
+"manifest" starts one process that analyzes all builds with puncover.batch and writes the
+file once. Names are demangled with c++filt if it's on the PATH:
+
+    python benchmarks/batch_reports.py --symbols 10000 --builds 20 --jobs 4
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+
+from puncover import batch, report
+from puncover.builders import ElfBuilder
+from puncover.collector import Collector
+from puncover.gcc_tools import GCCTools
+
+
+class DemanglingGccTools(synthetic.SyntheticGccTools):
+    def get_unmangled_names(self, symbol_names, chunk_size=1000):
+        cxxfilt = shutil.which("c++filt")
+        if not cxxfilt:
+            return super().get_unmangled_names(symbol_names, chunk_size)
+        tools = GCCTools(os.path.join(os.path.dirname(cxxfilt), ""))
+        return tools.get_unmangled_names(symbol_names, chunk_size)
+
+
+def builds(directory, count):
+    return [
+        {
+            "elf_file": os.path.join(directory, "firmware.elf"),
+            "su_dir": os.path.join(directory, "su"),
+            "src_root": synthetic.SRC_ROOT,
+            "tag": "config%d" % i,
+        }
+        for i in range(count)
+    ]
+
+
+def report_separately(directory, filename, tag):
+    # what a separate puncover --generate-report process imports
+    import puncover.puncover  # noqa: F401
+
+    builder = ElfBuilder(
+        Collector(DemanglingGccTools(directory)),
+        synthetic.SRC_ROOT,
+        os.path.join(directory, "firmware.elf"),
+        os.path.join(directory, "su"),
+    )
+    builder.collector.stages.listeners = []
+    builder.build()
+    report.generate_report(builder.collector, filename, tag)
+
+
+def report_manifest(directory, filename, count, jobs):
+    batch.generate_reports(
+        batch.analyze_builds(builds(directory, count), DemanglingGccTools(directory), jobs=jobs),
+        filename,
+    )
+
+
+def run(*args):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, __file__] + [str(a) for a in args], check=True, capture_output=True
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--builds", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--separate", nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument("--manifest", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.separate:
+        report_separately(*args.separate)
+        return
+    if args.manifest:
+        report_manifest(args.manifest[0], args.manifest[1], args.builds, args.jobs)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic.generate(directory, args.symbols)
+        print(
+            "%d synthetic symbols, %d builds, %d jobs, %s"
+            % (
+                args.symbols,
+                args.builds,
+                args.jobs,
+                "c++filt" if shutil.which("c++filt") else "no c++filt",
+            )
+        )
+
+        filename = os.path.join(directory, "separate")
+        separate = sum(
+            run("--separate", directory, filename, "config%d" % i) for i in range(args.builds)
+        )
+        filename = os.path.join(directory, "manifest")
+        manifest = run(
+            "--manifest", directory, filename, "--builds", args.builds, "--jobs", args.jobs
+        )
+        print("  separate processes %8.2f s" % separate)
+        print("  manifest           %8.2f s" % manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compares the cold start of puncover-report with puncover --non-interactive --generate-report.
+
+Compiles a small C program with gcc (or uses --elf and --build-dir), then starts each entry
+point a number of times in a fresh interpreter and prints the median wall time of --help,
+i.e. until the arguments are parsed, and of writing the report of the program. The ELF file
+is tiny, so the report is mostly startup. Needs binutils for the host on the PATH, or
+--gcc-tools-base:
+
+    python benchmarks/cold_start.py --runs 10
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROGRAM = """
+int leaf(int x) { return x * 2; }
+int main(void) { volatile int a[8]; a[0] = leaf(3); return a[0]; }
+"""
+
+ENTRY_POINTS = {
+    "puncover": ["-m", "puncover.puncover", "--non-interactive", "--generate-report"],
+    "puncover-report": ["-m", "puncover.headless"],
+}
+
+
+def compile_program(directory):
+    source = os.path.join(directory, "main.c")
+    with open(source, "w") as f:
+        f.write(PROGRAM)
+    elf = os.path.join(directory, "app.elf")
+    subprocess.run(
+        ["gcc", "-O0", "-g", "-fstack-usage", "-o", elf, source], check=True, cwd=directory
+    )
+    return elf
+
+
+def median_time(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--elf")
+    parser.add_argument("--build-dir")
+    parser.add_argument("--gcc-tools-base", help="defaults to the binutils on the PATH")
+    args = parser.parse_args()
+    gcc_tools_base = args.gcc_tools_base
+    if not gcc_tools_base:
+        objdump = shutil.which("objdump")
+        if not objdump:
+            parser.error("objdump isn't on the PATH, please specify --gcc-tools-base")
+        gcc_tools_base = os.path.join(os.path.dirname(objdump), "")
+
+    with tempfile.TemporaryDirectory() as directory:
+        elf = args.elf or compile_program(directory)
+        build_dir = args.build_dir or directory
+        report = [
+            "--gcc-tools-base",
+            gcc_tools_base,
+            elf,
+            "--build-dir",
+            build_dir,
+            "--report-filename",
+            os.path.join(directory, "report"),
+        ]
+
+        print("median of %d runs" % args.runs)
+        print("  %-16s %10s %10s" % ("", "--help ms", "report ms"))
+        for name, command in ENTRY_POINTS.items():
+            parsed = median_time(command + ["--help"], args.runs)
+            generated = median_time(command + report, args.runs)
+            print("  %-16s %10.0f %10.0f" % (name, parsed * 1000, generated * 1000))
+
+
+if __name__ == "__main__":
+    main()
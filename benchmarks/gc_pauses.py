@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Measures garbage collector pauses while rebuilding and serving a synthetic snapshot.
+
+Builds the snapshot a few times, then requests the main pages, and records every collection
+with gc.callbacks. Runs once with the builder's GC handling (see Builder.pause_gc) and once
+without it, each in a fresh process:
+
+    python benchmarks/gc_pauses.py --symbols 100000
+"""
+
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from web_latency import create_app, in_process_requester
+
+
+class PauseRecorder:
+    def __init__(self):
+        self.pauses = []
+        self.started = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self.started = time.perf_counter()
+        else:
+            self.pauses.append((info["generation"], time.perf_counter() - self.started))
+
+    def take(self):
+        pauses, self.pauses = self.pauses, []
+        return {
+            "collections": len(pauses),
+            "full_collections": sum(1 for generation, _ in pauses if generation == 2),
+            "total_pause": sum(p for _, p in pauses),
+            "max_pause": max((p for _, p in pauses), default=0.0),
+        }
+
+
+def measure(symbols, pause_gc, builds, requests):
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = synthetic.generate(directory, symbols)
+        builder = synthetic.create_builder(directory)
+        builder.pause_gc = pause_gc
+        builder.collector.stages.listeners = []
+
+        recorder = PauseRecorder()
+        gc.callbacks.append(recorder)
+        result = {"pause_gc": pause_gc, "builds": [], "serving": None}
+        for _ in range(builds):
+            start = time.perf_counter()
+            builder.build()
+            build = recorder.take()
+            build["wall"] = time.perf_counter() - start
+            result["builds"].append(build)
+
+    app = create_app(builder.collector)
+    request = in_process_requester(app)
+    pages = list(synthetic.sample_pages(builder.collector, corpus["hubs"][0]).values())
+    start = time.perf_counter()
+    for i in range(requests):
+        method, path, data = pages[i % len(pages)]
+        request(method, path, data)
+    result["serving"] = recorder.take()
+    result["serving"]["throughput"] = requests / (time.perf_counter() - start)
+    gc.callbacks.remove(recorder)
+    return result
+
+
+def print_result(r):
+    print("\n" + ("with" if r["pause_gc"] else "without") + " GC handling")
+    print(
+        "  %-10s %8s %12s %6s %10s %10s"
+        % ("", "wall s", "collections", "full", "pause s", "max ms")
+    )
+    rows = [("build %d" % (i + 1), b) for i, b in enumerate(r["builds"])]
+    rows.append(("serving", r["serving"]))
+    for name, m in rows:
+        print(
+            "  %-10s %8s %12d %6d %10.3f %10.1f"
+            % (
+                name,
+                "%.2f" % m["wall"] if "wall" in m else "",
+                m["collections"],
+                m["full_collections"],
+                m["total_pause"],
+                m["max_pause"] * 1000,
+            )
+        )
+    print("  serving throughput: %.1f req/s" % r["serving"]["throughput"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--builds", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--mode", choices=["both", "paused", "unpaused"], default="both")
+    args = parser.parse_args()
+
+    if args.mode != "both":
+        result = measure(args.symbols, args.mode == "paused", args.builds, args.requests)
+        print(json.dumps(result))
+        return
+
+    for mode in ["unpaused", "paused"]:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--mode",
+                mode,
+                "--symbols",
+                str(args.symbols),
+                "--builds",
+                str(args.builds),
+                "--requests",
+                str(args.requests),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        print_result(json.loads(output.strip().splitlines()[-1]))
+
+
+if __name__ == "__main__":
+    main()
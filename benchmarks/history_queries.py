@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Measures queries of a --report-history database against reading the reports of all tags.
+
+Analyzes synthetic firmware (see synthetic.py) once and adds its report under a number of
+tags, changing the size of a few functions for every tag like a series of commits would.
+Prints the time to add a tag, the size of the database, and the time of a folder trend, a
+stack trend and the top growers between two tags, compared with computing the folder trend
+from a --report-shards folder:
+
+    python benchmarks/history_queries.py --symbols 10000 --tags 500
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import synthetic
+
+from puncover import history, report
+
+
+def tag_entries(symbols, tags, seed=1):
+    rng = random.Random(seed)
+    for i in range(tags):
+        for f in rng.sample(symbols["functions"], min(20, len(symbols["functions"]))):
+            f["size"] += rng.randint(-8, 16)
+        yield {
+            "timestamp": "2026-01-01T00:00:%02d" % (i % 60),
+            "stack_report": {"thread": {"max_static_stack_size": 512 + 8 * (i % 7)}},
+            "functions": report.Stream(symbols["functions"]),
+            "variables": report.Stream(symbols["variables"]),
+        }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def shards_folder_trend(folder, path):
+    trend = []
+    for tag in report.read_index(folder):
+        functions = report.read_tag(folder, tag)["functions"]
+        trend.append((tag, sum(f["size"] for f in functions if f["file"][1:].startswith(path))))
+    return trend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic.generate(directory, args.symbols)
+        builder = synthetic.create_builder(directory)
+        builder.collector.stages.listeners = []
+        builder.build()
+        # the export warns about each key it doesn't know
+        with contextlib.redirect_stdout(io.StringIO()):
+            symbols = {
+                "functions": list(builder.collector.report_symbols(functions=True)),
+                "variables": list(builder.collector.report_symbols(functions=False)),
+            }
+        folder = os.path.dirname(symbols["functions"][0]["file"][1:])
+
+        database = os.path.join(directory, "history.sqlite")
+        shards = os.path.join(directory, "reports")
+        db = history.open_history(database)
+        add = 0
+        for i, entry in enumerate(tag_entries(symbols, args.tags)):
+            report.write_shard(shards, "tag%d" % i, entry, compress=True)
+            add += timed(history.add_tag, db, "tag%d" % i, entry)[1]
+
+        print("%d synthetic symbols, %d tags, folder %s" % (args.symbols, args.tags, folder))
+        trend, folder_trend = timed(history.folder_trend, db, folder)
+        stack_trend = timed(history.stack_trend, db, "thread")[1]
+        growers = timed(history.growers, db, "tag0", "tag%d" % (args.tags - 1))[1]
+        expected, shards_trend = timed(shards_folder_trend, shards, folder + "/")
+        assert expected == trend
+        for name, value, unit in [
+            ("add tag", add / args.tags * 1000, "ms"),
+            ("database", os.path.getsize(database) / 2**20, "MiB"),
+            ("folder trend", folder_trend * 1000, "ms"),
+            ("stack trend", stack_trend * 1000, "ms"),
+            ("growers", growers * 1000, "ms"),
+            ("folder trend, shards", shards_trend * 1000, "ms"),
+        ]:
+            print("  %-22s %10.1f %s" % (name, value, unit))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
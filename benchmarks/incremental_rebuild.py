@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Measures rebuilds after a small change, with and without Builder.incremental_analysis.
+
+Builds a synthetic snapshot (see synthetic.py), then lets one function in the middle grow by
+an instruction, which moves all functions after it, and rebuilds. Prints the assembly
+analysis and the whole build of both builds and how many functions were analyzed again:
+
+    python benchmarks/incremental_rebuild.py --symbols 30000
+"""
+
+import argparse
+import io
+import os
+import tempfile
+
+import synthetic
+
+from puncover.profiling import StageProfiler
+
+
+def build(builder):
+    profiler = StageProfiler(out=io.StringIO())
+    builder.collector.stages.listeners = [profiler]
+    builder.build()
+    report = profiler.report()
+    stages = {s["name"]: s["wall"] for s in report["stages"]}
+    return {"assembly": stages["assembly"], "build": report["total"]["wall"]}
+
+
+def measure(symbols, incremental):
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = synthetic.generate(directory, symbols)
+        builder = synthetic.create_builder(directory)
+        builder.incremental_analysis = incremental
+        first = build(builder)
+        before = dict(builder.collector.analysis_cache or {})
+
+        synthetic.generate(directory, symbols, grow=corpus["functions"] // 2)
+        os.utime(os.path.join(directory, "firmware.elf"))
+        # SyntheticGccTools caches nothing, the builder reads the new files
+        rebuild = build(builder)
+        after = builder.collector.analysis_cache or {}
+        rebuild["analyzed"] = sum(1 for key in after if key not in before)
+        rebuild["functions"] = len(builder.collector.all_functions())
+        return first, rebuild
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[10000])
+    args = parser.parse_args()
+
+    for symbols in args.symbols:
+        print("\n%d synthetic symbols" % symbols)
+        print(
+            "  %-12s %12s %10s %14s %12s %10s"
+            % ("", "assembly s", "build s", "re-assembly s", "rebuild s", "analyzed")
+        )
+        for incremental in [False, True]:
+            first, rebuild = measure(symbols, incremental)
+            print(
+                "  %-12s %12.3f %10.2f %14.3f %12.2f %10s"
+                % (
+                    "incremental" if incremental else "full",
+                    first["assembly"],
+                    first["build"],
+                    rebuild["assembly"],
+                    rebuild["build"],
+                    "%d/%d" % (rebuild["analyzed"], rebuild["functions"]) if incremental else "all",
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Compares the objdump profiles (see --objdump-profile) on real ELF files.
+
+For each file and profile, measures the size of objdump's output, the time to run objdump and
+read its output, and the time parse_assembly_text() needs for it. Also checks that every
+profile yields the same functions with the same instructions as "full".
+
+    python benchmarks/objdump_profiles.py --gcc-tools-base arm-none-eabi- firmware.elf
+"""
+
+import argparse
+import pathlib
+import time
+
+from puncover import collector
+from puncover.collector import Collector
+from puncover.gcc_tools import GCCTools
+
+PROFILES = [
+    ("full", dict(objdump_profile="full")),
+    ("lean", dict(objdump_profile="lean")),
+    ("lean -l off", dict(objdump_profile="lean", line_numbers=False)),
+]
+
+
+def measure(gcc_tools_base, elf_file, options):
+    tools = GCCTools(gcc_tools_base, **options)
+    start = time.perf_counter()
+    lines = tools.get_assembly_lines(elf_file)
+    objdump = time.perf_counter() - start
+
+    c = Collector(tools)
+    is_code = c.count_assembly_code_bytes_re.match
+    start = time.perf_counter()
+    c.parse_assembly_text("".join(lines))
+    parse = time.perf_counter() - start
+
+    # without -l, there are neither "function():" lines nor the indentation they cause
+    functions = {
+        address: (s[collector.NAME], [line.strip() for line in s[collector.ASM] if is_code(line)])
+        for address, s in c.symbols.items()
+        if collector.ASM in s
+    }
+    return {
+        "bytes": sum(len(line) for line in lines),
+        "lines": len(lines),
+        "objdump": objdump,
+        "parse": parse,
+        "functions": functions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("elf_files", nargs="+")
+    parser.add_argument("--gcc-tools-base", default="", help="e.g. arm-none-eabi- or /usr/bin/")
+    parser.add_argument("--section", action="append", help="also measure lean with -j SECTION")
+    args = parser.parse_args()
+
+    profiles = list(PROFILES)
+    if args.section:
+        name = "lean " + " ".join(args.section)
+        profiles.append((name, dict(objdump_profile="lean", objdump_sections=args.section)))
+
+    for elf_file in args.elf_files:
+        elf_file = pathlib.Path(elf_file).absolute()
+        print("\n%s (%.1f MiB)" % (elf_file, elf_file.stat().st_size / 2**20))
+        print(
+            "  %-16s %10s %10s %10s %9s %10s %s"
+            % ("profile", "MiB", "lines", "objdump s", "parse s", "functions", "same code")
+        )
+        full = None
+        for name, options in profiles:
+            r = measure(args.gcc_tools_base, elf_file, options)
+            full = full or r
+            print(
+                "  %-16s %10.1f %10d %10.2f %9.2f %10d %s"
+                % (
+                    name,
+                    r["bytes"] / 2**20,
+                    r["lines"],
+                    r["objdump"],
+                    r["parse"],
+                    len(r["functions"]),
+                    "yes"
+                    if r["functions"] == full["functions"]
+                    else "%d differ"
+                    % sum(1 for a, f in full["functions"].items() if r["functions"].get(a) != f),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Measures the assembly analysis with a growing number of worker processes (--jobs).
+
+Builds one synthetic snapshot (see synthetic.py) per number of jobs and prints the wall time
+of the assembly stage and of the whole build, and the speedup over a single process. The CPU
+time of the parent process in the assembly stage is the part that doesn't shrink with more
+workers, it bounds the speedup on machines with enough CPUs:
+
+    python benchmarks/parallel_analysis.py --symbols 100000 --jobs 1 2 4 8 16 32
+
+Speedups are bounded by the CPUs of the machine, which are printed as well.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+import synthetic
+
+from puncover.profiling import StageProfiler
+
+
+def build(directory, jobs):
+    builder = synthetic.create_builder(directory)
+    builder.jobs = jobs
+    profiler = StageProfiler(out=io.StringIO())
+    builder.collector.stages.listeners = [profiler]
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.build()
+    report = profiler.report()
+    assembly = [s for s in report["stages"] if s["name"] == "assembly"][0]
+    return {
+        "assembly": assembly["wall"],
+        "parent": assembly["cpu"],
+        "build": report["total"]["wall"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[30000])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print("%d CPUs" % (os.cpu_count() or 1))
+    for symbols in args.symbols:
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic.generate(directory, symbols)
+            print("\n%d synthetic symbols" % symbols)
+            print(
+                "  %6s %12s %14s %10s %10s"
+                % ("jobs", "assembly s", "parent cpu s", "build s", "speedup")
+            )
+            baseline = None
+            for jobs in args.jobs:
+                run = build(directory, jobs)
+                baseline = baseline or run["assembly"]
+                print(
+                    "  %6d %12.3f %14.3f %10.2f %9.2fx"
+                    % (
+                        jobs,
+                        run["assembly"],
+                        run["parent"],
+                        run["build"],
+                        baseline / run["assembly"],
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Times the analysis pipeline and the main pages against synthetic firmware of growing size.
+
+For each size, a corpus is generated (see synthetic.py) and analysed with the regular
+ElfBuilder; every stage is timed, including the call trees computed by BacktraceHelper.
+Then each kind of page is requested once with empty caches (cold) and a few more times
+(warm).
+
+    python benchmarks/pipeline.py --symbols 10000 100000 1000000 --output before.json
+    python benchmarks/pipeline.py --symbols 10000 100000 1000000 --compare before.json
+
+The results are saved as JSON after each size, runs of different revisions can be compared
+with --compare.
+"""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import synthetic
+from flask import Flask
+from werkzeug.test import Client
+
+from puncover import renderers
+from puncover.profiling import StageProfiler
+
+
+def time_request(client, method, path, data):
+    start = time.perf_counter()
+    response = client.open(path, method=method, data=data)
+    response.get_data()
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise Exception("%s %s returned %s" % (method, path, response.status_code))
+    return elapsed
+
+
+def time_pages(collector, hub, repeat):
+    app = Flask("puncover.puncover")
+    renderers.register_jinja_filters(app.jinja_env)
+    renderers.register_urls(app, collector)
+    client = Client(app)
+
+    result = {}
+    for name, (method, path, data) in synthetic.sample_pages(collector, hub).items():
+        cold = time_request(client, method, path, data)
+        warm = [time_request(client, method, path, data) for _ in range(repeat)]
+        result[name] = {"path": path, "cold": cold, "warm": statistics.median(warm)}
+    return result
+
+
+def run(symbols, seed, pages=True, repeat=3):
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        corpus = synthetic.generate(directory, symbols, seed=seed)
+        generated = time.perf_counter() - start
+
+        builder = synthetic.create_builder(directory)
+        profiler = StageProfiler(out=io.StringIO())
+        builder.collector.stages.listeners = [profiler]
+        builder.build()
+        report = profiler.report()
+
+        result = {
+            "symbols": symbols,
+            "functions": corpus["functions"],
+            "files": corpus["files"],
+            "generate": generated,
+            "stages": {s["name"]: s for s in report["stages"]},
+            "build": report["total"],
+        }
+        if pages:
+            result["pages"] = time_pages(builder.collector, corpus["hubs"][0], repeat)
+        return result
+
+
+def measurements(run):
+    """Flat {name: seconds} of a run, used for printing and comparing."""
+    result = {"stage " + name: s["wall"] for name, s in run["stages"].items()}
+    result["build"] = run["build"]["wall"]
+    for name, page in run.get("pages", {}).items():
+        result["page %s cold" % name] = page["cold"]
+        result["page %s warm" % name] = page["warm"]
+    return result
+
+
+def print_run(run, baseline=None):
+    print("\n%d symbols, %d functions, %d files" % (run["symbols"], run["functions"], run["files"]))
+    old = measurements(baseline) if baseline else {}
+    for name, seconds in measurements(run).items():
+        line = "  %-24s %10.3f s" % (name, seconds)
+        if old.get(name):
+            line += "  %6.2fx" % (seconds / old[name])
+        print(line)
+    print("  %-24s %10.1f MiB" % ("peak rss", (run["build"]["peak_rss"] or 0) / (1024 * 1024)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[10000])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="warm requests per page")
+    parser.add_argument("--no-pages", action="store_true", help="only time the analysis")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON of an earlier run, prints the ratios to it")
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baselines = {r["symbols"]: r for r in json.load(f)["runs"]}
+
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "runs": [],
+    }
+    for symbols in args.symbols:
+        result = run(symbols, args.seed, pages=not args.no_pages, repeat=args.repeat)
+        results["runs"].append(result)
+        print_run(result, baselines.get(symbols))
+
+        if args.output:
+            # save after each size, the largest ones might not finish
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Measures the time until the first pages are served, with and without --quick-start.
+
+Builds the snapshot, then opens the overview and the symbol pages of the biggest functions
+(each disassembled on demand with --quick-start). With --quick-start, also waits for the
+complete analysis in the background. Runs on synthetic firmware (see synthetic.py) or on
+real ELF files with a toolchain:
+
+    python benchmarks/quick_start.py --symbols 30000
+    python benchmarks/quick_start.py --gcc-tools-base arm-none-eabi- firmware.elf
+"""
+
+import argparse
+import tempfile
+import time
+
+import synthetic
+from web_latency import create_app, in_process_requester
+
+from puncover.puncover import create_builder
+
+
+def measure(new_builder, quick_start, pages):
+    start = time.perf_counter()
+    builder = new_builder()
+    builder.quick_start = quick_start
+    builder.collector.stages.listeners = []
+    builder.build()
+    result = {"build": time.perf_counter() - start}
+
+    collector = builder.collector
+    request = in_process_requester(create_app(collector))
+    biggest = sorted(collector.all_functions(), key=lambda f: f.get("size", 0), reverse=True)
+    paths = ["/"] + ["/path/%s/" % collector.qualified_symbol_name(f) for f in biggest[:pages]]
+    for path in paths:
+        with builder.lock.read():
+            status = request("GET", path, None)
+        assert status == 200, "%s: %d" % (path, status)
+        result.setdefault("first_page", time.perf_counter() - start)
+    result["pages"] = time.perf_counter() - start
+
+    if builder.background_analysis:
+        builder.background_analysis.join()
+        result["complete"] = time.perf_counter() - start
+        result["asm_lines"] = sum(len(f.get("asm", [])) for f in collector.all_functions())
+    return result
+
+
+def run(name, new_builder, pages):
+    print("\n" + name)
+    print("  %-12s %8s %12s %10s %10s" % ("", "build s", "first page s", "pages s", "complete s"))
+    for quick_start in [False, True]:
+        r = measure(new_builder, quick_start, pages)
+        print(
+            "  %-12s %8.2f %12.2f %10.2f %10s"
+            % (
+                "quick start" if quick_start else "full",
+                r["build"],
+                r["first_page"],
+                r["pages"],
+                "%.2f" % r["complete"] if "complete" in r else "",
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("elf_files", nargs="*")
+    parser.add_argument("--gcc-tools-base", default="", help="e.g. arm-none-eabi- or /usr/bin/")
+    parser.add_argument("--symbols", type=int, nargs="*", default=[], help="synthetic sizes")
+    parser.add_argument("--pages", type=int, default=5, help="symbol pages to open")
+    args = parser.parse_args()
+
+    for symbols in args.symbols:
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic.generate(directory, symbols)
+            run(
+                "%d synthetic symbols" % symbols,
+                lambda: synthetic.create_builder(directory),
+                args.pages,
+            )
+
+    for elf_file in args.elf_files:
+        run(
+            elf_file,
+            lambda: create_builder(args.gcc_tools_base, elf_file=elf_file),
+            args.pages,
+        )
+
+
+if __name__ == "__main__":
+    main()
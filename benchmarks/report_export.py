@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Measures --generate-report while tags accumulate, in one JSON file and with --report-shards.
+
+Analyzes synthetic firmware (see synthetic.py) once and adds its report under a number of
+tags, like CI does for every commit. Prints the time and the peak of Python allocations of
+adding the last tag, and the size of the reports on disk:
+
+    python benchmarks/report_export.py --symbols 30000 --tags 10
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import synthetic
+
+from puncover import report
+
+
+def disk_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic.generate(directory, args.symbols)
+        builder = synthetic.create_builder(directory)
+        builder.collector.stages.listeners = []
+        builder.build()
+
+        print("%d synthetic symbols, %d tags" % (args.symbols, args.tags))
+        print("  %-14s %12s %14s %10s" % ("", "last tag s", "peak MiB", "disk MiB"))
+        for name, shards, compress in [
+            ("single file", False, False),
+            ("shards", True, False),
+            ("shards + gzip", True, True),
+        ]:
+            filename = os.path.join(directory, name.replace(" ", "_"))
+            for i in range(args.tags):
+                tracemalloc.start()
+                start = time.perf_counter()
+                # the export warns about each key it doesn't know
+                with contextlib.redirect_stdout(io.StringIO()):
+                    report.generate_report(
+                        builder.collector, filename, "tag%d" % i, shards=shards, compress=compress
+                    )
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            path = filename if shards else filename + ".json"
+            print(
+                "  %-14s %12.2f %14.1f %10.1f"
+                % (name, elapsed, peak / 2**20, disk_size(path) / 2**20)
+            )
+
+
+if __name__ == "__main__":
+    main()
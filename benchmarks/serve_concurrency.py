@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Measures how a running puncover server copes with concurrent users.
+
+Start the server first, e.g. with the development server
+
+    puncover project.elf --no-open-browser
+
+or with pre-forked workers
+
+    puncover project.elf --no-open-browser --serve --workers 8
+
+then fire requests from a number of concurrent clients for a fixed duration:
+
+    python benchmarks/serve_concurrency.py http://127.0.0.1:5000 / /all/ --clients 1 4 16
+
+Each client picks the given paths round robin over a keep-alive connection.
+"""
+
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_client(host, port, paths, deadline, latencies, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(e)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(url, paths, clients, duration):
+    parts = urlsplit(url)
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(parts.hostname, parts.port or 80, paths, deadline, latencies, errors),
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+        "mean": statistics.mean(latencies) if latencies else float("nan"),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("url", help="base URL of the running server")
+    parser.add_argument("paths", nargs="*", default=["/"], help="paths to request")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per client count")
+    args = parser.parse_args()
+
+    print("clients  requests  errors    req/s   p50 ms   p95 ms   p99 ms")
+    for clients in args.clients:
+        r = run(args.url, args.paths, clients, args.duration)
+        print(
+            "{clients:7d} {requests:9d} {errors:7d} {throughput:8.1f} {p50_ms:8.1f} "
+            "{p95_ms:8.1f} {p99_ms:8.1f}".format(
+                p50_ms=r["p50"] * 1000, p95_ms=r["p95"] * 1000, p99_ms=r["p99"] * 1000, **r
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
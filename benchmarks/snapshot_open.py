@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Measures how long it takes to open a snapshot written with --store, see --snapshot.
+
+Analyzes synthetic firmware (see synthetic.py) into a snapshot the way CI would, then opens
+it in a fresh process, like a reviewer running puncover --snapshot, and times opening the
+file and the first requests of the main pages. "first page" is the time from starting the
+process until the overview has been rendered:
+
+    python benchmarks/snapshot_open.py --symbols 10000 100000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from web_latency import create_app, in_process_requester
+
+from puncover.builders import ElfBuilder
+from puncover.store import StoreCollector
+
+
+def write_snapshot(directory, symbols):
+    corpus = synthetic.generate(directory, symbols)
+    builder = ElfBuilder(
+        StoreCollector(synthetic.SyntheticGccTools(directory)),
+        synthetic.SRC_ROOT,
+        os.path.join(directory, "firmware.elf"),
+        os.path.join(directory, "su"),
+    )
+    builder.collector.stages.listeners = []
+    builder.store_path = os.path.join(directory, "firmware.sqlite")
+    start = time.perf_counter()
+    builder.build()
+    builder.collector.reset()
+    return builder.store_path, corpus["hubs"][0], time.perf_counter() - start
+
+
+def open_snapshot(path, hub):
+    start = time.perf_counter()
+    collector = StoreCollector(None)
+    collector.open(path)
+    result = {"open": time.perf_counter() - start}
+    request = in_process_requester(create_app(collector))
+    assert request("GET", "/", None) == 200
+    # wall clock, compared with the start of the process
+    result["first_page"] = time.time()
+    for name, (method, page, data) in synthetic.sample_pages(collector, hub).items():
+        start = time.perf_counter()
+        assert request(method, page, data) == 200, page
+        result[name] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[10000])
+    parser.add_argument("--open", nargs=2, metavar=("SNAPSHOT", "HUB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.open:
+        print(json.dumps(open_snapshot(*args.open)))
+        return
+
+    pages = ["overview", "folder", "file", "symbol", "all"]
+    print(
+        "  %8s %8s %8s %12s %8s" % ("symbols", "build s", "MiB", "first page s", "open ms")
+        + "".join(" %11s" % ("%s ms" % p) for p in pages)
+    )
+    for symbols in args.symbols:
+        with tempfile.TemporaryDirectory() as directory:
+            path, hub, build = write_snapshot(directory, symbols)
+            started = time.time()
+            output = subprocess.run(
+                [sys.executable, __file__, "--open", path, hub],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            print(
+                "  %8d %8.2f %8.1f %12.2f %8.1f"
+                % (
+                    symbols,
+                    build,
+                    os.path.getsize(path) / 2**20,
+                    r["first_page"] - started,
+                    r["open"] * 1000,
+                )
+                + "".join(" %11.1f" % (r[p] * 1000) for p in pages)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Measures resident memory and symbol page latency with and without --spill-assembly.
+
+Builds a synthetic snapshot (see synthetic.py), collects garbage and reads the resident set
+size, then requests the symbol pages of the biggest functions and exports the JSON report.
+Each mode runs in a fresh process, so the numbers don't depend on each other:
+
+    python benchmarks/spill_memory.py --symbols 30000
+"""
+
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from web_latency import create_app, in_process_requester
+
+from puncover import metrics
+
+
+def measure(symbols, spill_assembly, pages):
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic.generate(directory, symbols)
+        before = metrics.resident_memory()
+        builder = synthetic.create_builder(directory)
+        builder.spill_assembly = spill_assembly
+        builder.collector.stages.listeners = []
+        start = time.perf_counter()
+        builder.build()
+        result = {"spill_assembly": spill_assembly, "build": time.perf_counter() - start}
+    gc.collect()
+    result["rss"] = metrics.resident_memory() - before
+
+    collector = builder.collector
+    request = in_process_requester(create_app(collector))
+    biggest = sorted(collector.all_functions(), key=lambda f: f.get("size", 0), reverse=True)
+    start = time.perf_counter()
+    for f in biggest[:pages]:
+        status = request("GET", "/path/%s/" % collector.qualified_symbol_name(f), None)
+        assert status == 200, status
+    result["page"] = (time.perf_counter() - start) / pages
+
+    start = time.perf_counter()
+    report = {}
+    collector.prepare_report_for_json_export(report)
+    json.dumps(report)
+    result["report"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--pages", type=int, default=20, help="symbol pages to open")
+    parser.add_argument("--mode", choices=["both", "spill", "memory"], default="both")
+    args = parser.parse_args()
+
+    if args.mode != "both":
+        print(json.dumps(measure(args.symbols, args.mode == "spill", args.pages)))
+        return
+
+    print("%d synthetic symbols" % args.symbols)
+    print("  %-8s %8s %8s %10s %9s" % ("", "build s", "RSS MiB", "page ms", "report s"))
+    for mode in ["memory", "spill"]:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--mode",
+                mode,
+                "--symbols",
+                str(args.symbols),
+                "--pages",
+                str(args.pages),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(
+            "  %-8s %8.2f %8.1f %10.1f %9.2f"
+            % (mode, r["build"], r["rss"] / 2**20, r["page"] * 1000, r["report"])
+        )
+
+
+if __name__ == "__main__":
+    main()
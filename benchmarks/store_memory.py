@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Measures resident memory and page latency with and without --store.
+
+Builds a synthetic snapshot (see synthetic.py), collects garbage and reads the resident set
+size of the serving process, then requests the sample pages and the symbol pages of the
+biggest functions and exports the JSON report. Each mode runs in a fresh process, so the
+numbers don't depend on each other:
+
+    python benchmarks/store_memory.py --symbols 30000
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from web_latency import create_app, in_process_requester
+
+from puncover import profiling
+from puncover.builders import ElfBuilder
+from puncover.store import StoreCollector
+
+
+def measure(symbols, store, pages):
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = synthetic.generate(directory, symbols)
+        before = profiling.resident_memory()
+        builder = synthetic.create_builder(directory)
+        if store:
+            builder = ElfBuilder(
+                StoreCollector(builder.collector.gcc_tools),
+                synthetic.SRC_ROOT,
+                builder.elf_file,
+                builder.su_dir,
+            )
+            builder.store_path = os.path.join(directory, "report.sqlite")
+        builder.collector.stages.listeners = []
+        start = time.perf_counter()
+        builder.build()
+        result = {"store": store, "build": time.perf_counter() - start}
+        gc.collect()
+        result["rss"] = profiling.resident_memory() - before
+
+        collector = builder.collector
+        request = in_process_requester(create_app(collector))
+        biggest = collector.all_functions()[:pages]
+        start = time.perf_counter()
+        for f in biggest:
+            status = request("GET", "/path/%s/" % collector.qualified_symbol_name(f), None)
+            assert status == 200, status
+        result["page"] = (time.perf_counter() - start) / pages
+
+        for name, (method, path, data) in synthetic.sample_pages(
+            collector, corpus["hubs"][0]
+        ).items():
+            start = time.perf_counter()
+            assert request(method, path, data) == 200, path
+            result[name] = time.perf_counter() - start
+        gc.collect()
+        result["rss_pages"] = profiling.resident_memory() - before
+
+        start = time.perf_counter()
+        report = {}
+        collector.prepare_report_for_json_export(report)
+        json.dumps(report)
+        result["report"] = time.perf_counter() - start
+        collector.reset()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--pages", type=int, default=20, help="symbol pages to open")
+    parser.add_argument("--mode", choices=["both", "store", "memory"], default="both")
+    args = parser.parse_args()
+
+    if args.mode != "both":
+        print(json.dumps(measure(args.symbols, args.mode == "store", args.pages)))
+        return
+
+    print("%d synthetic symbols" % args.symbols)
+    columns = ["overview", "folder", "file", "all"]
+    print(
+        "  %-8s %8s %8s %12s %10s" % ("", "build s", "RSS MiB", "+pages MiB", "symbol ms")
+        + "".join(" %9s" % ("%s ms" % c) for c in columns)
+        + " %9s" % "report s"
+    )
+    for mode in ["memory", "store"]:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--mode",
+                mode,
+                "--symbols",
+                str(args.symbols),
+                "--pages",
+                str(args.pages),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(
+            "  %-8s %8.2f %8.1f %12.1f %10.1f"
+            % (mode, r["build"], r["rss"] / 2**20, r["rss_pages"] / 2**20, r["page"] * 1000)
+            + "".join(" %9.1f" % (r[c] * 1000) for c in columns)
+            + " %9.2f" % r["report"]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Synthetic firmware for benchmarks.
+
+generate() writes what objdump, nm and GCC's -fstack-usage would produce for a made-up ELF
+file with any number of symbols: C and C++ functions spread over a deep folder hierarchy,
+call chains, a few hub functions most others call (think memcpy or a logger) and variables.
+SyntheticGccTools reads these files instead of running a cross-compiler's binutils, so the
+complete pipeline runs on any machine.
+"""
+
+import json
+import os
+import pathlib
+import random
+
+from puncover.builders import ElfBuilder
+from puncover.collector import Collector
+from puncover.gcc_tools import GCCTools
+
+CODE_BASE = 0x08000000
+DATA_BASE = 0x20000000
+SRC_ROOT = "/work/firmware"
+
+# functions per call chain, also the depth of the deepest call tree
+CHAIN_LENGTH = 48
+SYMBOLS_PER_FILE = 25
+WORDS = ["uart", "spi", "timer", "gpio", "flash", "ble", "sensor", "display", "power", "log"]
+
+
+def function_name(rng, i, cpp):
+    word = rng.choice(WORDS)
+    if not cpp:
+        return "%s_%d" % (word, i), "%s_%d" % (word, i)
+    cls = "%sDriver%d" % (word.capitalize(), i // 16)
+    method = "handle%d" % i
+    mangled = "_ZN%d%s%d%sEv" % (len(cls), cls, len(method), method)
+    return mangled, "%s::%s()" % (cls, method)
+
+
+def file_paths(rng, count):
+    result = []
+    for i in range(count):
+        depth = rng.randint(1, 6)
+        folders = ["lib%d" % rng.randrange(6) for _ in range(depth)]
+        ext = ".cpp" if rng.random() < 0.25 else ".c"
+        result.append("/".join(["src"] + folders + ["%s_%d%s" % (rng.choice(WORDS), i, ext)]))
+    return result
+
+
+def instruction(address, mnemonic, operands, code="4668     "):
+    return "%8x:\t%s \t%s\t%s" % (address, code, mnemonic, operands)
+
+
+def bl_code(address, target):
+    """Thumb-2 encoding of a bl from address to target, it depends on the distance."""
+    offset = ((target - address - 4) >> 1) & 0xFFFFFF
+    s = offset >> 23
+    j1 = 1 - ((offset >> 22) & 1 ^ s)
+    j2 = 1 - ((offset >> 21) & 1 ^ s)
+    first = 0xF000 | s << 10 | (offset >> 11) & 0x3FF
+    second = 0xD000 | j1 << 13 | j2 << 11 | offset & 0x7FF
+    return "%04x %04x" % (first, second)
+
+
+def generate(directory, symbols, seed=1, max_instructions=24, grow=None):
+    """
+    Writes firmware.elf (empty, for its modification time), firmware.objdump, firmware.nm,
+    firmware.demangled.json and su/*.su into directory. Returns some facts about the
+    corpus, e.g. the names of the hub functions.
+
+    grow is the index of a function that gets one more instruction, like after a small
+    source change: all later functions move. Their assembly only differs in addresses and
+    in the encodings of bl instructions and literals that span the grown function.
+    """
+    rng = random.Random(seed)
+    directory = pathlib.Path(directory)
+    (directory / "su").mkdir(parents=True, exist_ok=True)
+
+    num_functions = max(2, symbols * 4 // 5)
+    num_variables = symbols - num_functions
+    num_hubs = max(1, num_functions // 1000)
+    files = file_paths(rng, max(1, symbols // SYMBOLS_PER_FILE))
+
+    def call_targets(i):
+        if i < num_hubs:
+            return []
+        # calls only go to functions later in the same chain, so call trees are at most
+        # CHAIN_LENGTH deep and free of cycles
+        chain_start = i - (i - num_hubs) % CHAIN_LENGTH
+        chain_end = min(chain_start + CHAIN_LENGTH, num_functions)
+        targets = []
+        if i + 1 < chain_end:
+            targets.append(i + 1)
+        if i + 2 < chain_end and rng.random() < 0.3:
+            targets.append(rng.randrange(i + 2, chain_end))
+        if rng.random() < 0.5:
+            targets.append(rng.randrange(num_hubs))
+        return targets
+
+    # the first functions are the hubs, they don't call anything
+    functions = []
+    address = CODE_BASE
+    for i in range(num_functions):
+        file_index = i * len(files) // num_functions
+        name, display_name = function_name(rng, i, files[file_index].endswith(".cpp"))
+        f = {
+            "name": name,
+            "display_name": display_name,
+            "address": address,
+            "file": file_index,
+            "line": 10 + 8 * (i % SYMBOLS_PER_FILE),
+            "calls": call_targets(i),
+            "indirect": rng.random() < 0.05,
+            "filler": rng.randint(1, max_instructions) + (i == grow),
+        }
+        # push, bl (wide), blx, mov, pop and the literal with the address blx calls
+        f["size"] = 2 + 4 * len(f["calls"]) + 6 * f["indirect"] + 2 * f["filler"] + 2
+        functions.append(f)
+        address += f["size"]
+
+    demangled = {}
+    with (
+        open(directory / "firmware.objdump", "w") as objdump,
+        open(directory / "firmware.nm", "w") as nm,
+    ):
+        su_lines = {}
+        for i, f in enumerate(functions):
+            path = SRC_ROOT + "/" + files[f["file"]]
+            lines = ["", "%08x <%s>:" % (f["address"], f["name"]), "%s:%d" % (path, f["line"])]
+            a = f["address"]
+            lines.append(instruction(a, "push", "{r4, r5, r6, lr}"))
+            a += 2
+            for target in f["calls"]:
+                callee = functions[target]
+                operands = "%x <%s>" % (callee["address"], callee["name"])
+                lines.append(instruction(a, "bl", operands, bl_code(a, callee["address"])))
+                a += 4
+            if f["indirect"]:
+                lines.append(instruction(a, "blx", "r3"))
+                a += 2
+            for _ in range(f["filler"]):
+                lines.append(instruction(a, "mov", "r0, sp"))
+                a += 2
+            lines.append(instruction(a, "pop", "{r4, r5, r6, pc}"))
+            if f["indirect"]:
+                # a Thumb function pointer to the next function
+                target = functions[min(i + 1, num_functions - 1)]["address"] | 1
+                a += 2
+                lines.append(instruction(a, ".word", "0x%08x" % target, "%08x " % target))
+            objdump.write("\n".join(lines) + "\n")
+
+            nm.write(
+                "%08x %08x T %s\t%s:%d\n" % (f["address"], f["size"], f["name"], path, f["line"])
+            )
+            if f["name"] != f["display_name"]:
+                demangled[f["name"]] = f["display_name"]
+
+            su_name = f["display_name"]
+            if f["name"] != su_name:
+                su_name = "void " + su_name
+            qualifier = "dynamic" if rng.random() < 0.02 else "static"
+            su_lines.setdefault(f["file"], []).append(
+                "%s:%d:6:%s\t%d\t%s\n"
+                % (
+                    pathlib.PurePosixPath(files[f["file"]]).name,
+                    f["line"],
+                    su_name,
+                    8 * rng.randint(0, 32),
+                    qualifier,
+                )
+            )
+
+        address = DATA_BASE
+        for i in range(num_variables):
+            path = SRC_ROOT + "/" + files[i * len(files) // max(1, num_variables)]
+            size = 4 * rng.randint(1, 64)
+            name = "%s_state_%d" % (rng.choice(WORDS), i)
+            nm.write("%08x %08x B %s\t%s:%d\n" % (address, size, name, path, 5 + i % 5))
+            address += size
+
+    for file_index, lines in su_lines.items():
+        name = "%d_%s.su" % (file_index, pathlib.PurePosixPath(files[file_index]).stem)
+        with open(directory / "su" / name, "w") as f:
+            f.writelines(lines)
+
+    with open(directory / "firmware.demangled.json", "w") as f:
+        json.dump(demangled, f)
+    (directory / "firmware.elf").touch()
+
+    return {
+        "symbols": symbols,
+        "functions": num_functions,
+        "variables": num_variables,
+        "files": len(files),
+        "hubs": [f["name"] for f in functions[:num_hubs]],
+    }
+
+
+class SyntheticGccTools(GCCTools):
+    """ARM toolchain that reads the output of generate() instead of running binutils."""
+
+    def __init__(self, directory):
+        GCCTools.__init__(self, "synthetic-arm-none-eabi-")
+        self.directory = pathlib.Path(directory)
+        with open(self.directory / "firmware.demangled.json") as f:
+            self.demangled = json.load(f)
+
+    def lines(self, suffix):
+        with open(self.directory / ("firmware" + suffix)) as f:
+            return f.readlines()
+
+    def get_assembly_lines(self, elf_file):
+        return self.lines(".objdump")
+
+    def get_size_lines(self, elf_file):
+        return self.lines(".nm")
+
+    def get_function_assembly_lines(self, elf_file, start, stop):
+        # functions are separated by empty lines and don't overlap
+        result = []
+        for line in self.lines(".objdump"):
+            if result:
+                if not line.strip():
+                    break
+                result.append(line)
+            elif line.startswith("%08x <" % start):
+                result.append(line)
+        return result
+
+    def get_unmangled_names(self, symbol_names, chunk_size=1000):
+        return {name: self.demangled.get(name, name) for name in symbol_names}
+
+
+def create_builder(directory):
+    collector = Collector(SyntheticGccTools(directory))
+    return ElfBuilder(
+        collector,
+        SRC_ROOT,
+        os.path.join(directory, "firmware.elf"),
+        os.path.join(directory, "su"),
+    )
+
+
+def sample_pages(collector, hub):
+    """A representative request for each kind of page, as (method, path, form data)."""
+    hub = collector.symbol(hub, qualified=False)
+    deepest_folder = max(
+        (e for e in collector.file_elements.values() if e["type"] == "folder"),
+        key=lambda e: len(e["path"].parts),
+    )
+    some_file = next(e for e in collector.file_elements.values() if e["type"] == "file")
+    snippet = "\n".join(f["name"] for f in collector.all_functions()[:50])
+    return {
+        "overview": ("GET", "/", None),
+        "all": ("GET", "/all/", None),
+        "folder": ("GET", "/path/%s/" % deepest_folder["path"].as_posix(), None),
+        "file": ("GET", "/path/%s/" % some_file["path"].as_posix(), None),
+        "symbol": ("GET", "/path/%s/" % collector.qualified_symbol_name(hub), None),
+        "rack": ("POST", "/rack/", {"snippet": snippet}),
+    }
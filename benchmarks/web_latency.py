@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Measures the latency of the web UI with concurrent users against a fixed synthetic snapshot.
+
+The snapshot is generated and analysed once (see synthetic.py), then a number of clients
+request the overview, all symbols, a deep folder, a file, a symbol and the rack (POST)
+round robin for a fixed duration. Requests either go through Werkzeug's test client in
+this process (--mode client, measures the renderers only) or over HTTP to a threaded
+server on a local socket (--mode socket, includes the server).
+
+    python benchmarks/web_latency.py --symbols 10000 --clients 1 4 16 --output latency.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import synthetic
+from flask import Flask
+from serve_concurrency import percentile
+from werkzeug.serving import make_server
+from werkzeug.test import Client
+
+from puncover import renderers
+
+
+def create_app(collector, stream=False):
+    app = Flask("puncover.puncover")
+    renderers.register_jinja_filters(app.jinja_env)
+    renderers.register_urls(app, collector, stream=stream)
+    return app
+
+
+def in_process_requester(app):
+    client = Client(app)
+
+    def request(method, path, data):
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+    return request
+
+
+def socket_requester(host, port):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(method, path, data):
+        body = urlencode(data) if data else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if data else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    return request
+
+
+def run_client(new_requester, pages, deadline, latencies, errors):
+    request = new_requester()
+    names = list(pages)
+    i = 0
+    while time.perf_counter() < deadline:
+        name = names[i % len(names)]
+        i += 1
+        method, path, data = pages[name]
+        start = time.perf_counter()
+        try:
+            status = request(method, path, data)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(e)
+            request = new_requester()
+            continue
+        if status != 200:
+            errors.append(status)
+        latencies.append((name, time.perf_counter() - start))
+
+
+def run(new_requester, pages, clients, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=run_client, args=(new_requester, pages, deadline, latencies, errors)
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    def stats(values):
+        return {
+            "requests": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+
+    result = stats([latency for _, latency in latencies])
+    result.update({
+        "clients": clients,
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+    })
+    result["pages"] = {
+        name: stats([latency for n, latency in latencies if n == name]) for name in pages
+    }
+    return result
+
+
+def print_result(r):
+    print(
+        "\n%d clients: %d requests, %d errors, %.1f req/s"
+        % (r["clients"], r["requests"], r["errors"], r["throughput"])
+    )
+    print("  %-10s %8s %9s %9s %9s" % ("page", "requests", "p50 ms", "p95 ms", "p99 ms"))
+    for name, s in list(r["pages"].items()) + [("total", r)]:
+        print(
+            "  %-10s %8d %9.1f %9.1f %9.1f"
+            % (name, s["requests"], s["p50"] * 1000, s["p95"] * 1000, s["p99"] * 1000)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10000, help="size of the snapshot")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=["client", "socket"], default="client")
+    parser.add_argument("--stream", action="store_true", help="stream large pages")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per client count")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = synthetic.generate(directory, args.symbols, seed=args.seed)
+        builder = synthetic.create_builder(directory)
+        builder.collector.stages.listeners = []
+        builder.build()
+    collector = builder.collector
+    app = create_app(collector, stream=args.stream)
+    pages = synthetic.sample_pages(collector, corpus["hubs"][0])
+
+    server = None
+    if args.mode == "socket":
+        # don't log every request
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def new_requester():
+            return socket_requester("127.0.0.1", server.server_port)
+
+    else:
+
+        def new_requester():
+            return in_process_requester(app)
+
+    results = {
+        "python": sys.version.split()[0],
+        "symbols": args.symbols,
+        "seed": args.seed,
+        "mode": args.mode,
+        "stream": args.stream,
+        "paths": {name: path for name, (_, path, _) in pages.items()},
+        "runs": [],
+    }
+    try:
+        for clients in args.clients:
+            result = run(new_requester, pages, clients, args.duration)
+            results["runs"].append(result)
+            print_result(result)
+    finally:
+        if server:
+            server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Analyzes the builds of a manifest in worker processes and reports them under their tags,
+see --report-manifest.
+
+A manifest is a JSON list with an entry per build, e.g. of a build matrix:
+
+    [
+        {"elf_file": "board_a/debug/app.elf", "su_dir": "board_a/debug", "tag": "a-debug"},
+        {"elf_file": "board_a/release/app.elf", "tag": "a-release", "src_root": "src"}
+    ]
+
+Relative paths are relative to the manifest. The builds of a matrix mostly share their
+symbols and sources, so each worker keeps the demangled names and resolved source paths of
+the builds it analyzed for the following ones. The reports come back in the order of the
+manifest and are written together: a report file is rewritten once for all builds, and the
+index of --report-shards is updated once.
+"""
+
+import json
+import multiprocessing
+import os
+
+from puncover import history, parallel, report
+from puncover.builders import ElfBuilder
+from puncover.collector import Collector
+
+MANIFEST_PATHS = ["elf_file", "su_dir", "src_root"]
+
+# (gcc_tools, stack_functions, report_type, caches) of a worker, see init_worker()
+_worker = None
+
+
+def read_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        builds = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    tags = set()
+    for build in builds:
+        for key in ["elf_file", "tag"]:
+            if key not in build:
+                raise Exception("Build %s of %s has no %s" % (build, path, key))
+        if build["tag"] in tags:
+            raise Exception("Tag %s appears more than once in %s" % (build["tag"], path))
+        tags.add(build["tag"])
+        for key in MANIFEST_PATHS:
+            if build.get(key):
+                build[key] = os.path.join(base, build[key])
+    return builds
+
+
+def init_worker(gcc_tools, stack_functions, report_type):
+    global _worker
+    _worker = (gcc_tools, stack_functions, report_type, ({}, {}))
+
+
+def analyze_build(build):
+    """The report entry of one build of the manifest, with lists instead of Streams."""
+    gcc_tools, stack_functions, report_type, (demangled_names, resolved_paths) = _worker
+    collector = Collector(gcc_tools)
+    collector.stages.listeners = []
+    collector.demangled_names = demangled_names
+    collector.resolved_paths = resolved_paths
+    builder = ElfBuilder(
+        collector, build.get("src_root", None), build["elf_file"], build.get("su_dir", None)
+    )
+    try:
+        builder.build()
+        entry = report.tag_entry(collector, stack_functions, report_type)
+        for key in ["functions", "variables"]:
+            entry[key] = list(entry[key])
+    except Exception as e:
+        raise Exception("Analyzing %s failed: %s" % (build["tag"], e))
+    finally:
+        # frees the snapshot before the worker continues with the next build
+        builder.reset_collector()
+    return entry
+
+
+def analyze_builds(builds, gcc_tools, stack_functions=None, report_type="json", jobs=1):
+    """Yields (tag, report entry) of each build in the order of builds."""
+    global _worker
+    if jobs <= 1 or len(builds) <= 1:
+        try:
+            init_worker(gcc_tools, stack_functions, report_type)
+            for build in builds:
+                yield build["tag"], analyze_build(build)
+        finally:
+            _worker = None
+        return
+
+    # the workers of a pool can't start processes of their own, see puncover.parallel
+    context = multiprocessing.get_context("fork" if parallel.can_fork() else None)
+    with context.Pool(
+        min(jobs, len(builds)), init_worker, (gcc_tools, stack_functions, report_type)
+    ) as pool:
+        yield from zip((b["tag"] for b in builds), pool.imap(analyze_build, builds))
+
+
+def generate_reports(
+    entries,
+    filename=None,
+    shards=False,
+    compress=False,
+    history_path=None,
+):
+    """
+    Writes (tag, report entry) of entries as they arrive into the report at filename, see
+    report.generate_report(), and the history database at history_path.
+    """
+    db = history.open_history(history_path) if history_path else None
+
+    def written():
+        for tag, entry in entries:
+            for key in ["functions", "variables"]:
+                entry[key] = report.Stream(entry[key])
+            if db:
+                history.add_tag(db, tag, entry)
+            print("analyzed %s" % tag)
+            yield tag, entry
+
+    try:
+        if filename is None:
+            for _ in written():
+                pass
+        elif shards:
+            report.write_shards(filename, written(), compress)
+        else:
+            report.write_single_file(filename + ".json", dict(written()))
+    finally:
+        if db:
+            db.close()
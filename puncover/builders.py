@@ -1,36 +1,310 @@
 import abc
+import copy
+import gc
+import multiprocessing
 import os
 import pathlib
+import threading
+from contextlib import contextmanager
 from os.path import dirname
 
+from puncover import parallel
 from puncover.backtrace_helper import BacktraceHelper
+from puncover.collector import Collector
+from puncover.stages import StageSender
+
+
+class SnapshotLock:
+    """
+    Readers-writer lock for the collector's data. Requests hold it shared while they render,
+    a rebuild holds it exclusively. Streamed responses only hold it until they have pinned
+    their snapshot, see Builder.pin_snapshot(). Waiting writers take precedence over new
+    readers.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class Snapshot:
+    """The collector of a published snapshot and the responses that still read it."""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.pins = 0
+        # replaced by a rebuild, torn down once the last pin is gone
+        self.retired = False
 
 
 class Builder:
+    # pause the cyclic garbage collector while building and freeze the snapshot afterwards
+    pause_gc = True
+    # also for the analysis behind --quick-start, see analyze_in_background()
+    pause_gc_in_background = False
+    # publish a snapshot of the symbol table first and analyze everything in the background
+    quick_start = False
+    # keep the assembly in a memory-mapped temporary file instead of Python strings
+    spill_assembly = False
+    # reuse the analysis of functions whose assembly didn't change since the last build
+    incremental_analysis = False
+    # worker processes for the assembly analysis, see puncover.parallel
+    jobs = 1
+    # analyze into this SQLite file and serve from there, needs a StoreCollector
+    store_path = None
+
     def __init__(self, collector, src_root):
         self.files = {}
         self.collector = collector
         self.backtrace_helper = BacktraceHelper(collector)
         self.src_root = pathlib.Path(src_root)
+        self.lock = SnapshotLock()
+        # counts the builds, so that background analyses notice they've been superseded
+        self.generation = 0
+        self.background_analysis = None
+        # the current snapshot once a response pinned it, see pin_snapshot()
+        self.snapshot = None
+        self.pins_lock = threading.Lock()
 
     def store_file_time(self, path, store_empty=False):
         self.files[path] = 0 if store_empty else os.path.getmtime(path)
 
     def build(self):
-        for f in self.files.keys():
-            self.store_file_time(f)
-        self.collector.reset()
-        self.collector.parse_elf(self.get_elf_path())
-        self.collector.enhance(self.src_root)
-        self.collector.parse_su_dir(self.get_su_dir())
-        self.build_call_trees()
+        self.generation += 1
+        with self.paused_gc(), self.collector.stages.build():
+            for f in self.files.keys():
+                self.store_file_time(f)
+            self.reset_collector()
+            if self.store_path:
+                self.build_store()
+            else:
+                self.analyze(self.collector, quick=self.quick_start)
+        if self.quick_start:
+            self.background_analysis = self.analyze_in_background()
+
+    def analyze(self, collector, quick=False):
+        stages = collector.stages
+        if quick:
+            # sizes, files and folders are enough for the first pages
+            with stages.stage("parse_symbols"):
+                collector.parse_elf_symbols(self.get_elf_path())
+        else:
+            if self.incremental_analysis and collector.analysis_cache is None:
+                collector.analysis_cache = {}
+            if self.spill_assembly:
+                collector.spill_assembly()
+            collector.jobs = self.jobs
+            with stages.stage("parse_elf"):
+                collector.parse_elf(self.get_elf_path())
+        collector.enhance(self.src_root)
+        if not quick:
+            with stages.stage("su"):
+                collector.parse_su_dir(self.get_su_dir())
+        # trivial for quick snapshots without calls, but pages expect them
+        with stages.stage("call_trees"):
+            self.build_call_trees(collector)
+
+    def build_store(self):
+        """
+        Analyzes the ELF file into a new store file and opens it, see puncover.store.
+        The analysis runs in a child process, so that this one never holds the complete
+        snapshot in memory. The child does, until it has written the file: the peak memory
+        of a build is that of a build without a store. Where forking isn't safe, e.g. for
+        the rebuilds of the interactive server, the analysis runs in this process and is
+        freed once the file has been written.
+        """
+        staging_path = "%s.new" % self.store_path
+        if parallel.can_fork():
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.get_context("fork").Process(
+                target=self.write_store, args=(staging_path, sender), name="puncover-analysis"
+            )
+            process.start()
+            sender.close()
+            self.collector.stages.relay(receiver)
+            process.join()
+            if process.exitcode != 0:
+                raise Exception("Analyzing into %s failed, see the error above" % staging_path)
+        else:
+            self.write_store(staging_path)
+        os.replace(staging_path, self.store_path)
+        self.collector.open(self.store_path)
+
+    def write_store(self, path, connection=None):
+        # only --store needs sqlite3, keep it out of the start of puncover-report
+        from puncover import store
+
+        staging = Collector(self.collector.gcc_tools)
+        if connection:
+            staging.stages.listeners = [StageSender(connection)]
+        else:
+            staging.stages.listeners = self.collector.stages.listeners
+        self.analyze(staging)
+        with staging.stages.stage("store", "writing %s" % path):
+            store.write_store(staging, path, meta={"elf_file": str(self.get_elf_path())})
+        staging.teardown()
+
+    def analyze_in_background(self):
+        """
+        Analyzes the ELF file completely in a background thread and replaces the quick
+        snapshot once that's done. Requests keep reading the quick snapshot meanwhile.
+        """
+        generation = self.generation
+        # The garbage collector can only be paused for the whole process, i.e. also while
+        # request threads keep serving the quick snapshot, so this is off by default.
+        pause_gc = self.pause_gc and self.pause_gc_in_background
+
+        def run():
+            staging = Collector(self.collector.gcc_tools)
+            staging.stages.listeners = self.collector.stages.listeners
+            staging.analysis_cache = self.collector.analysis_cache
+            adopted = False
+            try:
+                with self.paused_gc(pause_gc), staging.stages.build():
+                    self.analyze(staging)
+                    with self.lock.write():
+                        # a newer quick snapshot will bring its own background analysis
+                        if generation == self.generation:
+                            self.reset_collector()
+                            self.collector.adopt(staging)
+                            adopted = True
+            except Exception as e:
+                print("analyzing in the background failed: {}".format(e))
+            finally:
+                if not adopted:
+                    # frees the superseded or broken snapshot and closes its spill file
+                    staging.teardown()
+
+        thread = threading.Thread(target=run, name="puncover-analysis", daemon=True)
+        thread.start()
+        return thread
+
+    @contextmanager
+    def paused_gc(self, pause=None):
+        # The snapshot is a large graph of reference cycles that lives until the next build.
+        # Collections would only scan it over and over, during the build and afterwards.
+        if not (self.pause_gc if pause is None else pause):
+            yield
+            return
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            yield
+        finally:
+            gc.freeze()
+            if enabled:
+                gc.enable()
+
+    def pin_snapshot(self):
+        """
+        Returns the current snapshot, which stays intact until unpin_snapshot() even if a
+        rebuild replaces it meanwhile. Call it while holding the lock shared.
+        """
+        with self.pins_lock:
+            if self.snapshot is None:
+                # rebuilds give self.collector new containers instead of clearing the old ones
+                self.snapshot = Snapshot(copy.copy(self.collector))
+            self.snapshot.pins += 1
+            return self.snapshot
+
+    def unpin_snapshot(self, snapshot):
+        with self.pins_lock:
+            snapshot.pins -= 1
+            teardown = snapshot.retired and not snapshot.pins
+        if teardown:
+            snapshot.collector.teardown()
+
+    def reset_collector(self):
+        with self.pins_lock:
+            snapshot, self.snapshot = self.snapshot, None
+            if snapshot:
+                snapshot.retired = True
+        if snapshot and snapshot.pins:
+            # a streamed response still reads it, the last one tears it down
+            self.collector.detach()
+            return
+        if not self.pause_gc:
+            self.collector.reset()
+            return
+        # the old snapshot is frozen and would never be collected, free it right away
+        self.collector.teardown()
+        gc.unfreeze()
+        # cheap now that the old snapshot is gone, catches anything left of it
+        gc.collect()
 
     def needs_build(self):
         return any([os.path.getmtime(f) > t for f, t in self.files.items()])
 
     def build_if_needed(self):
         if self.needs_build():
-            self.build()
+            with self.lock.write():
+                # a concurrent request might have rebuilt while we were waiting for the lock
+                if self.needs_build():
+                    self.build()
+
+    def watch(self, interval=1.0, stop=None):
+        """Rebuilds in a background thread whenever the inputs change, until stop is set."""
+        stop = stop or threading.Event()
+
+        def run():
+            last_error = None
+            while not stop.wait(interval):
+                try:
+                    self.build_if_needed()
+                    last_error = None
+                except Exception as e:
+                    # e.g. the ELF file is missing while it's being relinked, this repeats
+                    # every interval until the inputs change, so only report it once
+                    if str(e) != last_error:
+                        print("rebuilding failed: {}".format(e))
+                    last_error = str(e)
+
+        thread = threading.Thread(target=run, name="puncover-watcher", daemon=True)
+        thread.start()
+        return thread
 
     @abc.abstractmethod
     def get_elf_path(self):
@@ -40,8 +314,8 @@ class Builder:
     def get_su_dir(self):
         pass
 
-    def build_call_trees(self):
-        for f in self.collector.all_functions():
+    def build_call_trees(self, collector):
+        for f in collector.stages.track(collector.all_functions()):
             self.backtrace_helper.deepest_callee_tree(f)
             self.backtrace_helper.deepest_caller_tree(f)
 
@@ -1,9 +1,15 @@
 import fnmatch
+import hashlib
+import itertools
 import os
 import pathlib
 import re
 import sys
 
+from puncover import parallel
+from puncover.spill import SpilledLines, SpillFile
+from puncover.stages import Stages
+
 NAME = "name"
 DISPLAY_NAME = "display_name"
 SIZE = "size"
@@ -43,6 +49,10 @@ UNBOUND_STACKSIZE_IN_CALL_TREE = "unbound_stacksize_in_call_tree"
 
 DEEPEST_CALLEE_TREE = "deepest_callee_tree"
 DEEPEST_CALLER_TREE = "deepest_caller_tree"
+# precomputed sums over the symbols of a file or folder, see puncover.store
+CODE_SIZE_TOTAL = "code_size_total"
+VAR_SIZE_TOTAL = "var_size_total"
+STACK_SIZE_TOTAL = "stack_size_total"
 
 PYTHON_VER = {"major": sys.version_info[0], "minor": sys.version_info[1]}
 SUPPORTED_REPORT_TYPES = ["json"]
@@ -57,14 +67,64 @@ def left_strip_from_list(lines):
         return lines
 
     # detect longest common sequence of white spaces
-    longest_match = re.match(r"^\s*", lines[0]).group(0)
-
-    for line in lines:
-        while not line.startswith(longest_match):
-            longest_match = longest_match[:-1]
+    common_prefix = os.path.commonprefix(lines)
+    indent = len(common_prefix) - len(common_prefix.lstrip())
 
     # remove from each string
-    return list([line[len(longest_match) :] for line in lines])
+    return list([line[indent:] for line in lines])
+
+
+def none_sum(values):
+    filtered_values = [a for a in values if a is not None]
+    if filtered_values:
+        return sum(filtered_values)
+    else:
+        return None
+
+
+def symbol_traverse(s, func, total=None):
+    # lists, or rows of a StoreCollector
+    if not isinstance(s, dict):
+        return none_sum([symbol_traverse(i, func, total) for i in s])
+
+    if TYPE in s:
+        if s[TYPE] in [TYPE_FILE, TYPE_FOLDER] and total in s:
+            # precomputed by puncover.store
+            return s[total]
+        if s[TYPE] == TYPE_FILE:
+            return none_sum([symbol_traverse(s, func, total) for s in s[SYMBOLS]])
+        if s[TYPE] == FOLDER:
+            return none_sum([
+                symbol_traverse(s, func, total) for s in itertools.chain(s[SUB_FOLDERS], s[FILES])
+            ])
+
+    return func(s)
+
+
+def code_size(s):
+    if s.get(TYPE, None) == TYPE_FUNCTION:
+        return s.get(SIZE, None)
+    return 0
+
+
+def var_size(s):
+    if s.get(TYPE, None) == TYPE_VARIABLE:
+        return s.get(SIZE, None)
+    return 0
+
+
+def stack_size(s):
+    if s.get(TYPE, None) == TYPE_FUNCTION:
+        return s.get(STACK_SIZE, None)
+    return None
+
+
+# what symbol_traverse() sums up, by the key of the precomputed total
+TOTALS = {
+    CODE_SIZE_TOTAL: code_size,
+    VAR_SIZE_TOTAL: var_size,
+    STACK_SIZE_TOTAL: stack_size,
+}
 
 
 class StubGccTool:
@@ -81,6 +141,7 @@ class StubGccTool:
     )
 
     indirect_call_pattern = None
+    indirect_call_hint = None
 
 
 class Collector:
@@ -94,13 +155,70 @@ class Collector:
         self.file_elements = {}
         self.symbols_by_qualified_name = None
         self.symbols_by_name = None
+        # only set while parse_su_dir() runs
+        self.symbols_by_base_file = None
         self.user_defined_stack_report = None
+        # derived values (e.g. rendered HTML) that stay valid until the next reset()
+        self.cache = {}
+        self.stages = Stages()
+        # set by parse_elf_symbols(), see assembly_lines()
+        self.elf_file = None
+        self.disassemble_on_demand = False
+        # set by spill_assembly()
+        self.spill_file = None
+        # results of analyze_symbol_assembly() by content, kept across builds if not None
+        self.analysis_cache = None
+        # processes analyze_assembly() shards the symbols over, see puncover.parallel
+        self.jobs = 1
+        # demangled names and resolved source paths, shared with other builds if not None
+        self.demangled_names = None
+        self.resolved_paths = None
 
     def reset(self):
         self.symbols = {}
         self.file_elements = {}
         self.symbols_by_qualified_name = None
         self.symbols_by_name = None
+        self.cache = {}
+        self.elf_file = None
+        self.disassemble_on_demand = False
+        if self.spill_file:
+            self.spill_file.close()
+            self.spill_file = None
+
+    def detach(self):
+        """
+        Like reset(), but leaves the old snapshot intact (including its spill file) for a copy
+        of this collector that still reads it and tears it down later.
+        """
+        self.spill_file = None
+        self.reset()
+
+    def adopt(self, other):
+        """Takes over the snapshot of another collector, e.g. one analyzed in the background."""
+        self.symbols = other.symbols
+        self.file_elements = other.file_elements
+        self.symbols_by_qualified_name = other.symbols_by_qualified_name
+        self.symbols_by_name = other.symbols_by_name
+        self.cache = {}
+        self.elf_file = other.elf_file
+        self.elf_mtime = other.elf_mtime
+        self.disassemble_on_demand = other.disassemble_on_demand
+        self.spill_file = other.spill_file
+        self.analysis_cache = other.analysis_cache
+
+    def teardown(self):
+        """
+        Like reset(), but also breaks the reference cycles between symbols, files and folders
+        (callers, callees, siblings, ancestors, ...), so that the old snapshot is freed right
+        away instead of by a long pause of the cyclic garbage collector. The old symbols are
+        left empty.
+        """
+        for s in self.symbols.values():
+            s.clear()
+        for e in self.file_elements.values():
+            e.clear()
+        self.reset()
 
     def qualified_symbol_name(self, symbol):
         if BASE_FILE in symbol:
@@ -108,6 +226,13 @@ class Collector:
             return str(html_path)
         return symbol[NAME]
 
+    def cache_key(self, element):
+        """
+        Key of a symbol, file or folder in the cache and the object the cached value has to
+        keep alive, so that its id() cannot be reused by another object before the next reset().
+        """
+        return id(element), element
+
     def symbol(self, name, qualified=True):
         self.build_symbol_name_index()
         index = self.symbols_by_qualified_name if qualified else self.symbols_by_name
@@ -144,6 +269,8 @@ class Collector:
             sym[LINE] = line
         if assembly_lines:
             assembly_lines = left_strip_from_list(assembly_lines)
+            if self.spill_file:
+                assembly_lines = self.spill_file.append(assembly_lines)
 
             sym[ASM] = assembly_lines
             sym[TYPE] = TYPE_FUNCTION
@@ -226,8 +353,11 @@ class Collector:
                 return 1
             return 0
 
+        function_start = self.parse_assembly_text_function_start_pattern.match
+        c_reference = self.parse_assembly_text_c_reference_pattern.match
         for line in assembly.split("\n"):
-            match = self.parse_assembly_text_function_start_pattern.match(line)
+            # most lines are instructions, skip the patterns where they can't match
+            match = function_start(line) if ">:" in line else None
             if match:
                 found_symbols += flush_current_symbol()
                 addr = match.group(1)
@@ -236,7 +366,7 @@ class Collector:
                 symbol_line = None
                 assembly_lines = []
             else:
-                file_match = self.parse_assembly_text_c_reference_pattern.match(line)
+                file_match = c_reference(line) if line.startswith("/") else None
                 if not file_match and line.strip() != "":
                     assembly_lines.append(line)
                 elif file_match and not symbol_file:
@@ -338,14 +468,20 @@ class Collector:
         if a == b:
             return True
 
-        simplified_a = self.display_name_simplified(a)
-        simplified_b = self.display_name_simplified(b)
-        return simplified_a == simplified_b
+        # .su files compare each of their names with many symbols
+        simplified = self.cache.setdefault("display_name_simplified", {})
+        for name in (a, b):
+            if name not in simplified:
+                simplified[name] = self.display_name_simplified(name)
+        return simplified[a] == simplified[b]
 
     def add_stack_usage(self, base_file_name, line, symbol_name, stack_size, stack_qualifier):
-        basename_symbols = [
-            s for s in self.symbols.values() if s.get(BASE_FILE, None) == base_file_name
-        ]
+        if self.symbols_by_base_file is not None:
+            basename_symbols = self.symbols_by_base_file.get(base_file_name, [])
+        else:
+            basename_symbols = [
+                s for s in self.symbols.values() if s.get(BASE_FILE, None) == base_file_name
+            ]
         for symbol in basename_symbols:
             if symbol.get(LINE, None) == line or self.display_names_match(
                 symbol_name, symbol.get(DISPLAY_NAME, None)
@@ -369,26 +505,40 @@ class Collector:
 
     def normalize_files_paths(self, base_dir):
         base_dir = pathlib.Path(base_dir).absolute() if base_dir else pathlib.Path(".")
+        # most files contain many symbols
+        normalized = {}
         for s in self.all_symbols():
             path = s.get(PATH, None)
             if path:
-                str_path = str(path)
-                abs_win_path = self.windows_path_pattern.match(str_path)
-                if base_dir in path.parents:
-                    path = path.relative_to(base_dir)
-                # Remove root from path
-                elif str_path.startswith("/"):
-                    str_path = str_path[1:]
-                    path = pathlib.Path(str_path)
-                elif abs_win_path:
-                    str_path = abs_win_path.group(1) + "_" + abs_win_path.group(4)
-                    path = pathlib.Path(str_path)
-                s[PATH] = path
+                if path not in normalized:
+                    normalized[path] = self.normalize_file_path(path, base_dir)
+                s[PATH] = normalized[path]
+
+    def normalize_file_path(self, path, base_dir):
+        str_path = str(path)
+        abs_win_path = self.windows_path_pattern.match(str_path)
+        if base_dir in path.parents:
+            path = path.relative_to(base_dir)
+        # Remove root from path
+        elif str_path.startswith("/"):
+            str_path = str_path[1:]
+            path = pathlib.Path(str_path)
+        elif abs_win_path:
+            str_path = abs_win_path.group(1) + "_" + abs_win_path.group(4)
+            path = pathlib.Path(str_path)
+        return path
 
     def unmangle_cpp_names(self):
         symbol_names = list(symbol[NAME] for symbol in self.all_symbols())
 
-        unmangled_names = self.gcc_tools.get_unmangled_names(symbol_names)
+        if self.demangled_names is None:
+            unmangled_names = self.gcc_tools.get_unmangled_names(symbol_names)
+        else:
+            # only run c++filt for the names the other builds didn't have
+            unmangled_names = self.demangled_names
+            missing = list(dict.fromkeys(n for n in symbol_names if n not in unmangled_names))
+            if missing:
+                unmangled_names.update(self.gcc_tools.get_unmangled_names(missing))
 
         for s in self.all_symbols():
             s[DISPLAY_NAME] = unmangled_names[s[NAME]]
@@ -402,6 +552,65 @@ class Collector:
 
         self.elf_mtime = os.path.getmtime(elf_file)
 
+    def parse_elf_symbols(self, elf_file):
+        """
+        Reads only the symbol table, which is much faster than disassembling the whole ELF file.
+        Functions are disassembled when their assembly is needed, see assembly_lines().
+        """
+        print("parsing symbols of ELF at %s" % elf_file)
+
+        for line in self.gcc_tools.get_size_lines(elf_file):
+            self.parse_size_line(line)
+
+        self.elf_mtime = os.path.getmtime(elf_file)
+        self.elf_file = elf_file
+        self.disassemble_on_demand = True
+
+    def spill_assembly(self):
+        """
+        Keeps the assembly of symbols added from now on in a temporary file instead of lists
+        of strings, see puncover.spill. analyze_assembly() then decodes it one symbol at a
+        time, so the lines of all functions are never in memory at once.
+        """
+        self.spill_file = SpillFile()
+
+    def assembly_lines(self, symbol):
+        """
+        The assembly of a symbol. Snapshots made by parse_elf_symbols() disassemble each
+        function the first time it's needed and keep it until the next reset().
+        """
+        if ASM in symbol or not self.disassemble_on_demand:
+            return symbol.get(ASM, [])
+        if symbol.get(TYPE, None) != TYPE_FUNCTION or not symbol.get(SIZE):
+            return []
+
+        cache = self.cache.setdefault("assembly_lines", {})
+        start = int(symbol[ADDRESS], 16)
+        result = cache.get(start, None)
+        if result is None:
+            try:
+                changed = os.path.getmtime(self.elf_file) != self.elf_mtime
+            except OSError:
+                # e.g. removed while the linker writes a new one
+                changed = True
+            if changed:
+                # the ELF file doesn't match this snapshot anymore, wait for the rebuild
+                return []
+            text = "".join(
+                self.gcc_tools.get_function_assembly_lines(
+                    self.elf_file, start, start + symbol[SIZE]
+                )
+            )
+            # parse into a scratch collector, this snapshot may be read by other requests
+            scratch = Collector(self.gcc_tools)
+            scratch.parse_assembly_text(text)
+            result = list(scratch.symbols.get(start, {}).get(ASM, []))
+            # resolved against this snapshot, where the callees are known
+            references = self.analyze_symbol_lines(symbol, result)[2]
+            self.resolve_references(symbol, result, references)
+            cache[start] = result
+        return result
+
     def parse_su_dir(self, su_dir):
         def gen_find(filepat, top):
             for path, dirlist, filelist in os.walk(top):
@@ -425,8 +634,15 @@ class Collector:
 
         if su_dir:
             print("parsing stack usages starting at %s" % su_dir)
-            for line in get_stack_usage_lines(su_dir):
-                self.parse_stack_usage_line(line)
+            # instead of looking through all symbols for every line
+            self.symbols_by_base_file = {}
+            for s in self.symbols.values():
+                self.symbols_by_base_file.setdefault(s.get(BASE_FILE, None), []).append(s)
+            try:
+                for line in get_stack_usage_lines(su_dir):
+                    self.parse_stack_usage_line(line)
+            finally:
+                self.symbols_by_base_file = None
 
     def sorted_by_size(self, symbols):
         return sorted(symbols, key=lambda k: k.get("size", 0), reverse=True)
@@ -440,11 +656,6 @@ class Collector:
     def all_variables(self):
         return list([f for f in self.all_symbols() if f.get(TYPE, None) == TYPE_VARIABLE])
 
-    def enhance_assembly(self):
-        for key, symbol in self.symbols.items():
-            if ASM in symbol:
-                symbol[ASM] = list([self.enhanced_assembly_line(line) for line in symbol[ASM]])
-
     def add_function_call(self, caller, callee):
         if caller != callee:
             if callee not in caller[CALLEES]:
@@ -456,88 +667,234 @@ class Collector:
                 if callee_file and caller_file and callee_file != caller_file:
                     callee["called_from_other_file"] = True
 
-    def add_function_call_from_assembly_line(self, function, line):
-        if "<" not in line:
-            return False
-
-        match = self.gcc_tools.enhance_call_tree_pattern.match(line)
-
-        if match:
-            callee = self.symbol_by_addr(match.group(3))
-            if callee:
-                self.add_function_call(function, callee)
-                return True
-
-        return False
-
-    def annotate_indirect_call(self, function, line):
-        if self.gcc_tools.indirect_call_pattern is None:
-            return False
-
-        match = self.gcc_tools.indirect_call_pattern.match(line)
-        if match:
-            function[PERFORMS_INDIRECT_CALL] = True
-            return True
-
-        return False
-
-    def enhance_call_tree_from_assembly_line(self, function, line):
-        self.add_function_call_from_assembly_line(function, line)
-        self.annotate_indirect_call(function, line)
-
-    def enhance_call_tree(self):
-        for f in self.all_functions():
-            for k in [CALLERS, CALLEES]:
-                f[k] = f.get(k, [])
-
-        for f in self.all_functions():
-            if ASM in f:
-                [self.enhance_call_tree_from_assembly_line(f, line) for line in f[ASM]]
-
     def enhance(self, src_root):
-        self.normalize_files_paths(src_root)
-        print("enhancing function sizes")
-        self.enhance_function_size_from_assembly()
-        print("deriving folders")
-        self.derive_folders()
-        print("enhancing file elements")
-        self.enhance_file_elements()
-        print("enhancing assembly")
-        self.enhance_assembly()
-        print("enhancing call tree")
-        self.enhance_call_tree()
-        print("enhancing siblings")
-        self.enhance_sibling_symbols()
-        self.enhance_symbol_flags()
-        print("unmangling c++ symbols")
-        self.unmangle_cpp_names()
+        stages = self.stages
+        with stages.stage("normalize"):
+            self.normalize_files_paths(src_root)
+        with stages.stage("folders", "deriving folders"):
+            self.derive_folders()
+        with stages.stage("file_elements", "enhancing file elements"):
+            self.enhance_file_elements()
+        if self.disassemble_on_demand:
+            # no call tree without the assembly
+            for f in self.all_functions():
+                for k in [CALLERS, CALLEES]:
+                    f[k] = f.get(k, [])
+        else:
+            with stages.stage("assembly", "analyzing assembly"):
+                self.analyze_assembly()
+        with stages.stage("siblings", "enhancing siblings"):
+            self.enhance_sibling_symbols()
+        with stages.stage("flags"):
+            self.enhance_symbol_flags()
+        with stages.stage("unmangle", "unmangling c++ symbols"):
+            self.unmangle_cpp_names()
 
     #   98: a8a8a8a8  bl 98
     enhanced_assembly_line_pattern = re.compile(
         r"^\s*[\da-f]+:\s+[\d\sa-f]{9}\s+bl\s+([\d\sa-f]+)\s*$"
     )
 
-    def enhanced_assembly_line(self, line):
-        match = self.enhanced_assembly_line_pattern.match(line)
-        if match:
-            symbol = self.symbol_by_addr(match.group(1))
-            if symbol:
-                return line + " <%s>" % (symbol["name"])
-        return line
-
     # 88a:	ebad 0d03 	sub.w	sp, sp, r3
     count_assembly_code_bytes_re = re.compile(r"^\s*[\da-f]+:\s+([\d\sa-f]{9})")
 
-    def count_assembly_code_bytes(self, line):
-        match = self.count_assembly_code_bytes_re.match(line)
-        if match:
-            return len(match.group(1).replace(" ", "")) // 2
-        return 0
+    def analyze_assembly(self):
+        """
+        Sets the sizes of all symbols with assembly, resolves the names of bl targets, flags
+        indirect calls and derives the call graph, with a single pass over each assembly.
+        """
+        parsed = self.spill_file
+        if parsed:
+            # the analysis changes lines, its results go to a new file
+            parsed.seal()
+            self.spill_file = SpillFile()
+
+        # only keep what this build used, so the cache doesn't grow with every build
+        known = self.analysis_cache
+        if known is not None:
+            self.analysis_cache = {}
+
+        symbols = [s for s in self.symbols.values() if ASM in s]
+        if self.jobs > 1 and len(symbols) > parallel.CHUNK_SIZE and parallel.can_fork():
+            analyzed = parallel.analyze_contents(self, symbols, known, self.jobs)
+        else:
+            analyzed = itertools.repeat(None)
+
+        calls = {}
+        for symbol, content in zip(self.stages.track(symbols), analyzed):
+            calls[id(symbol)] = self.analyze_symbol_assembly(symbol, known, content)
+
+        if parsed:
+            self.spill_file.seal()
+            parsed.close()
 
-    def enhance_function_size_from_assembly(self):
-        for f in self.all_symbols():
-            if ASM in f:
-                f[SIZE] = sum([self.count_assembly_code_bytes(line) for line in f[ASM]])
+        functions = self.all_functions()
+        for f in functions:
+            for k in [CALLERS, CALLEES]:
+                f[k] = []
+
+        # biggest function first. Each call is added once to lists that started out empty,
+        # add_function_call() would compare it with all calls added before.
+        for f in functions:
+            caller_file = f.get(FILE, None)
+            for address in dict.fromkeys(calls.get(id(f), ())):
+                callee = self.symbols[address]
+                if callee is f:
+                    continue
+                f[CALLEES].append(callee)
+                callee[CALLERS].append(f)
+                callee_file = callee.get(FILE, None)
+                if callee_file and caller_file and callee_file is not caller_file:
+                    callee["called_from_other_file"] = True
+
+    def assembly_content_key(self, symbol, lines):
+        """
+        Identifies the assembly of a symbol regardless of where it's located, so the results
+        of analyze_symbol_assembly() can be reused when it only moved between builds.
+
+        Drops the address of each instruction and the addresses it refers to, e.g. "  98:"
+        and "cc" in "  98:\tf000 f818 \tbl\tcc <callee>" or in "  98:\tf000 f818 \tbl\tcc".
+        Of the instruction bytes only their number is kept, as the encoding of branches and
+        of literals such as ".word 0x08000125" changes whenever code moves. Other operands
+        may lose trailing digits, too, which doesn't change the results: they only depend on
+        the sizes, the mnemonics and which lines refer to other symbols.
+        Plain string methods are several times faster than regular expressions.
+        """
+        hex_digits = "0123456789abcdef"
+        parts = []
+        for line in lines:
+            _, separator, instruction = line.partition(":\t")
+            if not separator:
+                parts.append(line)
+                continue
+            code, _, text = instruction.partition("\t")
+            parts.append("%d\t%s" % (len(code) - code.count(" "), text.rstrip(hex_digits)))
+        text = "<".join(part.rstrip(hex_digits) for part in "\n".join(parts).split(" <"))
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return symbol.get(TYPE, None) == TYPE_FUNCTION, digest
+
+    def decoded_assembly(self, symbol):
+        lines = symbol[ASM]
+        return lines.lines() if isinstance(lines, SpilledLines) else lines
+
+    def analyze_symbol_assembly(self, symbol, known=None, content=None):
+        """
+        Sets the size, resolves the names of bl targets and flags indirect calls.
+        Returns the addresses of the symbols a function calls in the order of its assembly.
+        content is the result of analyze_symbol_content() if a worker process computed it.
+        """
+        spilled = isinstance(symbol[ASM], SpilledLines)
+        lines = None
+        if content is None:
+            lines = self.decoded_assembly(symbol)
+            content = self.analyze_symbol_content(symbol, lines, known)
+
+        key, result, (annotated, called) = content
+        if key is not None:
+            self.analysis_cache[key] = result
+
+        size, performs_indirect_call, references = result
+        symbol[SIZE] = size
+        if performs_indirect_call:
+            symbol[PERFORMS_INDIRECT_CALL] = True
+        if annotated or spilled:
+            if lines is None:
+                lines = self.decoded_assembly(symbol)
+            for i, line in annotated:
+                lines[i] = line
+            if spilled:
+                symbol[ASM] = self.spill_file.append(lines)
+        return called
+
+    def analyze_symbol_content(self, symbol, lines, known=None):
+        """
+        The cache key of the assembly (None without analysis_cache), the result of
+        analyze_symbol_lines() and of find_references(). Doesn't change the snapshot,
+        see puncover.parallel.
+
+        With analysis_cache enabled, the results of the previous build are looked up by
+        assembly_content_key() in known. Only the lines that refer to other symbols are then
+        analyzed again, as those symbols may have moved.
+        """
+        key = None
+        result = None
+        if self.analysis_cache is not None:
+            key = self.assembly_content_key(symbol, lines)
+            result = known.get(key, None) if known else None
+        if result is None:
+            result = self.analyze_symbol_lines(symbol, lines)
+        return key, result, self.find_references(symbol, lines, result[2])
+
+    def analyze_symbol_lines(self, symbol, lines):
+        """
+        Returns the size, whether there is an indirect call and the indexes of the lines
+        that may refer to other symbols, see resolve_references().
+        """
+        count_bytes = self.count_assembly_code_bytes_re.match
+        is_function = symbol.get(TYPE, None) == TYPE_FUNCTION
+        # the cheap substring checks below only skip lines the patterns can't match
+        indirect_call = self.gcc_tools.indirect_call_pattern if is_function else None
+        indirect_call_hint = getattr(self.gcc_tools, "indirect_call_hint", None)
+
+        size = 0
+        performs_indirect_call = False
+        references = []
+        for i, line in enumerate(lines):
+            match = count_bytes(line)
+            if match:
+                size += len(match.group(1).replace(" ", "")) // 2
+
+            if "<" in line or "bl" in line:
+                references.append(i)
+
+            if indirect_call is not None and (
+                indirect_call_hint is None or indirect_call_hint in line.lower()
+            ):
+                if indirect_call.match(line):
+                    performs_indirect_call = True
+                    # one is enough
+                    indirect_call = None
+
+        return size, performs_indirect_call, tuple(references)
+
+    def resolve_references(self, symbol, lines, references):
+        """
+        Appends the names of unresolved bl targets to their lines and returns the symbols a
+        function calls, looking only at the lines with the given indexes.
+        """
+        annotated, called = self.find_references(symbol, lines, references)
+        for i, line in annotated:
+            lines[i] = line
+        return [self.symbols[address] for address in called]
+
+    def find_references(self, symbol, lines, references):
+        """
+        The lines with the names of their unresolved bl targets appended, as (index, line),
+        and the addresses of the symbols a function calls, looking only at the lines with the
+        given indexes. Leaves lines unchanged, see resolve_references().
+        """
+        unresolved_call = self.enhanced_assembly_line_pattern.match
+        call = self.gcc_tools.enhance_call_tree_pattern.match
+        is_function = symbol.get(TYPE, None) == TYPE_FUNCTION
+
+        annotated = []
+        called = []
+        for i in references:
+            line = lines[i]
+            if "<" not in line:
+                match = unresolved_call(line)
+                if match:
+                    callee = self.symbol_by_addr(match.group(1))
+                    if callee:
+                        line = line + " <%s>" % (callee["name"])
+                        annotated.append((i, line))
+            if is_function and "<" in line:
+                match = call(line)
+                if match:
+                    address = int(match.group(3), 16)
+                    if address in self.symbols:
+                        called.append(address)
+        return tuple(annotated), tuple(called)
 
     def enhance_sibling_symbols(self):
         for f in self.all_functions():
@@ -553,35 +910,41 @@ class Collector:
                 n[PREV_FUNCTION] = f
 
     def derive_folders(self):
-        for s in self.all_symbols():
-            unknown_path = pathlib.Path("<unknown>/<unknown>")
+        unknown_path = pathlib.Path("<unknown>/<unknown>")
+        # resolving touches the file system, do it once per file instead of once per symbol
+        resolved = {} if self.resolved_paths is None else self.resolved_paths
+        resolved[unknown_path] = unknown_path
+        for s in self.stages.track(self.all_symbols()):
             p = s.get(PATH, unknown_path)
-            if p != unknown_path:
-                posix_root_path = str(p).startswith("\\")
-                windows_os = os.name == "nt"
-                # Detects if parsing posix paths in elf in a windows machine
-                win_parsing_posix = windows_os and posix_root_path
-                if not win_parsing_posix:
-                    resolved_path = p.resolve(strict=False)
-                else:
-                    resolved_path = p
-                if windows_os and PYTHON_VER["major"] == 3 and PYTHON_VER["minor"] < 10:
-                    pathlib_prepends_cwd = False
-                else:
-                    pathlib_prepends_cwd = True
-
-                if not p.is_absolute() and not win_parsing_posix and pathlib_prepends_cwd:
-                    # pathlib prepends cwd if it couldnt
-                    # resolve locally the file
-                    cwd = pathlib.Path().absolute()
-                    p = resolved_path.relative_to(cwd)
-                else:
-                    p = resolved_path
+            if p not in resolved:
+                resolved[p] = self.resolve_folder_path(p)
+            p = resolved[p]
             s[PATH] = p
             s[BASE_FILE] = p.name
             s[FILE] = self.file_for_path(p)
             s[FILE][SYMBOLS].append(s)
 
+    def resolve_folder_path(self, p):
+        posix_root_path = str(p).startswith("\\")
+        windows_os = os.name == "nt"
+        # Detects if parsing posix paths in elf in a windows machine
+        win_parsing_posix = windows_os and posix_root_path
+        if not win_parsing_posix:
+            resolved_path = p.resolve(strict=False)
+        else:
+            resolved_path = p
+        if windows_os and PYTHON_VER["major"] == 3 and PYTHON_VER["minor"] < 10:
+            pathlib_prepends_cwd = False
+        else:
+            pathlib_prepends_cwd = True
+
+        if not p.is_absolute() and not win_parsing_posix and pathlib_prepends_cwd:
+            # pathlib prepends cwd if it couldnt
+            # resolve locally the file
+            cwd = pathlib.Path().absolute()
+            return resolved_path.relative_to(cwd)
+        return resolved_path
+
     def file_element_for_path(self, path, type, default_values):
         if not path:
             return None
@@ -786,11 +1149,19 @@ class Collector:
         return report_max_map
 
     def prepare_report_for_json_export(self, export_json_data):
-        fn_symbols = []
-        var_symbols = []
+        export_json_data["functions"] = list(self.report_symbols(functions=True))
+        export_json_data["variables"] = list(self.report_symbols(functions=False))
+
+    def report_symbols(self, functions=True):
+        """
+        Yields the functions (or all other symbols) of the JSON report one at a time, without
+        their references to other symbols, see prepare_report_for_json_export().
+        """
         if not self.symbols_by_qualified_name:
             self.build_symbol_name_index()
         for full_path, sym in self.symbols_by_qualified_name.items():
+            if (sym["type"] == TYPE_FUNCTION) != functions:
+                continue
             # if we use the plain symbols there are circular references
             # and memory explodes into 10's of GB's serializing it so make
             # symbols non-circular before serializing them to the database
@@ -814,7 +1185,7 @@ class Collector:
                 elif sym_ele == "address":
                     non_circular_sym[sym_ele] = int(sym[sym_ele], 16)
                 elif sym_ele == "asm":
-                    non_circular_sym["disasm"] = sym[sym_ele]
+                    non_circular_sym["disasm"] = list(sym[sym_ele])
                 elif sym_ele == "display_name":
                     non_circular_sym["name"] = sym[sym_ele]
                 elif sym_ele == "file":
@@ -842,10 +1213,5 @@ class Collector:
                     pass
                 else:
                     print("unknown key " + sym_ele)
-            # add flatten symbol to list
-            symbols = fn_symbols if non_circular_sym["type"] == "function" else var_symbols
             non_circular_sym.pop("type")
-            symbols += [non_circular_sym]
-        # if file exist
-        export_json_data["functions"] = fn_symbols
-        export_json_data["variables"] = var_symbols
+            yield non_circular_sym
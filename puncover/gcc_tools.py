@@ -2,15 +2,46 @@ import itertools
 import os
 import re
 import subprocess
+from os.path import dirname
+from shutil import which
+
+OBJDUMP_PROFILES = ["full", "lean"]
+
+
+def get_arm_tools_prefix_path():
+    """
+    Try to find and return the arm tools triple prefix path, like this:
+      /usr/local/gcc-arm-none-eabi-9-2019-q4-major/bin/arm-none-eabi-
+
+    It's used to invoke the other tools, like objdump/nm.
+
+    Note that we could instead use the '-print-prog-name=...' option to gcc,
+    which returns the paths we need. For now stick with the hacky method here.
+    """
+    obj_dump = which("arm-none-eabi-objdump")
+    if not obj_dump:
+        return None
+
+    gcc_tools_base_dir = dirname(dirname(obj_dump))
+    assert gcc_tools_base_dir, "Unable to find gcc tools base dir from {}".format(obj_dump)
+
+    return os.path.join(gcc_tools_base_dir, "bin/arm-none-eabi-")
 
 
 class GCCTools:
-    def __init__(self, gcc_base_filename):
+    def __init__(
+        self, gcc_base_filename, objdump_profile="full", objdump_sections=None, line_numbers=True
+    ):
         # if base filename is a directory, make sure we have the trailing slash
         if os.path.isdir(gcc_base_filename):
             gcc_base_filename = os.path.join(gcc_base_filename, "")
 
         self.gcc_base_filename = gcc_base_filename
+        if objdump_profile not in OBJDUMP_PROFILES:
+            raise Exception("Unknown objdump profile %s" % objdump_profile)
+        self.objdump_profile = objdump_profile
+        self.objdump_sections = objdump_sections or []
+        self.line_numbers = line_numbers
 
         if "riscv" in gcc_base_filename:
             self.enhance_call_tree_pattern = re.compile(
@@ -20,6 +51,7 @@ class GCCTools:
 
             # TODO: i don't know how to detect indirect calls in riscv
             self.indirect_call_pattern = None
+            self.indirect_call_hint = None
         else:  # ARM
             #  934:	f7ff bba8 	b.w	88 <jump_to_pbl_function>
             # 8e4:	f000 f824 	bl	930 <app_log>
@@ -35,6 +67,8 @@ class GCCTools:
             self.indirect_call_pattern = re.compile(
                 r"^\s*([\da-f]+):\s+[\d\sa-f]{9}\s+BLX\s+(\w+)$", re.IGNORECASE
             )
+            # every line matched by indirect_call_pattern contains this once lower-cased
+            self.indirect_call_hint = "blx"
 
     def gcc_tool_path(self, name):
         path = self.gcc_base_filename + name
@@ -49,8 +83,27 @@ class GCCTools:
         proc = subprocess.Popen([self.gcc_tool_path(name)] + args, stdout=subprocess.PIPE, cwd=cwd)
         return [line.decode() for line in proc.stdout.readlines()]
 
+    def objdump_args(self):
+        """
+        "full" also dumps the contents of every section (-s), including data and debug
+        sections the collector skips. "lean" only disassembles, either the given sections or
+        all executable ones, and adds source file names and line numbers (-l) if wanted.
+        """
+        if self.objdump_profile == "full":
+            return ["-dslw"]
+        args = ["-dlw" if self.line_numbers else "-dw"]
+        return args + ["--section=%s" % s for s in self.objdump_sections]
+
     def get_assembly_lines(self, elf_file):
-        return self.gcc_tool_lines("objdump", ["-dslw", elf_file.name], elf_file.parents[0])
+        return self.gcc_tool_lines(
+            "objdump", self.objdump_args() + [elf_file.name], elf_file.parents[0]
+        )
+
+    def get_function_assembly_lines(self, elf_file, start, stop):
+        """Disassembles the addresses from start up to (excluding) stop."""
+        args = ["-dlw" if self.line_numbers else "-dw"]
+        args += ["--start-address=0x%x" % start, "--stop-address=0x%x" % stop]
+        return self.gcc_tool_lines("objdump", args + [elf_file.name], elf_file.parents[0])
 
     def get_size_lines(self, elf_file):
         # http://linux.die.net/man/1/nm
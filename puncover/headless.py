@@ -0,0 +1,235 @@
+"""
+Writes the reports of puncover without the website, see puncover-report.
+
+puncover-report takes the analysis and report arguments of puncover and behaves like
+puncover --non-interactive --generate-report. It only imports the modules it needs to
+analyze the ELF file and write the report, and those only once the arguments have been
+parsed, so that CI doesn't wait for Flask, the renderers, configargparse or a probe of the
+default port before the analysis starts:
+
+    puncover-report firmware.elf --build-dir build --report-tag $COMMIT --report-shards
+"""
+
+import argparse
+import os
+
+from puncover.gcc_tools import OBJDUMP_PROFILES
+
+
+def add_analysis_arguments(parser, gcc_tools_base=None):
+    parser.add_argument(
+        "--gcc-tools-base",
+        "--gcc_tools_base",
+        default=gcc_tools_base,
+        help="filename prefix for your gcc tools, e.g. ~/arm-cs-tools/bin/arm-none-eabi-",
+    )
+    parser.add_argument(
+        "elf_file", nargs="?", help="location of an ELF file (positional or --elf_file)"
+    )
+    parser.add_argument(
+        "--elf",
+        "--elf_file",
+        dest="elf_file_opt",
+        help="location of an ELF file (positional or --elf_file)",
+    )
+    parser.add_argument(
+        "--objdump-profile",
+        choices=OBJDUMP_PROFILES,
+        default="full",
+        help=(
+            "'full' runs objdump -dslw, 'lean' skips the section contents dump (-s) the "
+            "analysis doesn't use, which is faster for images with large data or debug sections"
+        ),
+    )
+    parser.add_argument(
+        "--objdump-section",
+        action="append",
+        dest="objdump_sections",
+        help=(
+            "with --objdump-profile lean, only disassemble this section (e.g. .text) instead of "
+            "all executable ones. May be specified multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--no-objdump-line-numbers",
+        action="store_true",
+        help=(
+            "with --objdump-profile lean, don't ask objdump for source lines (-l); file names "
+            "and lines of symbols then only come from nm"
+        ),
+    )
+    parser.add_argument("--src_root", "--src-root", help="location of your sources")
+    parser.add_argument("--build_dir", "--build-dir", help="location of your build output")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help=(
+            "analyze the assembly of the functions in this many worker processes, "
+            "0 uses one per CPU; needs fork(), i.e. not on Windows. "
+            "With --report-manifest, analyze this many builds at once instead"
+        ),
+    )
+
+
+def add_report_arguments(parser):
+    parser.add_argument(
+        "--report-type",
+        "--report_type",
+        default="json",
+        help="report format (currently only 'json' is supported)",
+    )
+    parser.add_argument(
+        "--report-tag",
+        "--report_tag",
+        default="no_tag",
+        help="tag used as the key for this report entry in the output file",
+    )
+    parser.add_argument(
+        "--report-filename",
+        "--report_filename",
+        default="report",
+        help="output filename (without extension) for the generated report",
+    )
+    parser.add_argument(
+        "--report-shards",
+        action="store_true",
+        help=(
+            "keep the reports in a folder named after --report-filename, with one file per tag "
+            "and an index.json, so that adding a tag doesn't rewrite the reports of the others"
+        ),
+    )
+    parser.add_argument(
+        "--report-gzip",
+        action="store_true",
+        help="compress the files of --report-shards with gzip",
+    )
+    parser.add_argument(
+        "--report-history",
+        metavar="DATABASE",
+        help=(
+            "add the report of this build under --report-tag to an SQLite database, "
+            "which puncover-history queries for trends"
+        ),
+    )
+    parser.add_argument(
+        "--report-manifest",
+        metavar="FILE",
+        help=(
+            "analyze the builds listed in this JSON file, with elf_file, su_dir, src_root and "
+            "tag for each, and add their reports under their tags; "
+            "implies --non-interactive"
+        ),
+    )
+    parser.add_argument(
+        "--report-max-static-stack-usage",
+        "--report_max_static_stack_usage",
+        action="append",
+        dest="report_max_static_stack_usage",
+        help=(
+            "function to include in the stack report; format: display_name or "
+            "display_name:::max_stack_size (e.g. led_thread or led_thread:::1024). "
+            "May be specified multiple times."
+        ),
+    )
+
+
+def check_analysis_arguments(parser, args):
+    if args.gcc_tools_base is None:
+        print(
+            "Unable to find gcc tools base dir (tried searching for 'arm-none-eabi-objdump' on PATH), please specify --gcc-tools-base"
+        )
+        exit(1)
+
+    if args.objdump_profile != "lean" and (args.objdump_sections or args.no_objdump_line_numbers):
+        parser.error(
+            "--objdump-section and --no-objdump-line-numbers require --objdump-profile lean"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="puncover-report",
+        description="Writes the JSON report of an ELF file, like puncover --generate-report.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    add_analysis_arguments(parser)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    elf_file = args.elf_file_opt if args.elf_file_opt else args.elf_file
+    if args.report_gzip and not args.report_shards:
+        parser.error("--report-gzip requires --report-shards")
+    if bool(elf_file) == bool(args.report_manifest):
+        parser.error(
+            "either an ELF file (positional or --elf_file) or --report-manifest is required"
+        )
+    if args.gcc_tools_base is None:
+        from puncover.gcc_tools import get_arm_tools_prefix_path
+
+        args.gcc_tools_base = get_arm_tools_prefix_path()
+    check_analysis_arguments(parser, args)
+
+    from puncover import report
+    from puncover.gcc_tools import GCCTools
+
+    gcc_tools = GCCTools(
+        args.gcc_tools_base,
+        args.objdump_profile,
+        args.objdump_sections,
+        not args.no_objdump_line_numbers,
+    )
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if args.report_manifest:
+        from puncover import batch
+
+        batch.generate_reports(
+            batch.analyze_builds(
+                batch.read_manifest(args.report_manifest),
+                gcc_tools,
+                stack_functions=args.report_max_static_stack_usage,
+                report_type=args.report_type,
+                jobs=jobs,
+            ),
+            args.report_filename,
+            shards=args.report_shards,
+            compress=args.report_gzip,
+            history_path=args.report_history,
+        )
+        return
+
+    from puncover.builders import ElfBuilder
+    from puncover.collector import Collector
+
+    builder = ElfBuilder(Collector(gcc_tools), args.src_root, elf_file, args.build_dir)
+    builder.jobs = jobs
+    builder.build()
+    report.generate_report(
+        builder.collector,
+        args.report_filename,
+        args.report_tag,
+        stack_functions=args.report_max_static_stack_usage,
+        report_type=args.report_type,
+        shards=args.report_shards,
+        compress=args.report_gzip,
+    )
+    if args.report_history:
+        from puncover import history
+
+        db = history.open_history(args.report_history)
+        try:
+            history.add_tag(
+                db,
+                args.report_tag,
+                report.tag_entry(
+                    builder.collector, args.report_max_static_stack_usage, args.report_type
+                ),
+            )
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Keeps the reports of many builds in an SQLite database and queries how they changed.
+
+Every tag added with --report-history (or imported from JSON reports) gets a row in the
+tags table. Its functions, variables and stack report are stored as rows of the functions,
+variables and stack_reports tables that reference the tag. They are indexed by tag and
+path, and by name, so that trends and the differences between two tags are computed by
+SQLite without reading any of the other reports:
+
+    puncover-history history.sqlite import report.json
+    puncover-history history.sqlite trend --folder src/drivers
+    puncover-history history.sqlite trend --stack led_thread
+    puncover-history history.sqlite growers v1.0 v1.1
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+
+from puncover import report
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS functions (
+    tag INTEGER NOT NULL REFERENCES tags (id),
+    name TEXT NOT NULL,
+    path TEXT,
+    address INTEGER,
+    size INTEGER,
+    stack_size INTEGER
+);
+CREATE TABLE IF NOT EXISTS variables (
+    tag INTEGER NOT NULL REFERENCES tags (id),
+    name TEXT NOT NULL,
+    path TEXT,
+    address INTEGER,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS stack_reports (
+    tag INTEGER NOT NULL REFERENCES tags (id),
+    function TEXT NOT NULL,
+    max_static_stack_size INTEGER,
+    max_stack_size INTEGER,
+    PRIMARY KEY (tag, function)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS functions_path ON functions (tag, path);
+CREATE INDEX IF NOT EXISTS functions_name ON functions (name, tag);
+CREATE INDEX IF NOT EXISTS variables_path ON variables (tag, path);
+CREATE INDEX IF NOT EXISTS variables_name ON variables (name, tag);
+"""
+
+SYMBOL_TABLES = ["functions", "variables"]
+
+
+def open_history(path):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def symbol_path(symbol):
+    # the report prefixes the path relative to the sources with /
+    return symbol["file"][1:] if "file" in symbol else None
+
+
+def folder_condition(folder):
+    """SQL condition and its parameters for the paths within folder, using the path index."""
+    folder = folder.strip("/")
+    if not folder:
+        return "1", ()
+    # "0" follows "/", so this is the range of all paths starting with folder/
+    return "path >= ? AND path < ?", (folder + "/", folder + "0")
+
+
+def add_tag(db, tag, entry):
+    """
+    Adds the report of one build, as produced by report.tag_entry() or read from a JSON
+    report, under tag. A tag that has been added before is replaced but keeps its place.
+    """
+    with db:
+        db.execute(
+            "INSERT INTO tags (name, timestamp) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET timestamp = excluded.timestamp",
+            (tag, entry.get("timestamp")),
+        )
+        tag_id = tag_id_of(db, tag)
+        for table in SYMBOL_TABLES + ["stack_reports"]:
+            db.execute("DELETE FROM %s WHERE tag = ?" % table, (tag_id,))
+        db.executemany(
+            "INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (tag_id, f["name"], symbol_path(f), f["address"], f["size"], f.get("stack_size"))
+                for f in entry.get("functions", [])
+            ),
+        )
+        db.executemany(
+            "INSERT INTO variables VALUES (?, ?, ?, ?, ?)",
+            (
+                (tag_id, v["name"], symbol_path(v), v["address"], v["size"])
+                for v in entry.get("variables", [])
+            ),
+        )
+        db.executemany(
+            "INSERT INTO stack_reports VALUES (?, ?, ?, ?)",
+            (
+                (tag_id, name, r["max_static_stack_size"], r.get("max_stack_size"))
+                for name, r in entry.get("stack_report", {}).items()
+            ),
+        )
+
+
+def import_reports(db, path):
+    """
+    Adds all tags of a JSON report file or of a folder written with --report-shards.
+    Returns the imported tags.
+    """
+    if os.path.isdir(path):
+        tags = list(report.read_index(path).keys())
+        for tag in tags:
+            add_tag(db, tag, report.read_tag(path, tag))
+        return tags
+
+    with open(path, encoding="utf-8") as f:
+        reports = json.load(f)
+    for tag, entry in reports.items():
+        add_tag(db, tag, entry)
+    return list(reports.keys())
+
+
+def tag_id_of(db, tag):
+    row = db.execute("SELECT id FROM tags WHERE name = ?", (tag,)).fetchone()
+    if row is None:
+        raise Exception("Unknown tag %s" % tag)
+    return row[0]
+
+
+def tags(db):
+    """(tag, timestamp, number of functions, number of variables) in the order they were added."""
+    return db.execute(
+        "SELECT name, timestamp,"
+        " (SELECT COUNT(*) FROM functions WHERE tag = tags.id),"
+        " (SELECT COUNT(*) FROM variables WHERE tag = tags.id)"
+        " FROM tags ORDER BY id"
+    ).fetchall()
+
+
+def folder_trend(db, folder="", table="functions"):
+    """(tag, total size) of the functions or variables within folder for every tag."""
+    condition, params = folder_condition(folder)
+    return db.execute(
+        "SELECT name, (SELECT COALESCE(SUM(size), 0) FROM %s WHERE tag = tags.id AND %s)"
+        " FROM tags ORDER BY id" % (table, condition),
+        params,
+    ).fetchall()
+
+
+def symbol_trend(db, name, table="functions"):
+    """(tag, size) of all functions or variables called name for every tag."""
+    return db.execute(
+        "SELECT tags.name, COALESCE(SUM(size), 0) FROM tags LEFT JOIN %s AS s"
+        " ON s.tag = tags.id AND s.name = ? GROUP BY tags.id ORDER BY tags.id" % table,
+        (name,),
+    ).fetchall()
+
+
+def stack_trend(db, function):
+    """(tag, max_static_stack_size) of a function of the stack reports for every tag."""
+    return db.execute(
+        "SELECT tags.name, s.max_static_stack_size FROM tags LEFT JOIN stack_reports AS s"
+        " ON s.tag = tags.id AND s.function = ? ORDER BY tags.id",
+        (function,),
+    ).fetchall()
+
+
+def growers(db, old, new, table="functions", folder="", limit=10):
+    """
+    (name, path, old size, new size) of the functions or variables that grew the most from
+    tag old to tag new, including the ones that were added.
+    """
+    condition, params = folder_condition(folder)
+    old_id, new_id = tag_id_of(db, old), tag_id_of(db, new)
+    return db.execute(
+        "SELECT name, path,"
+        " COALESCE(SUM(CASE WHEN tag = ? THEN size END), 0) AS old_size,"
+        " COALESCE(SUM(CASE WHEN tag = ? THEN size END), 0) AS new_size"
+        " FROM %s WHERE tag IN (?, ?) AND %s GROUP BY name, path"
+        " HAVING new_size > old_size ORDER BY new_size - old_size DESC, name LIMIT ?"
+        % (table, condition),
+        (old_id, new_id, old_id, new_id) + params + (limit,),
+    ).fetchall()
+
+
+def print_trend(rows):
+    previous = None
+    for tag, value in rows:
+        if value is None:
+            print("%-30s %10s" % (tag, "-"))
+            continue
+        delta = "" if previous is None else "%+d" % (value - previous)
+        print("%-30s %10d %10s" % (tag, value, delta))
+        previous = value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="puncover-history",
+        description="Query the history of reports added with puncover --report-history.",
+    )
+    parser.add_argument("database", help="SQLite file of the history")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "import", help="add the tags of a JSON report file or a --report-shards folder"
+    )
+    command.add_argument("report")
+
+    commands.add_parser("tags", help="list the tags in the order they were added")
+
+    command = commands.add_parser("trend", help="show how a size changed over all tags")
+    what = command.add_mutually_exclusive_group(required=True)
+    what.add_argument("--folder", help="total size of the symbols within this folder")
+    what.add_argument("--symbol", help="size of the symbols with this name")
+    what.add_argument("--stack", help="max_static_stack_size of this function's stack report")
+    command.add_argument("--variables", action="store_true", help="variables instead of functions")
+
+    command = commands.add_parser("growers", help="list the symbols that grew the most")
+    command.add_argument("old", help="tag to compare with")
+    command.add_argument("new", help="tag to compare")
+    command.add_argument("--folder", default="", help="only symbols within this folder")
+    command.add_argument("--limit", type=int, default=10)
+    command.add_argument("--variables", action="store_true", help="variables instead of functions")
+
+    args = parser.parse_args(argv)
+    if args.command != "import" and not os.path.isfile(args.database):
+        parser.error("%s doesn't exist" % args.database)
+    db = open_history(args.database)
+    table = "variables" if getattr(args, "variables", False) else "functions"
+    try:
+        if args.command == "import":
+            for tag in import_reports(db, args.report):
+                print("imported %s" % tag)
+        elif args.command == "tags":
+            for tag, timestamp, functions, variables in tags(db):
+                print(
+                    "%-30s %-26s %8d functions %8d variables"
+                    % (tag, timestamp, functions, variables)
+                )
+        elif args.command == "trend":
+            if args.stack:
+                print_trend(stack_trend(db, args.stack))
+            elif args.symbol:
+                print_trend(symbol_trend(db, args.symbol, table))
+            else:
+                print_trend(folder_trend(db, args.folder, table))
+        else:
+            for name, path, old, new in growers(
+                db, args.old, args.new, table, args.folder, args.limit
+            ):
+                print("%+10d %10d %10d  %s  %s" % (new - old, old, new, name, path or ""))
+    except Exception as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
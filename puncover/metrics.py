@@ -0,0 +1,185 @@
+"""
+Telemetry of builds and requests in the Prometheus text format, served on /metrics.
+
+Metrics listens to the analysis stages and records request latencies. Each process keeps its
+own numbers. With --serve, a scrape sees the worker that happened to accept it, so every
+sample carries a worker label with that worker's process id. Prometheus then keeps one
+series per worker (sum or max them in queries), and a restarted worker starts new series
+instead of resetting those of another one.
+"""
+
+import os
+import threading
+import time
+
+from puncover import collector
+from puncover.profiling import peak_rss, resident_memory
+from puncover.stages import StageListener
+
+# upper bounds (in seconds) of the request latency histogram's buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics(StageListener):
+    def __init__(self, collector, per_worker=False):
+        self.collector = collector
+        # label every sample with the process id, see above
+        self.per_worker = per_worker
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.failed_builds = 0
+        self.build_started_at = None
+        self.last_build_seconds = None
+        self.published = None
+        # stage name -> (seconds of the last build, seconds of all builds)
+        self.stage_seconds = {}
+        self.snapshot_counts = {}
+        # endpoint -> Histogram
+        self.latencies = {}
+
+    def build_started(self):
+        self.build_started_at = time.perf_counter()
+
+    def stage_finished(self, stage):
+        with self.lock:
+            _, total = self.stage_seconds.get(stage.name, (0, 0.0))
+            self.stage_seconds[stage.name] = (stage.elapsed(), total + stage.elapsed())
+
+    def build_finished(self):
+        counts = self.count_snapshot()
+        with self.lock:
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - self.build_started_at
+            self.published = time.time()
+            self.snapshot_counts = counts
+
+    def build_failed(self, error):
+        with self.lock:
+            self.failed_builds += 1
+
+    def count_snapshot(self):
+        # counted once per build, scrapes must not read a snapshot that is being rebuilt
+        counts = {"symbols": 0, "functions": 0, "variables": 0, "files": 0, "folders": 0}
+        for s in self.collector.symbols.values():
+            counts["symbols"] += 1
+            if s.get(collector.TYPE) == collector.TYPE_FUNCTION:
+                counts["functions"] += 1
+            elif s.get(collector.TYPE) == collector.TYPE_VARIABLE:
+                counts["variables"] += 1
+        for e in self.collector.file_elements.values():
+            if e[collector.TYPE] == collector.TYPE_FILE:
+                counts["files"] += 1
+            elif e[collector.TYPE] == collector.TYPE_FOLDER:
+                counts["folders"] += 1
+        return counts
+
+    def observe_request(self, endpoint, seconds):
+        with self.lock:
+            histogram = self.latencies.get(endpoint)
+            if histogram is None:
+                histogram = self.latencies[endpoint] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        worker = (("worker", os.getpid()),) if self.per_worker else ()
+
+        def metric(name, type, help, samples):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, type))
+            for labels, value in samples:
+                if value is None:
+                    continue
+                labels = worker + tuple(labels)
+                label_text = ",".join('%s="%s"' % (k, escape(v)) for k, v in labels)
+                name_and_labels = "%s{%s}" % (name, label_text) if labels else name
+                lines.append("%s %s" % (name_and_labels, number(value)))
+
+        with self.lock:
+            metric("puncover_builds_total", "counter", "Completed builds.", [((), self.builds)])
+            metric(
+                "puncover_build_failures_total",
+                "counter",
+                "Builds that raised an error.",
+                [((), self.failed_builds)],
+            )
+            metric(
+                "puncover_build_duration_seconds",
+                "gauge",
+                "Duration of the last build.",
+                [((), self.last_build_seconds)],
+            )
+            metric(
+                "puncover_stage_duration_seconds",
+                "gauge",
+                "Duration of each stage in the last build.",
+                [((("stage", s),), last) for s, (last, _) in self.stage_seconds.items()],
+            )
+            metric(
+                "puncover_stage_seconds_total",
+                "counter",
+                "Time spent in each stage over all builds.",
+                [((("stage", s),), total) for s, (_, total) in self.stage_seconds.items()],
+            )
+            metric(
+                "puncover_snapshot_age_seconds",
+                "gauge",
+                "Time since the current snapshot was published.",
+                [((), None if self.published is None else time.time() - self.published)],
+            )
+            metric(
+                "puncover_snapshot_elements",
+                "gauge",
+                "Symbols, functions, variables, files and folders in the current snapshot.",
+                [((("kind", k),), v) for k, v in self.snapshot_counts.items()],
+            )
+            metric(
+                "puncover_resident_memory_bytes",
+                "gauge",
+                "Resident memory of the process holding the snapshot.",
+                [((), resident_memory())],
+            )
+            metric(
+                "puncover_peak_resident_memory_bytes",
+                "gauge",
+                "Peak resident memory of the process.",
+                [((), peak_rss())],
+            )
+
+            name = "puncover_request_duration_seconds"
+            lines.append("# HELP %s Time to produce a response per endpoint." % name)
+            lines.append("# TYPE %s histogram" % name)
+            worker_text = "".join('%s="%s",' % (k, escape(v)) for k, v in worker)
+            for endpoint, h in sorted(self.latencies.items()):
+                e = worker_text + 'endpoint="%s"' % escape(endpoint)
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, e, bound, count))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, e, h.count))
+                lines.append("%s_sum{%s} %s" % (name, e, number(h.sum)))
+                lines.append("%s_count{%s} %d" % (name, e, h.count))
+
+        return "\n".join(lines) + "\n"
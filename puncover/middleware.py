@@ -1,8 +1,46 @@
+from contextlib import nullcontext
+
+from werkzeug.wsgi import ClosingIterator
+
+from puncover.server_timing import ENVIRON_KEY
+
+# the collector of the snapshot a request reads, see Builder.pin_snapshot()
+SNAPSHOT_ENVIRON_KEY = "puncover.snapshot"
+
+
 class BuilderMiddleware(object):
-    def __init__(self, app, builder):
+    def __init__(self, app, builder, unlocked_paths=()):
         self.app = app
         self.builder = builder
+        # long-lived responses that don't read the snapshot, e.g. the build progress events
+        self.unlocked_paths = set(unlocked_paths)
 
     def __call__(self, environ, start_response):
-        self.builder.build_if_needed()
-        return self.app(environ, start_response)
+        if environ.get("PATH_INFO") in self.unlocked_paths:
+            return self.app(environ, start_response)
+
+        timing = environ.get(ENVIRON_KEY, None)
+
+        def measure(name):
+            return timing.measure(name) if timing else nullcontext()
+
+        with measure("build"):
+            self.builder.build_if_needed()
+
+        # Streamed responses are still rendering after self.app() returns. Instead of holding
+        # the lock until then, which would let one slow client hold up rebuilds and with them
+        # all new requests, they read a snapshot that a rebuild leaves intact.
+        lock = self.builder.lock
+        with measure("lock"):
+            lock.acquire_read()
+        try:
+            snapshot = self.builder.pin_snapshot()
+            environ[SNAPSHOT_ENVIRON_KEY] = snapshot.collector
+            try:
+                response = self.app(environ, start_response)
+            except BaseException:
+                self.builder.unpin_snapshot(snapshot)
+                raise
+        finally:
+            lock.release_read()
+        return ClosingIterator(response, lambda: self.builder.unpin_snapshot(snapshot))
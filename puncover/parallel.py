@@ -0,0 +1,63 @@
+"""
+Shards the analysis of each function's assembly over worker processes, see --jobs.
+
+The workers are forked once the assembly has been parsed and read it from the memory they
+share with the parent copy-on-write. A task only names a range of symbols, and only the
+compact result of Collector.analyze_symbol_content() comes back: the size, the indirect call
+flag, the addresses of the called symbols and the few lines that get the name of their bl
+target appended. The parent applies them and derives the call graph.
+"""
+
+import multiprocessing
+import sys
+import threading
+
+# symbols per task, large enough that the results are sent back in few messages
+CHUNK_SIZE = 512
+
+# (collector, symbols, known) while analyze_contents() runs, inherited by the workers
+_work = None
+
+
+def can_fork():
+    """
+    Whether forking is safe. A process with other threads, e.g. the interactive server's
+    request threads or its watcher, may fork while one of them holds a lock the child then
+    waits for forever (Python 3.12+ warns about this). macOS system libraries aren't safe to
+    use after fork() either. The other start methods would have to pickle the snapshot, so
+    callers fall back to doing the work in this process.
+    """
+    return (
+        "fork" in multiprocessing.get_all_start_methods()
+        and sys.platform != "darwin"
+        and threading.active_count() == 1
+    )
+
+
+def analyze_range(bounds):
+    collector, symbols, known = _work
+    start, end = bounds
+    return [
+        collector.analyze_symbol_content(s, collector.decoded_assembly(s), known)
+        for s in symbols[start:end]
+    ]
+
+
+def analyze_contents(collector, symbols, known, jobs):
+    """
+    Yields the results of Collector.analyze_symbol_content() for each of symbols, in order.
+    Results arrive while the workers continue with the following symbols.
+    """
+    global _work
+    if _work is not None:
+        raise Exception("Only one parallel analysis can run at a time")
+    _work = (collector, symbols, known)
+    try:
+        bounds = [
+            (i, min(i + CHUNK_SIZE, len(symbols))) for i in range(0, len(symbols), CHUNK_SIZE)
+        ]
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            for results in pool.imap(analyze_range, bounds):
+                yield from results
+    finally:
+        _work = None
@@ -0,0 +1,296 @@
+"""
+Timings of the analysis pipeline, see --profile.
+
+StageProfiler listens to the stages of a build and records wall time, CPU time, the number
+of processed items and the resident memory of each stage. With --profile-memory it also traces
+the Python allocations of each stage and estimates the size of the collector's structures.
+
+Resident memory is read from /proc, or with psutil where that's installed. Without either, e.g.
+on macOS without psutil, only the process peak from getrusage() is known, and on Windows
+without psutil nothing.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from puncover import collector
+from puncover.stages import StageListener
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def resident_memory():
+    """Current resident set size of this process in bytes, None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def memory_delta(start, end):
+    return end - start if start is not None and end is not None else None
+
+
+def max_or_none(*values):
+    return max([v for v in values if v is not None], default=None)
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes, None if unknown. This is the maximum
+    over the lifetime of the process, see resident_memory() for the current value.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def estimate_structure_sizes(c):
+    """
+    Approximate bytes held by the collector's structures. Objects referenced from more than
+    one place are counted once, for the first structure they are found in.
+    """
+    seen = set()
+
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+
+    def path_size(path):
+        return size(path) + size(str(path)) if path is not None else 0
+
+    sizes = dict.fromkeys(
+        ["symbols", "asm", "call_graph", "deepest_trees", "paths", "file_elements", "cache"], 0
+    )
+    for s in c.symbols.values():
+        sizes["symbols"] += size(s)
+        lines = s.get(collector.ASM, None)
+        if isinstance(lines, list):
+            sizes["asm"] += size(lines) + sum(size(line) for line in lines)
+        elif lines is not None:
+            # SpilledLines, its lines are in a memory-mapped file
+            sizes["asm"] += size(lines)
+        for key in [collector.CALLERS, collector.CALLEES]:
+            if key in s:
+                sizes["call_graph"] += size(s[key])
+        for key in [collector.DEEPEST_CALLER_TREE, collector.DEEPEST_CALLEE_TREE]:
+            tree = s.get(key, None)
+            if tree is not None:
+                sizes["deepest_trees"] += size(tree) + size(tree[1])
+        sizes["paths"] += path_size(s.get(collector.PATH, None))
+
+    for e in c.file_elements.values():
+        sizes["paths"] += path_size(e.get(collector.PATH, None))
+        sizes["file_elements"] += size(e) + sum(size(v) for v in e.values() if isinstance(v, list))
+
+    def cache_size(value):
+        # the cache refers to symbols, which have been counted (and marked as seen) above
+        if id(value) in seen:
+            return 0
+        result = size(value)
+        if isinstance(value, dict):
+            result += sum(cache_size(v) for v in value.values())
+        elif isinstance(value, (list, tuple)):
+            result += sum(cache_size(v) for v in value)
+        return result
+
+    sizes["cache"] = cache_size(c.cache)
+    return sizes
+
+
+class StageProfiler(StageListener):
+    def __init__(self, output_file=None, cprofile_dir=None, out=None, collector=None, memory=False):
+        self.output_file = output_file
+        self.cprofile_dir = cprofile_dir
+        self.out = out
+        # traces allocations with tracemalloc, slows down the build considerably
+        self.memory = memory
+        self.collector = collector
+        self.stages = []
+        self.build_started_at = None
+        self.running = {}
+        # the highest resident memory sampled during each running stage
+        self.rss_peaks = {}
+        self.started_tracing = False
+
+    def traced_memory(self):
+        return tracemalloc.get_traced_memory()[0] if self.memory else None
+
+    def build_started(self):
+        self.stages = []
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.build_started_at = (
+            time.perf_counter(),
+            time.process_time(),
+            self.traced_memory(),
+            resident_memory(),
+        )
+
+    def stage_started(self, stage):
+        profile = None
+        if self.cprofile_dir:
+            profile = cProfile.Profile()
+            profile.enable()
+        if self.memory:
+            tracemalloc.reset_peak()
+        rss = resident_memory()
+        self.rss_peaks[stage] = rss
+        self.running[stage] = (
+            time.perf_counter(),
+            time.process_time(),
+            self.traced_memory(),
+            rss,
+            peak_rss(),
+            profile,
+        )
+
+    def stage_progress(self, stage):
+        # sampled a few times per second while a stage processes its items
+        if stage in self.rss_peaks:
+            self.rss_peaks[stage] = max_or_none(self.rss_peaks[stage], resident_memory())
+
+    def stage_finished(self, stage):
+        started = self.running.pop(stage)
+        wall_start, cpu_start, memory_start, rss_start, max_rss_start, profile = started
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if profile:
+            profile.disable()
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            filename = "%02d-%s.prof" % (len(self.stages) + 1, stage.name)
+            profile.dump_stats(os.path.join(self.cprofile_dir, filename))
+        # Resident memory after the stage and how much the stage added to (or gave back
+        # from) it, and the highest value seen during the stage: sampled at its start, end
+        # and progress reports, or exactly the process peak if the stage raised that.
+        rss = resident_memory()
+        rss_peak = max_or_none(self.rss_peaks.pop(stage, None), rss)
+        max_rss = peak_rss()
+        if max_rss is not None and max_rss_start is not None and max_rss > max_rss_start:
+            rss_peak = max_or_none(rss_peak, max_rss)
+        entry = {
+            "name": stage.name,
+            "wall": wall,
+            "cpu": cpu,
+            "items": stage.done,
+            "rss": rss,
+            "rss_delta": memory_delta(rss_start, rss),
+            "rss_peak": rss_peak,
+        }
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # memory still held after the stage, and the most it held in between
+            entry["allocated"] = current - memory_start
+            entry["allocated_peak"] = peak - memory_start
+        self.stages.append(entry)
+
+    def stop_tracing(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def build_finished(self):
+        report = self.report()
+        self.stop_tracing()
+        self.print_summary(report)
+        if self.output_file:
+            with open(self.output_file, "w") as f:
+                json.dump(report, f, indent=4)
+
+    def build_failed(self, error):
+        self.running = {}
+        self.rss_peaks = {}
+        self.stop_tracing()
+
+    def report(self):
+        rss = resident_memory()
+        total = {
+            "name": "total",
+            "wall": None,
+            "cpu": None,
+            "items": None,
+            "rss": rss,
+            "rss_delta": None,
+            "rss_peak": None,
+            "peak_rss": peak_rss(),
+        }
+        if self.build_started_at:
+            wall_start, cpu_start, memory_start, rss_start = self.build_started_at
+            total["wall"] = time.perf_counter() - wall_start
+            total["cpu"] = time.process_time() - cpu_start
+            total["rss_delta"] = memory_delta(rss_start, rss)
+            if self.memory:
+                total["allocated"] = self.traced_memory() - memory_start
+                total["allocated_peak"] = max(
+                    [s["allocated_peak"] for s in self.stages], default=None
+                )
+        report = {"stages": self.stages, "total": total}
+        if self.memory and self.collector is not None:
+            report["structures"] = estimate_structure_sizes(self.collector)
+        return report
+
+    def print_summary(self, report):
+        out = self.out or sys.stdout
+
+        def number(value, fmt):
+            return "-" if value is None else fmt % value
+
+        def mib(value, fmt="%.1f"):
+            return number(None if value is None else value / (1024 * 1024), fmt)
+
+        def row(s):
+            columns = "%-16s %9s %9s %10s %9s %9s %13s" % (
+                s["name"],
+                number(s["wall"], "%.3f"),
+                number(s["cpu"], "%.3f"),
+                number(s["items"] or None, "%d"),
+                mib(s["rss"]),
+                mib(s["rss_delta"], "%+.1f"),
+                mib(s["rss_peak"]),
+            )
+            if self.memory:
+                columns += " %13s %12s" % (mib(s.get("allocated")), mib(s.get("allocated_peak")))
+            return columns
+
+        header = "%-16s %9s %9s %10s %9s %9s %13s" % (
+            "stage",
+            "wall s",
+            "cpu s",
+            "items",
+            "rss MiB",
+            "+rss MiB",
+            "max rss MiB",
+        )
+        if self.memory:
+            header += " %13s %12s" % ("alloc MiB", "peak MiB")
+        print(header, file=out)
+        for s in report["stages"]:
+            print(row(s), file=out)
+        print(row(report["total"]), file=out)
+        print("peak rss %s MiB" % mib(report["total"]["peak_rss"]), file=out)
+
+        if "structures" in report:
+            print("\n%-16s %14s" % ("structure", "estimated MiB"), file=out)
+            for name, size in report["structures"].items():
+                print("%-16s %14s" % (name, mib(size)), file=out)
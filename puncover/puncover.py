@@ -1,22 +1,25 @@
 #!/usr/bin/env python
 
-import datetime
 import importlib.metadata
 import json
 import os
 import webbrowser
-from os.path import dirname
-from shutil import which
 from threading import Timer
 
 import configargparse
 from flask import Flask
 
-from puncover import renderers
+from puncover import batch, headless, history, renderers, report
 from puncover.builders import ElfBuilder
 from puncover.collector import Collector
-from puncover.gcc_tools import GCCTools
+from puncover.gcc_tools import GCCTools, get_arm_tools_prefix_path
+from puncover.metrics import Metrics
 from puncover.middleware import BuilderMiddleware
+from puncover.profiling import StageProfiler
+from puncover.server_timing import ServerTimingMiddleware
+from puncover.serving import serve
+from puncover.stages import ProgressBroadcaster
+from puncover.store import StoreCollector
 
 version = importlib.metadata.version("puncover")
 
@@ -36,10 +39,30 @@ def get_default_port():
     return DEFAULT_PORT if not is_port_in_use(DEFAULT_PORT) else DEFAULT_PORT_FALLBACK
 
 
-def create_builder(gcc_base_filename, elf_file=None, su_dir=None, src_root=None):
-    c = Collector(GCCTools(gcc_base_filename))
+def create_builder(
+    gcc_base_filename,
+    elf_file=None,
+    su_dir=None,
+    src_root=None,
+    objdump_profile="full",
+    objdump_sections=None,
+    line_numbers=True,
+    quick_start=False,
+    spill_assembly=False,
+    incremental_analysis=False,
+    jobs=1,
+    store_path=None,
+):
+    gcc_tools = GCCTools(gcc_base_filename, objdump_profile, objdump_sections, line_numbers)
+    c = StoreCollector(gcc_tools) if store_path else Collector(gcc_tools)
     if elf_file:
-        return ElfBuilder(c, src_root, elf_file, su_dir)
+        builder = ElfBuilder(c, src_root, elf_file, su_dir)
+        builder.quick_start = quick_start
+        builder.spill_assembly = spill_assembly
+        builder.incremental_analysis = incremental_analysis
+        builder.jobs = jobs
+        builder.store_path = store_path
+        return builder
     else:
         raise Exception("Unable to configure builder for collector")
 
@@ -47,26 +70,6 @@ def create_builder(gcc_base_filename, elf_file=None, su_dir=None, src_root=None)
 app = Flask(__name__)
 
 
-def get_arm_tools_prefix_path():
-    """
-    Try to find and return the arm tools triple prefix path, like this:
-      /usr/local/gcc-arm-none-eabi-9-2019-q4-major/bin/arm-none-eabi-
-
-    It's used to invoke the other tools, like objdump/nm.
-
-    Note that we could instead use the '-print-prog-name=...' option to gcc,
-    which returns the paths we need. For now stick with the hacky method here.
-    """
-    obj_dump = which("arm-none-eabi-objdump")
-    if not obj_dump:
-        return None
-
-    gcc_tools_base_dir = dirname(dirname(obj_dump))
-    assert gcc_tools_base_dir, "Unable to find gcc tools base dir from {}".format(obj_dump)
-
-    return os.path.join(gcc_tools_base_dir, "bin/arm-none-eabi-")
-
-
 def open_browser(host, port):
     webbrowser.open("http://{}:{}/".format(host, port))
 
@@ -83,24 +86,66 @@ def main():
     parser.add_argument(
         "-c", "--config", required=False, is_config_file=True, help="config file path"
     )
+    headless.add_analysis_arguments(parser, gcc_tools_base)
+    parser.add_argument("--debug", action="store_true", help="enable Flask debugger")
     parser.add_argument(
-        "--gcc-tools-base",
-        "--gcc_tools_base",
-        default=gcc_tools_base,
-        help="filename prefix for your gcc tools, e.g. ~/arm-cs-tools/bin/arm-none-eabi-",
+        "--stream",
+        action="store_true",
+        help="send large pages (folders, files, symbols, all symbols) while they are rendered",
     )
     parser.add_argument(
-        "elf_file", nargs="?", help="location of an ELF file (positional or --elf_file)"
+        "--server-timing",
+        action="store_true",
+        help=(
+            "add Server-Timing headers that break down the time spent on each page, "
+            "see the network tab of your browser's developer tools"
+        ),
     )
     parser.add_argument(
-        "--elf",
-        "--elf_file",
-        dest="elf_file_opt",
-        help="location of an ELF file (positional or --elf_file)",
+        "--no-live-reload",
+        action="store_true",
+        help="don't rebuild in the background and don't reload open pages when the ELF changes",
+    )
+    parser.add_argument(
+        "--quick-start",
+        action="store_true",
+        help=(
+            "open the report right after reading the symbol table and disassemble functions "
+            "when their page is opened; call trees and stack usage follow from a complete "
+            "analysis in the background"
+        ),
+    )
+    parser.add_argument(
+        "--spill-assembly",
+        action="store_true",
+        help=(
+            "keep the disassembly in a memory-mapped temporary file instead of memory, "
+            "which reduces the memory needed for big ELF files"
+        ),
+    )
+    parser.add_argument(
+        "--incremental-analysis",
+        action="store_true",
+        help=(
+            "when rebuilding, reuse the analysis of functions whose assembly only moved since "
+            "the last build"
+        ),
+    )
+    parser.add_argument(
+        "--store",
+        help=(
+            "analyze into this SQLite file and serve the report from there, which keeps the "
+            "memory of the server small between builds; each build still analyzes the "
+            "complete ELF file in memory, in a child process"
+        ),
+    )
+    parser.add_argument(
+        "--snapshot",
+        help=(
+            "serve a file written with --store, e.g. by CI, instead of analysing an ELF file; "
+            "needs neither the ELF file nor a toolchain"
+        ),
     )
-    parser.add_argument("--src_root", "--src-root", help="location of your sources")
-    parser.add_argument("--build_dir", "--build-dir", help="location of your build output")
-    parser.add_argument("--debug", action="store_true", help="enable Flask debugger")
     parser.add_argument(
         "--port",
         dest="port",
@@ -112,6 +157,20 @@ def main():
     parser.add_argument(
         "--no-open-browser", action="store_true", help="don't automatically open a browser window"
     )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "serve the report from a pool of pre-forked worker processes for many concurrent "
+            "users; the ELF is analysed once and not rebuilt when it changes"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes used with --serve",
+    )
     parser.add_argument(
         "--non-interactive",
         "--non_interactive",
@@ -125,33 +184,26 @@ def main():
         action="store_true",
         help="generate a JSON report file",
     )
+    headless.add_report_arguments(parser)
     parser.add_argument(
-        "--report-type",
-        "--report_type",
-        default="json",
-        help="report format (currently only 'json' is supported)",
+        "--profile",
+        action="store_true",
+        help="print wall time, CPU time, items and peak memory of each analysis stage",
     )
     parser.add_argument(
-        "--report-tag",
-        "--report_tag",
-        default="no_tag",
-        help="tag used as the key for this report entry in the output file",
+        "--profile-output",
+        help="write the stage timings of --profile as JSON to this file",
     )
     parser.add_argument(
-        "--report-filename",
-        "--report_filename",
-        default="report",
-        help="output filename (without extension) for the generated report",
+        "--profile-cprofile-dir",
+        help="dump cProfile statistics of each analysis stage into this folder",
     )
     parser.add_argument(
-        "--report-max-static-stack-usage",
-        "--report_max_static_stack_usage",
-        action="append",
-        dest="report_max_static_stack_usage",
+        "--profile-memory",
+        action="store_true",
         help=(
-            "function to include in the stack report; format: display_name or "
-            "display_name:::max_stack_size (e.g. led_thread or led_thread:::1024). "
-            "May be specified multiple times."
+            "trace the memory allocated by each analysis stage and estimate the size of the "
+            "analysis' data structures (slows down the analysis)"
         ),
     )
     parser.add_argument("--version", action="version", version="%(prog)s " + version)
@@ -170,45 +222,78 @@ def main():
 
     # Determine ELF file from positional or optional argument
     elf_file = args.elf_file_opt if args.elf_file_opt else args.elf_file
-    if not elf_file:
-        parser.error("the following arguments are required: elf_file (positional or --elf_file)")
+    if args.report_gzip and not args.report_shards:
+        parser.error("--report-gzip requires --report-shards")
 
-    if args.gcc_tools_base is None:
-        print(
-            "Unable to find gcc tools base dir (tried searching for 'arm-none-eabi-objdump' on PATH), please specify --gcc-tools-base"
-        )
-        exit(1)
+    if args.report_manifest:
+        generate_manifest_reports(parser, args, elf_file)
+        return
 
-    builder = create_builder(
-        args.gcc_tools_base, elf_file=elf_file, src_root=args.src_root, su_dir=args.build_dir
-    )
-    builder.build_if_needed()
+    if args.snapshot:
+        if elf_file or args.store or args.quick_start:
+            parser.error("--snapshot can't be combined with an ELF file, --store or --quick-start")
+        builder = None
+        collector = StoreCollector(None)
+        collector.open(args.snapshot)
+    else:
+        builder = create_builder_from_args(parser, args, elf_file)
+        collector = builder.collector
+
+    metrics = Metrics(collector, per_worker=args.serve)
+    collector.stages.listeners.append(metrics)
+    if builder:
+        if args.profile or args.profile_output or args.profile_cprofile_dir or args.profile_memory:
+            collector.stages.listeners.append(
+                StageProfiler(
+                    output_file=args.profile_output,
+                    cprofile_dir=args.profile_cprofile_dir,
+                    collector=collector,
+                    memory=args.profile_memory,
+                )
+            )
+        builder.build_if_needed()
 
     if args.generate_report:
-        export_json = {}
-        if os.path.isfile(args.report_filename + ".json"):
-            with open(args.report_filename + ".json") as f:
-                export_json = json.load(f)
-
-        tag_data = {"timestamp": datetime.datetime.now().isoformat()}
+        report.generate_report(
+            collector,
+            args.report_filename,
+            args.report_tag,
+            stack_functions=args.report_max_static_stack_usage,
+            report_type=args.report_type,
+            shards=args.report_shards,
+            compress=args.report_gzip,
+        )
 
-        if args.report_max_static_stack_usage:
-            tag_data["stack_report"] = (
-                builder.collector.report_max_static_stack_usages_from_function_names(
-                    args.report_max_static_stack_usage, args.report_type
-                )
+    if args.report_history:
+        db = history.open_history(args.report_history)
+        try:
+            history.add_tag(
+                db,
+                args.report_tag,
+                report.tag_entry(collector, args.report_max_static_stack_usage, args.report_type),
             )
-        builder.collector.prepare_report_for_json_export(tag_data)
-        export_json[args.report_tag] = tag_data
-        with open(args.report_filename + ".json", "w") as f:
-            json.dump(export_json, f, indent=4, ensure_ascii=False)
+        finally:
+            db.close()
 
     if args.non_interactive:
         return
 
-    renderers.register_jinja_filters(app.jinja_env)
-    renderers.register_urls(app, builder.collector)
-    app.wsgi_app = BuilderMiddleware(app.wsgi_app, builder)
+    renderers.register_jinja_filters(app.jinja_env, server_timing=args.server_timing)
+    renderers.register_urls(app, collector, stream=args.stream)
+    renderers.register_metrics(app, metrics)
+    # snapshots are never rebuilt
+    if builder and not args.serve:
+        # scrapes neither trigger nor wait for rebuilds
+        unlocked_paths = ["/metrics"]
+        if not args.no_live_reload:
+            broadcaster = ProgressBroadcaster()
+            collector.stages.listeners.append(broadcaster)
+            renderers.register_events(app, broadcaster)
+            unlocked_paths.append("/events/")
+            builder.watch()
+        app.wsgi_app = BuilderMiddleware(app.wsgi_app, builder, unlocked_paths=unlocked_paths)
+    if args.server_timing:
+        app.wsgi_app = ServerTimingMiddleware(app.wsgi_app)
 
     if args.debug:
         app.debug = True
@@ -224,7 +309,73 @@ def main():
         # don't see a 404 for a moment first
         Timer(1, open_browser, kwargs={"host": args.host, "port": args.port}).start()
 
-    app.run(host=args.host, port=args.port)
+    if args.serve:
+        serve(app, args.host, args.port, args.workers)
+    else:
+        app.run(host=args.host, port=args.port)
+
+
+def create_builder_from_args(parser, args, elf_file):
+    if not elf_file:
+        parser.error("the following arguments are required: elf_file (positional or --elf_file)")
+
+    headless.check_analysis_arguments(parser, args)
+
+    if args.quick_start and (
+        args.serve or args.non_interactive or args.generate_report or args.store
+    ):
+        parser.error(
+            "--quick-start can't be combined with --serve, --non-interactive, "
+            "--generate-report or --store"
+        )
+
+    return create_builder(
+        args.gcc_tools_base,
+        elf_file=elf_file,
+        src_root=args.src_root,
+        su_dir=args.build_dir,
+        objdump_profile=args.objdump_profile,
+        objdump_sections=args.objdump_sections,
+        line_numbers=not args.no_objdump_line_numbers,
+        quick_start=args.quick_start,
+        spill_assembly=args.spill_assembly,
+        incremental_analysis=args.incremental_analysis,
+        jobs=args.jobs or os.cpu_count() or 1,
+        store_path=args.store,
+    )
+
+
+def generate_manifest_reports(parser, args, elf_file):
+    if elf_file or args.snapshot or args.store or args.quick_start:
+        parser.error(
+            "--report-manifest can't be combined with an ELF file, --snapshot, --store "
+            "or --quick-start"
+        )
+    if not (args.generate_report or args.report_history):
+        parser.error("--report-manifest requires --generate-report or --report-history")
+
+    headless.check_analysis_arguments(parser, args)
+
+    gcc_tools = GCCTools(
+        args.gcc_tools_base,
+        args.objdump_profile,
+        args.objdump_sections,
+        not args.no_objdump_line_numbers,
+    )
+    builds = batch.read_manifest(args.report_manifest)
+    batch.generate_reports(
+        batch.analyze_builds(
+            builds,
+            gcc_tools,
+            stack_functions=args.report_max_static_stack_usage,
+            report_type=args.report_type,
+            jobs=args.jobs or os.cpu_count() or 1,
+        ),
+        args.report_filename if args.generate_report else None,
+        shards=args.report_shards,
+        compress=args.report_gzip,
+        history_path=args.report_history,
+    )
 
 
 if __name__ == "__main__":
@@ -5,22 +5,50 @@ except ImportError:
     from collections.abc import Iterable
 
 import itertools
+import json
 import pathlib
+import queue
 import re
+import time
 from datetime import datetime
-from urllib.parse import urlencode
+from urllib.parse import parse_qsl, urlencode
 
 import jinja2
 import markupsafe
-from flask import abort, redirect, render_template, request
+from flask import (
+    Response,
+    abort,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_template,
+)
 from flask.helpers import url_for
 from flask.views import View
 
-from puncover import collector
+from puncover import collector, server_timing
 from puncover.backtrace_helper import BacktraceHelper
+from puncover.collector import code_size, none_sum, stack_size, symbol_traverse, var_size
+from puncover.middleware import SNAPSHOT_ENVIRON_KEY
+from puncover.server_timing import timed_filter
 
 KEY_OUTPUT_FILE_NAME = "output_file_name"
 
+# streamed pages are sent in chunks of at least this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# stands in for the query suffix in cached assembly. The display names link_assembly() inserts
+# aren't escaped and may contain e.g. "<" (C++ templates), but neither they nor objdump's
+# output contain control characters.
+QUERY_SUFFIX_PLACEHOLDER = "\x00query\x00"
+
+
+def pinned_collector(collector):
+    # a rebuild leaves the snapshot BuilderMiddleware pinned alone while this request reads it
+    return request.environ.get(SNAPSHOT_ENVIRON_KEY, collector)
+
 
 def renderer_from_context(context):
     if isinstance(context, HTMLRenderer):
@@ -50,65 +78,26 @@ def symbol_file_url_filter(context, value):
     return symbol_url_filter(context, f) if f else None
 
 
-def none_sum(values):
-    filtered_values = [a for a in values if a is not None]
-    if filtered_values:
-        return sum(filtered_values)
-    else:
-        return None
-
-
-def symbol_traverse(s, func):
-    if isinstance(s, list):
-        return none_sum([symbol_traverse(i, func) for i in s])
-
-    if collector.TYPE in s:
-        if s[collector.TYPE] == collector.TYPE_FILE:
-            return none_sum([symbol_traverse(s, func) for s in s[collector.SYMBOLS]])
-        if s[collector.TYPE] == collector.FOLDER:
-            return none_sum([
-                symbol_traverse(s, func)
-                for s in itertools.chain(s[collector.SUB_FOLDERS], s[collector.FILES])
-            ])
-
-    return func(s)
-
-
-def traverse_filter_wrapper(value, func):
-    result = symbol_traverse(value, func)
+def traverse_filter_wrapper(value, func, total=None):
+    result = symbol_traverse(value, func, total)
     return result if result != 0 else ""
 
 
 @jinja2.pass_context
 def symbol_code_size_filter(context, value):
-    return traverse_filter_wrapper(
-        value,
-        lambda s: s.get(collector.SIZE, None)
-        if s.get(collector.TYPE, None) == collector.TYPE_FUNCTION
-        else 0,
-    )
+    return traverse_filter_wrapper(value, code_size, collector.CODE_SIZE_TOTAL)
 
 
 @jinja2.pass_context
 def symbol_var_size_filter(context, value):
-    return traverse_filter_wrapper(
-        value,
-        lambda s: s.get(collector.SIZE, None)
-        if s.get(collector.TYPE, None) == collector.TYPE_VARIABLE
-        else 0,
-    )
+    return traverse_filter_wrapper(value, var_size, collector.VAR_SIZE_TOTAL)
 
 
 @jinja2.pass_context
 def symbol_stack_size_filter(context, value, stack_base=None):
     if isinstance(stack_base, str):
         stack_base = None
-    result = symbol_traverse(
-        value,
-        lambda s: s.get(collector.STACK_SIZE, None)
-        if s.get(collector.TYPE, None) == collector.TYPE_FUNCTION
-        else None,
-    )
+    result = symbol_traverse(value, stack_size, collector.STACK_SIZE_TOTAL)
     s = none_sum([result, stack_base])
     return s if s != 0 else ""
 
@@ -130,46 +119,69 @@ def unique_filter(context, value):
     return value
 
 
-@jinja2.pass_context
-def assembly_filter(context, value):
-    renderer = context.parent.get("renderer", None)
+# Symbol names in comments, e.g.
+#   b8:	f000 f8de 	bleq	278 &lt:__aeabi_dmul+0x1dc&gt:
+assembly_symbol_reference_pattern = re.compile(r"&lt;(\w+)")
+
+# Labels of inlined symbols, e.g.
+#   _ZN6Stream9readBytesEPcj():
+# FIXME: Unfortunately symbols that have been inlined will not be in our global
+# symbol name list and we will not be able to unmangle them (this is only a problem
+# for c++ symbols).
+assembly_label_pattern = re.compile(r"^(_.*)\(\):$", re.MULTILINE)
+
+
+def link_assembly(renderer, text, context=None):
+    """
+    Replaces symbol references and labels in already escaped assembly `text` with
+    display names and links. `text` can be a single line or many lines joined by "\n",
+    each distinct symbol name is only looked up once.
+    """
+    linked_names = {}
+    label_names = {}
+
+    def linked_symbol_name(match):
+        name = match.group(1)
+        result = linked_names.get(name, None)
+        if result is None:
+            result = name
+            if context:
+                url = renderer.url_for_symbol_name(name, context)
+                if url:
+                    display_name = renderer.display_name_for_symbol_name(name)
+                    result = '<a href="%s">%s</a>' % (url, display_name)
+            linked_names[name] = result
+        return "&lt;" + result
 
-    def linked_symbol_name(name):
-        if context:
+    def display_name_for_label(match):
+        name = match.group(1)
+        result = label_names.get(name, None)
+        if result is None:
             display_name = renderer.display_name_for_symbol_name(name)
-            url = renderer.url_for_symbol_name(name, context)
-            if url:
-                return '<a href="%s">%s</a>' % (url, display_name)
-        return name
-
-    value = str(value)
-
-    # Get a clean display name - and a URL - for symbol names in comments
-    #   b8:	f000 f8de 	bleq	278 &lt:__aeabi_dmul+0x1dc&gt:
-    pattern = re.compile(r"&lt;(\w+)")
-    s = pattern.sub(lambda match: "&lt;" + linked_symbol_name(match.group(1)), value)
+            if display_name.endswith(")"):
+                # C++ symbols will include parenthesis and arguments
+                result = display_name + ":"
+            else:
+                # Other symbols will just have a name
+                result = display_name + "():"
+            label_names[name] = result
+        return result
 
-    # Get a clean display name for symbol names in labels
-    # _ZN6Stream9readBytesEPcj():
-    # FIXME: Unfortunately symbols that have been inlined will not be in our global
-    # symbol name list and we will not be able to unmangle them (this is only a problem
-    # for c++ symbols).
-    pattern = re.compile(r"^(_.*)\(\):$")
+    s = assembly_symbol_reference_pattern.sub(linked_symbol_name, text)
+    return assembly_label_pattern.sub(display_name_for_label, s)
 
-    def display_name_for_label(match):
-        display_name = renderer.display_name_for_symbol_name(match.group(1))
 
-        if display_name.endswith(")"):
-            # C++ symbols will include parenthesis and arguments
-            return display_name + ":"
-        else:
-            # Other symbols will just have a name
-            return display_name + "():"
+@jinja2.pass_context
+def assembly_filter(context, value):
+    renderer = context.parent.get("renderer", None)
+    return link_assembly(renderer, str(value), context)
 
-    s = pattern.sub(display_name_for_label, s)
 
-    return s
-    # return str("&lt;")
+@jinja2.pass_context
+def symbol_assembly_filter(context, symbol):
+    """Renders all assembly lines of a function at once, one line per row."""
+    renderer = renderer_from_context(context)
+    return renderer.assembly_html(symbol, context)
 
 
 @jinja2.pass_context
@@ -272,25 +284,54 @@ def sorted_filter(context, symbols):
     return list(sorted(symbols, key=key, reverse=(sort_order == "desc")))
 
 
+def buffered_stream(chunks, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Joins the many small strings Jinja generates into larger chunks. The first one is sent
+    right away so that the browser can show the page header while the rest is rendering.
+    """
+    buffer = []
+    buffered = chunk_size
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
 class HTMLRenderer(View):
-    def __init__(self, collector):
-        self.collector = collector
-        self.template_vars = {
-            "renderer": self,
-            "SLASH": '<span class="slash">/</span>',
-            "root_folders": list(collector.root_folders()),
-            "sort": "name_asc",
-            "all_symbols": collector.all_symbols(),
-            "all_functions": collector.all_functions(),
-            "all_variables": collector.all_variables(),
-            "now": datetime.now(),
-        }
+    # pages that can grow with the size of the analyzed binary
+    streamable = False
+
+    def __init__(self, collector, stream=False):
+        with server_timing.measure("init"):
+            collector = pinned_collector(collector)
+            self.collector = collector
+            self.stream = stream
+            self._query_suffix = None
+            self.template_vars = {
+                "renderer": self,
+                "SLASH": '<span class="slash">/</span>',
+                "root_folders": list(collector.root_folders()),
+                "sort": "name_asc",
+                "all_symbols": collector.all_symbols(),
+                "all_functions": collector.all_functions(),
+                "all_variables": collector.all_variables(),
+                "now": datetime.now(),
+            }
 
     def render_template(self, template_name, file_name):
         self.template_vars["sort"] = request.args.get("sort", "name_asc")
         self.template_vars["request"] = request
         self.template_vars[KEY_OUTPUT_FILE_NAME] = file_name
-        return render_template(template_name, **self.template_vars)
+        if self.stream and self.streamable:
+            # the first bytes are sent while the rest of the page is still rendering
+            return Response(buffered_stream(stream_template(template_name, **self.template_vars)))
+        with server_timing.measure("render"):
+            return render_template(template_name, **self.template_vars)
 
     def url_for_symbol_name(self, name, context=None):
         symbol = self.collector.symbol(name, False)
@@ -300,23 +341,61 @@ class HTMLRenderer(View):
         symbol = self.collector.symbol(name, False)
         return symbol["display_name"] if symbol else name
 
+    def assembly_html(self, symbol, context=None):
+        # links depend on the current query string, see url_for(). The cache holds one
+        # entry per symbol with a placeholder that is replaced per request.
+        key = self.collector.qualified_symbol_name(symbol)
+        cache = self.collector.cache.setdefault("assembly_html", {})
+        result = cache.get(key, None)
+        if result is None:
+            lines = self.collector.assembly_lines(symbol)
+            text = "\n".join([markupsafe.escape(line) for line in lines])
+            query_suffix, self._query_suffix = self._query_suffix, QUERY_SUFFIX_PLACEHOLDER
+            try:
+                result = link_assembly(self, text, context) + "\n" if lines else ""
+            finally:
+                self._query_suffix = query_suffix
+            cache[key] = result
+        return result.replace(QUERY_SUFFIX_PLACEHOLDER, self.query_suffix())
+
+    def query_suffix(self):
+        # views are instantiated per request, so the query string is encoded only once
+        if self._query_suffix is None:
+            query_string = urlencode(request.args.copy())
+            self._query_suffix = "?" + query_string if query_string else ""
+        return self._query_suffix
+
     def url_for(self, endpoint, **values):
         # Build the base URL for the endpoint
         result = url_for(endpoint, **values)
-        # Ensure result is a string (for tests with mocks)
-        result_str = str(result)
-        # Append current query parameters
-        args = request.args.copy()
-        query_string = urlencode(args)
-        return result_str + ("?" + query_string if query_string else "")
+        # Ensure result is a string (for tests with mocks), append current query parameters
+        return str(result) + self.query_suffix()
 
-    def url_for_symbol(self, value):
+    def base_url_for_symbol(self, value):
         if value[collector.TYPE] in [collector.TYPE_FUNCTION]:
-            return self.url_for("path", path=self.collector.qualified_symbol_name(value))
+            return url_for("path", path=self.collector.qualified_symbol_name(value))
 
         # file or folder
         path = value.get(collector.PATH, None)
-        return self.url_for("path", path=path) if path else ""
+        return url_for("path", path=path) if path else ""
+
+    def cached_base_url_for_symbol(self, value):
+        # base URLs are computed once per snapshot, see Collector.cache_key()
+        base_urls = self.collector.cache.setdefault("base_urls", {})
+        key, owner = self.collector.cache_key(value)
+        entry = base_urls.get(key, None)
+        if entry is None or entry[0] is not owner:
+            entry = (owner, str(self.base_url_for_symbol(value)))
+            base_urls[key] = entry
+
+        return entry[1]
+
+    def url_for_symbol(self, value):
+        base_url = self.cached_base_url_for_symbol(value)
+        return base_url + self.query_suffix() if base_url else ""
+
+    def call_tree_url(self, direction, symbol):
+        return url_for(direction, path=self.collector.qualified_symbol_name(symbol))
 
     def dispatch_request(self):
         return self.render_template(self.template, "index.html")
@@ -328,6 +407,8 @@ class OverviewRenderer(HTMLRenderer):
 
 
 class PathRenderer(HTMLRenderer):
+    streamable = True
+
     def dispatch_request(self, path=None):
         if path.endswith("/"):
             path = path[:-1]
@@ -370,6 +451,8 @@ class SymbolRenderer(HTMLRenderer):
 
 
 class AllSymbolsRenderer(HTMLRenderer):
+    streamable = True
+
     def dispatch_request(self, symbol_name=None):
         return self.render_template("all_symbols.html.jinja", "all")
 
@@ -386,35 +469,184 @@ class RackRenderer(HTMLRenderer):
         return self.render_template("rack.html.jinja", "rack")
 
 
-def register_jinja_filters(jinja_env):
-    jinja_env.filters["symbol_url"] = symbol_url_filter
-    jinja_env.filters["symbol_file_url"] = symbol_file_url_filter
-    jinja_env.filters["symbol_code_size"] = symbol_code_size_filter
-    jinja_env.filters["symbol_var_size"] = symbol_var_size_filter
-    jinja_env.filters["symbol_stack_size"] = symbol_stack_size_filter
-    jinja_env.filters["if_not_none"] = if_not_none_filter
-    jinja_env.filters["unique"] = unique_filter
-    jinja_env.filters["assembly"] = assembly_filter
-    jinja_env.filters["symbols"] = symbols_filter
-    jinja_env.filters["chain"] = chain_filter
-    jinja_env.filters["bytes"] = bytes_filter
-    jinja_env.filters["style_background_bar"] = style_background_bar_filter
-    jinja_env.filters["col_sortable"] = col_sortable_filter
-    jinja_env.filters["sorted"] = sorted_filter
-
-
-def register_urls(app, collector):
-    app.add_url_rule("/", view_func=OverviewRenderer.as_view("overview", collector=collector))
-    app.add_url_rule("/all/", view_func=AllSymbolsRenderer.as_view("all", collector=collector))
-    app.add_url_rule(
-        "/path/<path:path>/", view_func=PathRenderer.as_view("path", collector=collector)
-    )
-    app.add_url_rule(
-        "/symbol/<string:symbol_name>",
-        view_func=SymbolRenderer.as_view("symbol", collector=collector),
-    )
-    app.add_url_rule(
-        "/rack/",
-        view_func=RackRenderer.as_view("rack", collector=collector),
-        methods=["GET", "POST"],
-    )
+class CallTreeRenderer(HTMLRenderer):
+    """
+    One level of a function's callers or callees as JSON, so that the symbol page can expand
+    the call tree on demand. Supports ?sort=stack|size|name&offset=0&limit=50 and page, the
+    query string of the symbol page, which the links to the functions keep like all links do.
+    """
+
+    DEFAULT_LIMIT = 50
+    MAX_LIMIT = 1000
+
+    deepest_trees = {
+        collector.CALLERS: collector.DEEPEST_CALLER_TREE,
+        collector.CALLEES: collector.DEEPEST_CALLEE_TREE,
+    }
+
+    def __init__(self, collector, stream=False, direction=None):
+        # JSON only, none of HTMLRenderer's template variables are needed
+        self.collector = pinned_collector(collector)
+        self.direction = direction
+        self.deepest_tree = self.deepest_trees[direction]
+        self._query_suffix = None
+
+    def query_suffix(self):
+        # the query string of the symbol page, this request's own one is about the tree
+        if self._query_suffix is None:
+            query_string = urlencode(parse_qsl(request.args.get("page", "")))
+            self._query_suffix = "?" + query_string if query_string else ""
+        return self._query_suffix
+
+    def deepest_stack_size(self, function):
+        tree = function.get(self.deepest_tree, None)
+        return tree[0] if tree else function.get(collector.STACK_SIZE, None)
+
+    def node(self, function):
+        return {
+            "name": function[collector.NAME],
+            "display_name": function.get(collector.DISPLAY_NAME, function[collector.NAME]),
+            "url": self.url_for_symbol(function),
+            "tree_url": self.call_tree_url(self.direction, function),
+            "size": function.get(collector.SIZE, None),
+            "stack_size": function.get(collector.STACK_SIZE, None),
+            "deepest_stack_size": self.deepest_stack_size(function),
+            "count": len(function.get(self.direction, [])),
+        }
+
+    def int_arg(self, name, default, maximum=None):
+        value = request.args.get(name, default, type=int)
+        value = max(0, value)
+        return min(value, maximum) if maximum is not None else value
+
+    def dispatch_request(self, path=None):
+        symbol = self.collector.symbol(path)
+        if not symbol or symbol.get(collector.TYPE, None) != collector.TYPE_FUNCTION:
+            abort(404)
+
+        sort = request.args.get("sort", "stack")
+        key = {
+            "stack": lambda f: (-(self.deepest_stack_size(f) or 0), -(f.get(collector.SIZE) or 0)),
+            "size": lambda f: (-(f.get(collector.SIZE) or 0), -(self.deepest_stack_size(f) or 0)),
+            "name": lambda f: f.get(collector.DISPLAY_NAME, f[collector.NAME]).lower(),
+        }.get(sort, None)
+        if key is None:
+            abort(400)
+
+        offset = self.int_arg("offset", 0)
+        limit = self.int_arg("limit", self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        functions = sorted(symbol.get(self.direction, []), key=key)
+
+        return jsonify({
+            "direction": self.direction,
+            "sort": sort,
+            "symbol": self.node(symbol),
+            "total": len(functions),
+            "offset": offset,
+            "limit": limit,
+            "items": [self.node(f) for f in functions[offset : offset + limit]],
+        })
+
+
+class EventsView(View):
+    """
+    Server-sent events with the progress of rebuilds. Open pages show the progress and reload
+    as soon as the new snapshot has been published.
+    """
+
+    # send a comment at least this often (in seconds) so proxies keep the connection open
+    KEEPALIVE_INTERVAL = 15
+    # milliseconds the browser waits before reconnecting
+    RETRY = 2000
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def events(self, subscription):
+        try:
+            yield "retry: %d\n\n" % self.RETRY
+            while True:
+                try:
+                    event, data = subscription.get(timeout=self.KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+        finally:
+            self.broadcaster.unsubscribe(subscription)
+
+    def dispatch_request(self):
+        response = Response(self.events(self.broadcaster.subscribe()), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        # don't let reverse proxies buffer the events
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+
+class MetricsView(View):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def dispatch_request(self):
+        return Response(self.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def register_jinja_filters(jinja_env, server_timing=False):
+    filters = {
+        "symbol_url": symbol_url_filter,
+        "symbol_file_url": symbol_file_url_filter,
+        "symbol_code_size": symbol_code_size_filter,
+        "symbol_var_size": symbol_var_size_filter,
+        "symbol_stack_size": symbol_stack_size_filter,
+        "if_not_none": if_not_none_filter,
+        "unique": unique_filter,
+        "assembly": assembly_filter,
+        "symbol_assembly": symbol_assembly_filter,
+        "symbols": symbols_filter,
+        "chain": chain_filter,
+        "bytes": bytes_filter,
+        "style_background_bar": style_background_bar_filter,
+        "col_sortable": col_sortable_filter,
+        "sorted": sorted_filter,
+    }
+    for name, f in filters.items():
+        jinja_env.filters[name] = timed_filter(f) if server_timing else f
+
+
+def register_urls(app, collector, stream=False):
+    def view(renderer, name):
+        return renderer.as_view(name, collector=collector, stream=stream)
+
+    app.add_url_rule("/", view_func=view(OverviewRenderer, "overview"))
+    app.add_url_rule("/all/", view_func=view(AllSymbolsRenderer, "all"))
+    app.add_url_rule("/path/<path:path>/", view_func=view(PathRenderer, "path"))
+    app.add_url_rule("/symbol/<string:symbol_name>", view_func=view(SymbolRenderer, "symbol"))
+    app.add_url_rule("/rack/", view_func=view(RackRenderer, "rack"), methods=["GET", "POST"])
+    for direction in CallTreeRenderer.deepest_trees:
+        app.add_url_rule(
+            "/%s/<path:path>/" % direction,
+            view_func=CallTreeRenderer.as_view(direction, collector=collector, direction=direction),
+        )
+
+
+def register_events(app, broadcaster):
+    app.add_url_rule("/events/", view_func=EventsView.as_view("events", broadcaster=broadcaster))
+    app.jinja_env.globals["live_updates"] = True
+
+
+def register_metrics(app, metrics):
+    # long-lived or self-referential endpoints would only distort the latencies
+    untimed_endpoints = {"events", "metrics"}
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.teardown_request
+    def observe_request(error=None):
+        started = g.pop("request_started", None)
+        endpoint = request.endpoint or "unknown"
+        if started is not None and endpoint not in untimed_endpoints:
+            metrics.observe_request(endpoint, time.perf_counter() - started)
+
+    app.add_url_rule("/metrics", view_func=MetricsView.as_view("metrics", metrics=metrics))
@@ -0,0 +1,168 @@
+"""
+Writes the JSON reports of --generate-report.
+
+The symbols of a build are converted and written one at a time, so its report is never in
+memory as a whole. Reports are kept either in one JSON file with an entry per tag, which has
+to be rewritten for every new tag, or with --report-shards in a folder with one file per tag
+(optionally gzipped) and a small index of the tags. Adding a tag to such a folder only
+writes the report of this build and the index.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import urllib.parse
+
+INDENT = "    "
+INDEX_FILE = "index.json"
+
+
+class Stream:
+    """A list whose items are only produced while it's written, see write_json()."""
+
+    def __init__(self, items):
+        self.items = items
+        self.count = 0
+
+    def __iter__(self):
+        self.count = 0
+        for item in self.items:
+            self.count += 1
+            yield item
+
+
+def contains_stream(value):
+    return isinstance(value, Stream) or (
+        isinstance(value, dict) and any(contains_stream(v) for v in value.values())
+    )
+
+
+def write_json(f, value, level=0):
+    """
+    Like json.dump(value, f, indent=4, ensure_ascii=False), but writes the items of Streams
+    as they are produced.
+    """
+    if not contains_stream(value):
+        text = json.dumps(value, indent=4, ensure_ascii=False)
+        f.write(text.replace("\n", "\n" + INDENT * level) if level else text)
+    elif isinstance(value, dict):
+        separator = "{\n"
+        for key, item in value.items():
+            f.write(separator + INDENT * (level + 1) + json.dumps(key, ensure_ascii=False) + ": ")
+            write_json(f, item, level + 1)
+            separator = ",\n"
+        f.write("\n" + INDENT * level + "}")
+    else:
+        separator = "[\n"
+        for item in value:
+            f.write(separator + INDENT * (level + 1))
+            write_json(f, item, level + 1)
+            separator = ",\n"
+        f.write("[]" if separator == "[\n" else "\n" + INDENT * level + "]")
+
+
+def tag_entry(collector, stack_functions=None, report_type="json"):
+    """The report of the collector's build, with Streams of its functions and variables."""
+    entry = {"timestamp": datetime.datetime.now().isoformat()}
+    if stack_functions:
+        entry["stack_report"] = collector.report_max_static_stack_usages_from_function_names(
+            stack_functions, report_type
+        )
+    entry["functions"] = Stream(collector.report_symbols(functions=True))
+    entry["variables"] = Stream(collector.report_symbols(functions=False))
+    return entry
+
+
+def replace_file(path, write, compress=False):
+    """Calls write() with a new text file that replaces path once it's complete."""
+    staging = path + ".new"
+    if compress:
+        f = gzip.open(staging, "wt", encoding="utf-8", compresslevel=6)
+    else:
+        f = open(staging, "w", encoding="utf-8")
+    try:
+        with f:
+            write(f)
+    except BaseException:
+        os.remove(staging)
+        raise
+    os.replace(staging, path)
+
+
+def shard_file_name(tag, compress=False):
+    # tags are often branch names, e.g. feature/foo
+    return urllib.parse.quote(tag, safe="") + (".json.gz" if compress else ".json")
+
+
+def read_index(folder):
+    path = os.path.join(folder, INDEX_FILE)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_tag(folder, tag):
+    """The report of one tag of a folder written by write_shard()."""
+    name = read_index(folder)[tag]["file"]
+    path = os.path.join(folder, name)
+    with (gzip.open if name.endswith(".gz") else open)(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_shard(folder, tag, entry, compress=False):
+    """Writes the report of one tag into its own file of folder and adds it to the index."""
+    write_shards(folder, [(tag, entry)], compress)
+
+
+def write_shards(folder, entries, compress=False):
+    """Like write_shard() for each (tag, entry) of entries, but writes the index only once."""
+    os.makedirs(folder, exist_ok=True)
+    index = read_index(folder)
+    obsolete = []
+    for tag, entry in entries:
+        name = shard_file_name(tag, compress)
+        replace_file(os.path.join(folder, name), lambda f: write_json(f, entry), compress)
+        previous = index.get(tag, {}).get("file", None)
+        if previous and previous != name:
+            # the tag has been written with(out) --report-gzip before
+            obsolete.append(previous)
+        index[tag] = {
+            "file": name,
+            "timestamp": entry["timestamp"],
+            "functions": entry["functions"].count,
+            "variables": entry["variables"].count,
+        }
+    replace_file(
+        os.path.join(folder, INDEX_FILE),
+        lambda f: json.dump(index, f, indent=4, ensure_ascii=False),
+    )
+    for name in obsolete:
+        os.remove(os.path.join(folder, name))
+
+
+def write_single_file(path, entries):
+    """Adds the report of each tag of entries to the JSON file at path, which keeps the others."""
+    report = {}
+    if os.path.isfile(path):
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+    report.update(entries)
+    replace_file(path, lambda f: write_json(f, report))
+
+
+def generate_report(
+    collector,
+    filename,
+    tag,
+    stack_functions=None,
+    report_type="json",
+    shards=False,
+    compress=False,
+):
+    entry = tag_entry(collector, stack_functions, report_type)
+    if shards:
+        write_shard(filename, tag, entry, compress)
+    else:
+        write_single_file(filename + ".json", {tag: entry})
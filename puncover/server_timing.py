@@ -0,0 +1,107 @@
+"""
+Server-Timing response headers that break down the time spent on a request, see
+--server-timing. Browsers show them in the network tab of their developer tools.
+
+ServerTimingMiddleware attaches a ServerTiming to each request. The phases measured with
+it exclude the phases nested in them, e.g. "render" doesn't include "filters".
+"""
+
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from flask import has_request_context, request
+
+ENVIRON_KEY = "puncover.server_timing"
+
+DESCRIPTIONS = {
+    "build": "build_if_needed",
+    "lock": "waiting for the snapshot",
+    "init": "renderer setup",
+    "filters": "template filters",
+    "render": "Jinja output",
+    "other": "routing and everything else",
+}
+
+
+class ServerTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        # (start, time spent in nested phases) of the running phases
+        self.running = []
+
+    def begin(self):
+        self.running.append([time.perf_counter(), 0.0])
+
+    def end(self, name):
+        start, nested = self.running.pop()
+        elapsed = time.perf_counter() - start
+        self.durations[name] = self.durations.get(name, 0.0) + elapsed - nested
+        if self.running:
+            self.running[-1][1] += elapsed
+
+    @contextmanager
+    def measure(self, name):
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def header(self):
+        total = time.perf_counter() - self.started
+        entries = list(self.durations.items())
+        entries.append(("other", max(0.0, total - sum(self.durations.values()))))
+        entries.append(("total", total))
+        return ", ".join(
+            '%s;desc="%s";dur=%.2f' % (name, DESCRIPTIONS[name], seconds * 1000)
+            if name in DESCRIPTIONS
+            else "%s;dur=%.2f" % (name, seconds * 1000)
+            for name, seconds in entries
+        )
+
+
+def current():
+    """The ServerTiming of the current request, None if there is none."""
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY, None)
+
+
+def measure(name):
+    timing = current()
+    return timing.measure(name) if timing else nullcontext()
+
+
+def timed_filter(f):
+    """Wraps a Jinja filter so that its calls count as the "filters" phase."""
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        timing = current()
+        if timing is None:
+            return f(*args, **kwargs)
+        timing.begin()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            timing.end("filters")
+
+    return wrapper
+
+
+class ServerTimingMiddleware(object):
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        timing = ServerTiming()
+        environ[ENVIRON_KEY] = timing
+
+        # headers of streamed pages are sent before the page has been rendered
+        def start_response_with_timing(status, headers, exc_info=None):
+            headers = list(headers) + [("Server-Timing", timing.header())]
+            return start_response(status, headers, exc_info)
+
+        return self.app(environ, start_response_with_timing)
@@ -0,0 +1,118 @@
+"""
+Pre-forking HTTP server for sharing one report with many users.
+
+The parent process analyses the binary once, then forks a pool of workers that accept
+connections on a shared listening socket. The workers never rebuild, they all serve the
+snapshot the parent loaded and share its memory pages copy-on-write.
+"""
+
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+
+from werkzeug.serving import make_server, select_address_family
+
+# a worker that exits this soon after being started most likely can't start at all
+EARLY_EXIT_SECONDS = 5
+# restarts of early exits are delayed by 0.1s, 0.2s, 0.4s, ... until the parent gives up
+MAX_EARLY_EXITS = 5
+
+
+def create_listener(host, port, backlog=128):
+    family = select_address_family(host, port)
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+def run_worker(app, host, listener):
+    # Ctrl+C reaches the whole process group, let the parent shut the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # threads keep slow clients (e.g. of streamed pages) from blocking the worker
+    server = make_server(host, listener.getsockname()[1], app, threaded=True, fd=listener.fileno())
+    server.serve_forever()
+
+
+def spawn_worker(app, host, listener):
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            run_worker(app, host, listener)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def serve(app, host, port, workers):
+    if not hasattr(os, "fork"):
+        print("Pre-forking workers are not supported on this platform, using a single process.")
+        app.run(host=host, port=port)
+        return
+
+    listener = create_listener(host, port)
+
+    # Everything allocated so far (most notably the collector's snapshot) moves to the
+    # permanent generation. Collections in the workers then don't touch these objects, which
+    # would otherwise copy every page they live on.
+    gc.collect()
+    gc.freeze()
+
+    pids = {}
+    stopping = False
+    early_exits = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        pids[spawn_worker(app, host, listener)] = time.monotonic()
+    print(" * Serving on http://{}:{}/ with {} workers".format(host, port, workers))
+
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = pids.pop(pid, None)
+        if stopping:
+            continue
+
+        exit_code = os.waitstatus_to_exitcode(status)
+        if started is not None and time.monotonic() - started < EARLY_EXIT_SECONDS:
+            early_exits += 1
+        else:
+            early_exits = 0
+        if early_exits >= MAX_EARLY_EXITS:
+            print("workers keep exiting right after starting ({}), giving up".format(exit_code))
+            stop(None, None)
+            continue
+
+        print("worker {} exited unexpectedly ({}), restarting it".format(pid, exit_code))
+        if early_exits:
+            time.sleep(0.1 * 2 ** (early_exits - 1))
+        if not stopping:
+            pids[spawn_worker(app, host, listener)] = time.monotonic()
+
+    listener.close()
+    if early_exits >= MAX_EARLY_EXITS:
+        raise Exception("Workers could not be started, see their errors above")
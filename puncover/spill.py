@@ -0,0 +1,80 @@
+"""
+Keeps the assembly of all functions in a memory-mapped temporary file instead of Python
+strings, see --spill-assembly.
+
+Collector.spill_assembly() creates a SpillFile before the ELF file is parsed. From then on,
+the lines of each symbol are appended to it as the symbol is added, and the symbol only keeps
+SpilledLines, which know where its lines are in the file and decode them when they are read.
+analyze_assembly() decodes one symbol at a time and appends the annotated lines to a new
+SpillFile, which replaces the first one. Pages and reports read SpilledLines like any other
+list of lines.
+"""
+
+import mmap
+import tempfile
+from collections.abc import Sequence
+
+
+class SpillFile:
+    """Append-only temporary file, memory-mapped for reading once it's sealed."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.map = None
+
+    def append(self, lines):
+        data = "\n".join(lines).encode("utf-8")
+        self.file.write(data)
+        result = SpilledLines(self, self.size, len(data), len(lines))
+        self.size += len(data)
+        return result
+
+    def seal(self):
+        self.file.flush()
+        # an empty file can't be mapped, but then there is nothing to read either
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, length):
+        if not length:
+            return ""
+        return self.map[offset : offset + length].decode("utf-8")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class SpilledLines(Sequence):
+    """Read-only list of lines stored in a SpillFile."""
+
+    __slots__ = ("spill_file", "offset", "length", "count")
+
+    def __init__(self, spill_file, offset, length, count):
+        self.spill_file = spill_file
+        self.offset = offset
+        self.length = length
+        self.count = count
+
+    def lines(self):
+        return self.spill_file.read(self.offset, self.length).split("\n")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.lines()[index]
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SpilledLines)):
+            return self.lines() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "SpilledLines(%d lines at %d)" % (self.count, self.offset)
@@ -0,0 +1,215 @@
+"""
+Stages of the analysis pipeline.
+
+Builder and Collector run each step of a build inside a named stage and count the items it
+processes. Listeners subscribe to the stages, e.g. to print them on the console or to push
+the progress to open browser tabs.
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageListener:
+    """Observer of the analysis pipeline, subclasses override what they are interested in."""
+
+    def build_started(self):
+        pass
+
+    def stage_started(self, stage):
+        pass
+
+    def stage_progress(self, stage):
+        pass
+
+    def stage_finished(self, stage):
+        pass
+
+    def build_finished(self):
+        """A new snapshot has been published."""
+        pass
+
+    def build_failed(self, error):
+        pass
+
+
+class Stage:
+    def __init__(self, name, message=None, total=None):
+        self.name = name
+        self.message = message
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def eta(self):
+        """Estimated seconds until this stage finishes, None if unknown."""
+        if self.finished:
+            return 0
+        if not self.total or not self.done:
+            return None
+        return self.elapsed() * (self.total - self.done) / self.done
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "message": self.message,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": self.elapsed(),
+            "eta": self.eta(),
+            "finished": self.finished is not None,
+        }
+
+
+class ConsoleListener(StageListener):
+    def stage_started(self, stage):
+        if stage.message:
+            print(stage.message)
+
+
+class Stages:
+    # listeners hear about the progress of a stage at most this often (in seconds)
+    PROGRESS_INTERVAL = 0.25
+    # items processed between two checks of the clock
+    PROGRESS_BATCH = 256
+
+    def __init__(self):
+        self.listeners = [ConsoleListener()]
+        self.current = None
+
+    def notify(self, method, *args):
+        for listener in list(self.listeners):
+            getattr(listener, method)(*args)
+
+    @contextmanager
+    def build(self):
+        self.notify("build_started")
+        try:
+            yield
+        except Exception as e:
+            self.notify("build_failed", e)
+            raise
+        self.notify("build_finished")
+
+    @contextmanager
+    def stage(self, name, message=None, total=None):
+        stage = Stage(name, message, total)
+        previous = self.current
+        self.current = stage
+        self.notify("stage_started", stage)
+        try:
+            yield stage
+        finally:
+            self.current = previous
+            stage.finished = time.monotonic()
+            self.notify("stage_finished", stage)
+
+    def track(self, items):
+        """Iterates over items and counts them as progress of the current stage."""
+        stage = self.current
+        if stage is None:
+            return items
+        if stage.total is None and hasattr(items, "__len__"):
+            stage.total = len(items)
+        return self.tracked(stage, items)
+
+    def relay(self, connection):
+        """Notifies the listeners of the stages a StageSender sends until it's closed."""
+        started = []
+        while True:
+            try:
+                method, name, message, total, done = connection.recv()
+            except EOFError:
+                return
+            if method == "stage_started":
+                started.append(Stage(name, message, total))
+            stage = started[-1]
+            stage.total = total
+            stage.done = done
+            if method == "stage_finished":
+                started.pop()
+                stage.finished = time.monotonic()
+            self.notify(method, stage)
+
+    def tracked(self, stage, items):
+        next_report = time.monotonic() + self.PROGRESS_INTERVAL
+        for item in items:
+            yield item
+            stage.done += 1
+            if stage.done % self.PROGRESS_BATCH == 0 and time.monotonic() >= next_report:
+                self.notify("stage_progress", stage)
+                next_report = time.monotonic() + self.PROGRESS_INTERVAL
+
+
+class StageSender(StageListener):
+    """Sends the stages of a build in another process to the Stages.relay() of the parent."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def send(self, method, stage):
+        self.connection.send((method, stage.name, stage.message, stage.total, stage.done))
+
+    def stage_started(self, stage):
+        self.send("stage_started", stage)
+
+    def stage_progress(self, stage):
+        self.send("stage_progress", stage)
+
+    def stage_finished(self, stage):
+        self.send("stage_finished", stage)
+
+
+class ProgressBroadcaster(StageListener):
+    """Passes the pipeline's events on to any number of subscribers, e.g. open browser tabs."""
+
+    def __init__(self, max_queued=100):
+        self.max_queued = max_queued
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(self.max_queued)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, event, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                # a client that doesn't keep up only needs the latest state
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait((event, data))
+
+    def build_started(self):
+        self.publish("build", {})
+
+    def stage_started(self, stage):
+        self.publish("stage", stage.as_dict())
+
+    def stage_progress(self, stage):
+        self.publish("stage", stage.as_dict())
+
+    def stage_finished(self, stage):
+        self.publish("stage", stage.as_dict())
+
+    def build_finished(self):
+        self.publish("snapshot", {"published": time.time()})
+
+    def build_failed(self, error):
+        self.publish("error", {"message": str(error)})
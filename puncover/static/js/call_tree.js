@@ -0,0 +1,135 @@
+// Expands the callers/callees of a function on demand, one level and page at a time.
+// Every <div class="call-tree" data-url="..."> is filled from the JSON returned by data-url.
+(function () {
+    "use strict";
+
+    var PAGE_SIZE = 50;
+
+    function element(tag, className, text) {
+        var e = document.createElement(tag);
+        if (className) {
+            e.className = className;
+        }
+        if (text !== undefined) {
+            e.textContent = text;
+        }
+        return e;
+    }
+
+    function formatBytes(n) {
+        return n === null || n === undefined ? "" : n.toLocaleString("en-US");
+    }
+
+    function load(url, sort, offset, callback) {
+        var query = "?sort=" + encodeURIComponent(sort) + "&offset=" + offset + "&limit=" + PAGE_SIZE;
+        // links to the functions keep the query string of this page, like all other links
+        var page = window.location.search.substring(1);
+        if (page) {
+            query += "&page=" + encodeURIComponent(page);
+        }
+        fetch(url + query)
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status + " " + response.statusText);
+                }
+                return response.json();
+            })
+            .then(callback)
+            .catch(function (error) {
+                console.error("failed to load " + url, error);
+            });
+    }
+
+    function renderItem(tree, item) {
+        var li = element("li");
+        var toggle = element("span", "call-tree-toggle", item.count > 0 ? "▸" : "");
+        li.appendChild(toggle);
+
+        var link = element("a", "icon-function", item.display_name);
+        link.href = item.url;
+        li.appendChild(link);
+
+        var details = [];
+        if (item.size) {
+            details.push(formatBytes(item.size) + " bytes");
+        }
+        if (item.stack_size !== null) {
+            details.push("stack " + formatBytes(item.stack_size));
+        }
+        if (item.deepest_stack_size !== null && item.deepest_stack_size !== item.stack_size) {
+            details.push("deepest " + formatBytes(item.deepest_stack_size));
+        }
+        if (item.count > 0) {
+            details.push(item.count + " " + tree.direction);
+        }
+        li.appendChild(element("span", "secondary call-tree-details", details.join(", ")));
+
+        if (item.count > 0) {
+            var children = null;
+            toggle.addEventListener("click", function () {
+                if (children === null) {
+                    children = element("ul");
+                    li.appendChild(children);
+                    loadPage(tree, children, item.tree_url, 0);
+                } else {
+                    children.hidden = !children.hidden;
+                }
+                toggle.textContent = children.hidden ? "▸" : "▾";
+            });
+        }
+        return li;
+    }
+
+    function loadPage(tree, ul, url, offset) {
+        load(url, tree.sort, offset, function (data) {
+            tree.direction = data.direction;
+            data.items.forEach(function (item) {
+                ul.appendChild(renderItem(tree, item));
+            });
+
+            var remaining = data.total - (data.offset + data.items.length);
+            if (remaining > 0) {
+                var li = element("li");
+                var more = element("a", "call-tree-more", remaining + " more…");
+                more.href = "#";
+                more.addEventListener("click", function (event) {
+                    event.preventDefault();
+                    ul.removeChild(li);
+                    loadPage(tree, ul, url, data.offset + data.items.length);
+                });
+                li.appendChild(more);
+                ul.appendChild(li);
+            }
+        });
+    }
+
+    function initTree(container) {
+        var tree = { sort: "stack", direction: "" };
+        var toolbar = element("div", "call-tree-sort secondary", "sort by ");
+        var ul = element("ul");
+
+        ["stack", "size", "name"].forEach(function (sort) {
+            var a = element("a", sort === tree.sort ? "active" : "", sort);
+            a.href = "#";
+            a.addEventListener("click", function (event) {
+                event.preventDefault();
+                tree.sort = sort;
+                toolbar.querySelectorAll("a").forEach(function (other) {
+                    other.className = other === a ? "active" : "";
+                });
+                ul.textContent = "";
+                loadPage(tree, ul, container.dataset.url, 0);
+            });
+            toolbar.appendChild(a);
+            toolbar.appendChild(document.createTextNode(" "));
+        });
+
+        container.appendChild(toolbar);
+        container.appendChild(ul);
+        loadPage(tree, ul, container.dataset.url, 0);
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".call-tree[data-url]").forEach(initTree);
+    });
+})();
@@ -0,0 +1,48 @@
+// Shows the progress of a rebuild and reloads the page once the new snapshot is available.
+// The events are read from the data-events-url of this <script> element.
+(function () {
+    "use strict";
+
+    var url = document.currentScript.dataset.eventsUrl;
+    var banner = null;
+
+    function showBanner(text, className) {
+        if (banner === null) {
+            banner = document.createElement("div");
+            document.body.insertBefore(banner, document.body.firstChild);
+        }
+        banner.className = "live-banner " + (className || "");
+        banner.textContent = text;
+    }
+
+    function formatStage(stage) {
+        var text = "Rebuilding: " + (stage.message || stage.name);
+        if (stage.total) {
+            text += " (" + stage.done.toLocaleString("en-US") + " / " +
+                stage.total.toLocaleString("en-US") + ")";
+        }
+        if (stage.eta !== null && !stage.finished) {
+            text += ", about " + Math.ceil(stage.eta) + " s left";
+        }
+        return text + "…";
+    }
+
+    var events = new EventSource(url);
+    events.addEventListener("build", function () {
+        showBanner("Rebuilding…");
+    });
+    events.addEventListener("stage", function (event) {
+        showBanner(formatStage(JSON.parse(event.data)));
+    });
+    events.addEventListener("snapshot", function () {
+        events.close();
+        showBanner("Reloading…");
+        window.location.reload();
+    });
+    events.addEventListener("error", function (event) {
+        // connection errors are plain events without data, EventSource reconnects by itself
+        if (event.data) {
+            showBanner("Rebuilding failed: " + JSON.parse(event.data).message, "live-banner-error");
+        }
+    });
+})();
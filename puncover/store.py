@@ -0,0 +1,531 @@
+"""
+Keeps an analyzed snapshot in an SQLite file instead of memory, see --store and --snapshot.
+
+write_store() saves symbols, files and folders with all their attributes and relations
+(callers, callees, siblings, ancestors, deepest call trees, ...) into indexed tables.
+StoreCollector answers the queries of pages and reports from these tables. It loads each
+element only when it's needed, as a Record that fetches its relations from the file the
+first time they are read. Records that are no longer referenced are freed, so memory
+depends on what the current requests read rather than on the size of the image.
+
+The file is complete and versioned (SNAPSHOT_VERSION), i.e. it can be served elsewhere
+without the ELF file or a toolchain. It is never modified after it has been written.
+"""
+
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections.abc import Mapping, Sequence
+
+from puncover import collector
+from puncover.collector import Collector
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE elements (
+    id INTEGER PRIMARY KEY,
+    -- symbol, file or folder
+    kind TEXT NOT NULL,
+    -- position of symbols in Collector.all_symbols()
+    rank INTEGER,
+    address INTEGER,
+    name TEXT,
+    qualified_name TEXT,
+    type TEXT,
+    path TEXT,
+    -- folder of files and folders
+    parent INTEGER,
+    attrs TEXT NOT NULL
+);
+CREATE TABLE links (
+    source INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    PRIMARY KEY (source, key, position)
+) WITHOUT ROWID;
+-- zlib-compressed JSON lists of lines
+CREATE TABLE assembly (id INTEGER PRIMARY KEY, lines BLOB NOT NULL);
+"""
+
+INDEXES = """
+CREATE INDEX elements_rank ON elements (kind, rank);
+CREATE INDEX elements_address ON elements (address);
+CREATE INDEX elements_name ON elements (name);
+CREATE INDEX elements_qualified_name ON elements (qualified_name);
+CREATE INDEX elements_path ON elements (path);
+CREATE INDEX elements_parent ON elements (parent);
+"""
+
+# tells snapshots apart from other SQLite files, "PUNC"
+APPLICATION_ID = 0x50554E43
+# increased with every change of the tables or of the attributes of elements
+SNAPSHOT_VERSION = 1
+
+# bytes of a snapshot that SQLite reads through a memory map instead of read() calls
+MMAP_SIZE = 2**30
+
+# the attribute of a record that says how to load its other attributes
+MARKERS = "@"
+
+# entries of each of the collector's caches (rendered pages, URLs, ...) kept at most
+CACHE_ENTRIES = 10000
+
+
+def add_totals(c):
+    """
+    Sums the symbols of each file and folder up once, bottom-up, instead of on each page,
+    see collector.symbol_traverse().
+    """
+
+    def add(e):
+        for sub_folder in e.get(collector.SUB_FOLDERS, []):
+            add(sub_folder)
+        for f in e.get(collector.FILES, []):
+            add(f)
+        for key, func in collector.TOTALS.items():
+            e[key] = collector.symbol_traverse(e, func, key)
+
+    for folder in c.root_folders():
+        add(folder)
+    # files outside of any folder
+    for f in c.all_files():
+        if collector.TOTALS.keys() - f.keys():
+            add(f)
+
+
+def is_element(value):
+    return isinstance(value, dict)
+
+
+def write_store(c, path, meta=None):
+    """
+    Writes the snapshot of collector c to a new SQLite file at path. meta are strings that
+    describe the snapshot, e.g. the ELF file it was built from.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    add_totals(c)
+
+    ids = {}
+    elements = []
+    for s in c.symbols.values():
+        ids[id(s)] = len(ids) + 1
+        elements.append(("symbol", s))
+    for e in c.file_elements.values():
+        ids[id(e)] = len(ids) + 1
+        elements.append((e[collector.TYPE], e))
+    ranks = {id(s): i for i, s in enumerate(c.all_symbols())}
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        rows = []
+        links = []
+        assembly = []
+        for kind, e in elements:
+            element_id = ids[id(e)]
+            attrs, markers = encode(c, e, element_id, ids, links, assembly)
+            if markers:
+                attrs[MARKERS] = markers
+            folder = e.get(collector.FOLDER, None) if kind != "symbol" else None
+            rows.append((
+                element_id,
+                kind,
+                ranks.get(id(e), None),
+                int(e[collector.ADDRESS], 16) if kind == "symbol" else None,
+                e.get(collector.NAME, None),
+                c.qualified_symbol_name(e) if kind == "symbol" else None,
+                e.get(collector.TYPE, None),
+                str(e[collector.PATH]) if collector.PATH in e else None,
+                ids[id(folder)] if folder else None,
+                json.dumps(attrs, separators=(",", ":")),
+            ))
+        connection.executemany("INSERT INTO elements VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+        connection.executemany("INSERT INTO links VALUES (?,?,?,?)", links)
+        connection.executemany("INSERT INTO assembly VALUES (?,?)", assembly)
+        connection.executescript(INDEXES)
+        meta = dict(meta or {}, created=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        connection.executemany("INSERT INTO meta VALUES (?,?)", sorted(meta.items()))
+        connection.execute("PRAGMA application_id = %d" % APPLICATION_ID)
+        connection.execute("PRAGMA user_version = %d" % SNAPSHOT_VERSION)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def encode(c, e, element_id, ids, links, assembly):
+    """
+    Splits element e into the attributes that are stored as JSON and its relations, which
+    are appended to links. markers tells how to restore the attributes that aren't JSON.
+    """
+    attrs = {}
+    markers = {}
+    for key, value in e.items():
+        if key == collector.ASM:
+            lines = json.dumps(list(c.decoded_assembly(e)))
+            assembly.append((element_id, zlib.compress(lines.encode())))
+            markers[key] = "asm"
+        elif isinstance(value, pathlib.PurePath):
+            attrs[key] = str(value)
+            markers[key] = "path"
+        elif is_element(value):
+            markers[key] = ["one", ids[id(value)]]
+        elif isinstance(value, list) and all(is_element(v) for v in value):
+            links.extend((element_id, key, i, ids[id(v)]) for i, v in enumerate(value))
+            markers[key] = "many"
+        elif isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], list):
+            # deepest call trees, (stack size, [e, next, ...]), usually continue with the
+            # tree of the next function, see BacktraceHelper.deepest_call_tree()
+            size, functions = value
+            following = functions[1].get(key, None) if len(functions) > 1 else None
+            if len(functions) == 1:
+                markers[key] = ["tree", size, None]
+            elif (
+                following
+                and len(following[1]) == len(functions) - 1
+                and all(a is b for a, b in zip(following[1], functions[1:]))
+            ):
+                markers[key] = ["tree", size, ids[id(functions[1])]]
+            else:
+                links.extend((element_id, key, i, ids[id(v)]) for i, v in enumerate(functions))
+                markers[key] = ["path", size]
+        else:
+            attrs[key] = value
+    return attrs, markers
+
+
+class Record(dict):
+    """An element of a stored snapshot. Relations are fetched when they're read first."""
+
+    __slots__ = ("store", "id", "__weakref__")
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is Unloaded:
+            value = self.store.load(self, key, value.marker)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+
+class Unloaded:
+    __slots__ = ("marker",)
+
+    def __init__(self, marker):
+        self.marker = marker
+
+
+class Store:
+    """A read-only SQLite snapshot, shared by the threads of a process."""
+
+    COLUMNS = "e.id, e.attrs"
+
+    def __init__(self, path):
+        self.path = path
+        # snapshots are replaced instead of modified, so SQLite can skip locking them
+        self.uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro&immutable=1"
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        # every element is loaded only once while it's referenced
+        self.records = weakref.WeakValueDictionary()
+        if not os.path.isfile(path):
+            raise Exception("Snapshot %s doesn't exist" % path)
+        try:
+            application_id = self.query("PRAGMA application_id").fetchone()[0]
+            version = self.query("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError:
+            # e.g. not an SQLite file at all
+            application_id = version = None
+        if application_id != APPLICATION_ID:
+            self.close()
+            raise Exception("%s is not a puncover snapshot" % path)
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise Exception(
+                "%s is a snapshot of version %d, this puncover reads version %d, please "
+                "analyze the ELF file again" % (path, version, SNAPSHOT_VERSION)
+            )
+
+    def connection(self):
+        # connections can neither be used by forked processes nor by several threads at once
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            self.local.connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            self.local.connection.execute("PRAGMA mmap_size = %d" % MMAP_SIZE)
+            self.local.pid = pid
+            with self.lock:
+                self.connections.append(self.local.connection)
+        return self.local.connection
+
+    def query(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def meta(self):
+        return dict(self.query("SELECT key, value FROM meta"))
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+        self.records = weakref.WeakValueDictionary()
+
+    def record(self, row):
+        element_id, attrs = row
+        with self.lock:
+            result = self.records.get(element_id, None)
+        if result is not None:
+            return result
+
+        result = Record(json.loads(attrs))
+        result.store = self
+        result.id = element_id
+        for key, marker in result.pop(MARKERS, {}).items():
+            if marker == "path":
+                dict.__setitem__(result, key, pathlib.Path(result[key]))
+            else:
+                dict.__setitem__(result, key, Unloaded(marker))
+        with self.lock:
+            # another thread might have loaded it meanwhile
+            return self.records.setdefault(element_id, result)
+
+    def element(self, element_id):
+        with self.lock:
+            result = self.records.get(element_id, None)
+        return result if result is not None else self.records_where("e.id = ?", (element_id,))[0]
+
+    def records_where(self, where, params=(), order="e.id"):
+        sql = "SELECT %s FROM elements e WHERE %s ORDER BY %s" % (self.COLUMNS, where, order)
+        return [self.record(row) for row in self.query(sql, params)]
+
+    def linked(self, element_id, key):
+        rows = self.query(
+            "SELECT %s FROM links l JOIN elements e ON e.id = l.target "
+            "WHERE l.source = ? AND l.key = ? ORDER BY l.position" % self.COLUMNS,
+            (element_id, key),
+        )
+        return [self.record(row) for row in rows]
+
+    def load(self, record, key, marker):
+        if marker == "asm":
+            row = self.query("SELECT lines FROM assembly WHERE id = ?", (record.id,)).fetchone()
+            return json.loads(zlib.decompress(row[0])) if row else []
+        if marker == "many":
+            return self.linked(record.id, key)
+        if marker[0] == "one":
+            return self.element(marker[1])
+        if marker[0] == "path":
+            return (marker[1], self.linked(record.id, key))
+
+        # ["tree", size, next]: the tree continues with the one of the next function
+        functions = [record]
+        following = marker[2]
+        while following is not None:
+            function = self.element(following)
+            value = dict.__getitem__(function, key)
+            if type(value) is not Unloaded or value.marker[0] != "tree":
+                functions.extend(function[key][1])
+                break
+            functions.append(function)
+            following = value.marker[2]
+        return (marker[1], functions)
+
+
+class Elements(Mapping):
+    """Elements of a stored snapshot by one of their columns, e.g. Collector.symbols."""
+
+    def __init__(self, store, column, where, key=None):
+        self.store = store
+        self.column = column
+        self.selection = where
+        # the last one wins, like in the dictionaries of Collector
+        self.where = "%s AND e.id IN (SELECT MAX(e.id) FROM elements e WHERE %s GROUP BY e.%s)" % (
+            where,
+            where,
+            column,
+        )
+        self.key = key or (lambda value: value)
+
+    def __getitem__(self, key):
+        records = self.store.records_where(
+            "%s AND e.%s = ?" % (self.selection, self.column),
+            (str(key) if isinstance(key, pathlib.PurePath) else key,),
+            order="e.id DESC LIMIT 1",
+        )
+        if not records:
+            raise KeyError(key)
+        return records[0]
+
+    def __iter__(self):
+        sql = "SELECT e.%s FROM elements e WHERE %s ORDER BY e.id" % (self.column, self.where)
+        return (self.key(row[0]) for row in self.store.query(sql))
+
+    def __len__(self):
+        return len(self.values())
+
+    def values(self):
+        return Rows(self.store, self.where)
+
+    def items(self):
+        sql = "SELECT e.%s, %s FROM elements e WHERE %s ORDER BY e.id" % (
+            self.column,
+            self.store.COLUMNS,
+            self.where,
+        )
+        return ((self.key(row[0]), self.store.record(row[1:])) for row in self.store.query(sql))
+
+
+class Rows(Sequence):
+    """
+    Elements in the order of a query, loaded while they are iterated. Pages iterate the same
+    rows several times (sums, sorting, ...), so they stay loaded as long as this object lives,
+    e.g. for a request.
+    """
+
+    def __init__(self, store, where, order="e.id"):
+        self.store = store
+        self.where = where
+        self.order = order
+        self.loaded = None
+
+    def __iter__(self):
+        if self.loaded is not None:
+            return iter(self.loaded)
+        return self.load()
+
+    def load(self):
+        sql = "SELECT %s FROM elements e WHERE %s ORDER BY %s" % (
+            self.store.COLUMNS,
+            self.where,
+            self.order,
+        )
+        loaded = []
+        # rows are fetched in batches, records are created one at a time
+        for row in self.store.query(sql):
+            record = self.store.record(row)
+            loaded.append(record)
+            yield record
+        self.loaded = loaded
+
+    def __len__(self):
+        if self.loaded is not None:
+            return len(self.loaded)
+        sql = "SELECT COUNT(*) FROM elements e WHERE %s" % self.where
+        return self.store.query(sql).fetchone()[0]
+
+    def __getitem__(self, index):
+        if self.loaded is not None:
+            return self.loaded[index]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self.store.records_where(
+                self.where,
+                order="%s LIMIT %d OFFSET %d" % (self.order, max(0, stop - start), start),
+            )
+        if index < 0:
+            index += len(self)
+        records = self.store.records_where(
+            self.where, order="%s LIMIT 1 OFFSET %d" % (self.order, index)
+        )
+        if not records:
+            raise IndexError(index)
+        return records[0]
+
+    def __add__(self, other):
+        # e.g. variables + functions in lists.html.jinja
+        return list(self) + list(other)
+
+
+class BoundedCache(dict):
+    """Collector.cache whose caches start over once they hold CACHE_ENTRIES entries."""
+
+    def setdefault(self, key, default=None):
+        value = dict.setdefault(self, key, default)
+        if isinstance(value, dict) and len(value) >= CACHE_ENTRIES:
+            value.clear()
+        return value
+
+
+class StoreCollector(Collector):
+    """Serves a snapshot from a file written by write_store(), see puncover.store."""
+
+    def __init__(self, gcc_tools=None):
+        Collector.__init__(self, gcc_tools)
+        self.store = None
+
+    def open(self, path):
+        self.reset()
+        self.store = Store(path)
+        symbols = "e.kind = 'symbol'"
+        self.symbols = Elements(self.store, "address", symbols)
+        self.symbols_by_name = Elements(self.store, "name", symbols)
+        self.symbols_by_qualified_name = Elements(self.store, "qualified_name", symbols)
+        self.file_elements = Elements(
+            self.store, "path", "e.kind IN ('file', 'folder')", key=pathlib.Path
+        )
+        self.cache = BoundedCache()
+
+    def reset(self):
+        Collector.reset(self)
+        if self.store:
+            self.store.close()
+            self.store = None
+
+    def detach(self):
+        self.store = None
+        Collector.detach(self)
+
+    def teardown(self):
+        # records are freed as soon as they're not referenced anymore
+        self.reset()
+
+    def cache_key(self, element):
+        # stored elements keep their id, so cached values don't need to keep them loaded
+        return element.id, None
+
+    def build_symbol_name_index(self):
+        pass
+
+    def symbol(self, name, qualified=True):
+        if not self.store:
+            return None
+        index = self.symbols_by_qualified_name if qualified else self.symbols_by_name
+        return index.get(name, None)
+
+    def all_symbols(self):
+        return Rows(self.store, "e.kind = 'symbol'", order="e.rank")
+
+    def all_functions(self):
+        where = "e.kind = 'symbol' AND e.type = '%s'" % collector.TYPE_FUNCTION
+        return Rows(self.store, where, order="e.rank")
+
+    def all_variables(self):
+        where = "e.kind = 'symbol' AND e.type = '%s'" % collector.TYPE_VARIABLE
+        return Rows(self.store, where, order="e.rank")
+
+    def all_files(self):
+        return self.store.records_where("e.kind = 'file'")
+
+    def all_folders(self):
+        return self.store.records_where("e.kind = 'folder'")
+
+    def root_folders(self):
+        return self.store.records_where("e.kind = 'folder' AND e.parent IS NULL")
@@ -3,8 +3,9 @@ import tempfile
 import unittest
 from contextlib import contextmanager
 from types import SimpleNamespace
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
+from puncover import renderers
 from puncover.puncover import main
 
 
@@ -24,6 +25,8 @@ class TestArguments(unittest.TestCase):
             patch("puncover.puncover.create_builder", return_value=mock_builder),
             patch("puncover.puncover.renderers.register_jinja_filters"),
             patch("puncover.puncover.renderers.register_urls"),
+            patch("puncover.puncover.renderers.register_events"),
+            patch("puncover.puncover.renderers.register_metrics"),
             patch("puncover.puncover.app.run"),
             patch("puncover.puncover.is_port_in_use", return_value=False),
             patch(
@@ -66,9 +69,13 @@ class TestArguments(unittest.TestCase):
                 p.start()
             try:
                 # Import patched objects after patches are active
-                from puncover.puncover import app, create_builder
+                from puncover.puncover import app, create_builder, renderers
 
-                yield SimpleNamespace(create_builder=create_builder, app=app)
+                yield SimpleNamespace(
+                    create_builder=create_builder,
+                    app=app,
+                    register_events=renderers.register_events,
+                )
             finally:
                 for p in patches:
                     p.stop()
@@ -280,6 +287,205 @@ class TestArguments(unittest.TestCase):
             self.assertEqual(run_kwargs["host"], "0.0.0.0")
             self.assertEqual(run_kwargs["port"], 5000)
 
+    def test_serve_argument(self):
+        """Test that --serve hands the app to the pre-forking server instead of app.run."""
+        test_args = [
+            "puncover",
+            "--gcc_tools_base",
+            "/path/to/gcc",
+            "--elf_file",
+            "/path/to/file.elf",
+            "--serve",
+            "--workers",
+            "3",
+        ]
+
+        with self._patched_main(test_args) as env, patch("puncover.puncover.serve") as serve:
+            main()
+            env.app.run.assert_not_called()
+            serve.assert_called_once_with(env.app, "127.0.0.1", ANY, 3)
+
+    def test_live_reload(self):
+        """Test that the interactive server rebuilds in the background unless --no-live-reload."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            builder = env.create_builder.return_value
+            builder.watch.assert_called_once_with()
+            env.register_events.assert_called_once_with(env.app, ANY)
+
+        with self._patched_main(test_args + ["--no-live-reload"]) as env:
+            main()
+            env.create_builder.return_value.watch.assert_not_called()
+            env.register_events.assert_not_called()
+
+    def test_objdump_profile(self):
+        """Test that the objdump profile and its options reach the builder."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            kwargs = env.create_builder.call_args[1]
+        self.assertEqual("full", kwargs["objdump_profile"])
+        self.assertTrue(kwargs["line_numbers"])
+
+        lean_args = test_args + ["--objdump-profile", "lean", "--objdump-section", ".text"]
+        with self._patched_main(lean_args + ["--no-objdump-line-numbers"]) as env:
+            main()
+            kwargs = env.create_builder.call_args[1]
+        self.assertEqual("lean", kwargs["objdump_profile"])
+        self.assertEqual([".text"], kwargs["objdump_sections"])
+        self.assertFalse(kwargs["line_numbers"])
+
+        with self._patched_main(test_args + ["--objdump-section", ".text"]):
+            with self.assertRaises(SystemExit):
+                main()
+
+    def test_quick_start(self):
+        """Test that --quick-start reaches the builder and is only used by the interactive server."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args + ["--quick-start"]) as env:
+            main()
+            self.assertTrue(env.create_builder.call_args[1]["quick_start"])
+
+        with self._patched_main(test_args + ["--quick-start", "--serve"]):
+            with self.assertRaises(SystemExit):
+                main()
+
+    def test_spill_assembly(self):
+        """Test that --spill-assembly reaches the builder."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            self.assertFalse(env.create_builder.call_args[1]["spill_assembly"])
+
+        with self._patched_main(test_args + ["--spill-assembly"]) as env:
+            main()
+            self.assertTrue(env.create_builder.call_args[1]["spill_assembly"])
+
+    def test_incremental_analysis(self):
+        """Test that analyses are only kept across builds with --incremental-analysis."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            self.assertFalse(env.create_builder.call_args[1]["incremental_analysis"])
+
+        with self._patched_main(test_args + ["--incremental-analysis"]) as env:
+            main()
+            self.assertTrue(env.create_builder.call_args[1]["incremental_analysis"])
+
+    def test_jobs(self):
+        """Test that --jobs reaches the builder, 0 meaning one per CPU."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            self.assertEqual(1, env.create_builder.call_args[1]["jobs"])
+
+        with self._patched_main(test_args + ["--jobs", "4"]) as env:
+            main()
+            self.assertEqual(4, env.create_builder.call_args[1]["jobs"])
+
+        with (
+            self._patched_main(test_args + ["-j", "0"]) as env,
+            patch("puncover.puncover.os.cpu_count", return_value=8),
+        ):
+            main()
+            self.assertEqual(8, env.create_builder.call_args[1]["jobs"])
+
+    def test_store(self):
+        """Test that --store reaches the builder and can't be combined with --quick-start."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+
+        with self._patched_main(test_args) as env:
+            main()
+            self.assertIsNone(env.create_builder.call_args[1]["store_path"])
+
+        with self._patched_main(test_args + ["--store", "report.sqlite"]) as env:
+            main()
+            self.assertEqual("report.sqlite", env.create_builder.call_args[1]["store_path"])
+
+        with self._patched_main(test_args + ["--store", "report.sqlite", "--quick-start"]):
+            with self.assertRaises(SystemExit):
+                main()
+
+    def test_report_shards(self):
+        """Test that --report-shards and --report-gzip reach the report writer."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+        test_args += ["--generate-report", "--non-interactive", "--report-tag", "main"]
+
+        with (
+            self._patched_main(test_args + ["--report-shards", "--report-gzip"]),
+            patch("puncover.puncover.report.generate_report") as generate_report,
+        ):
+            main()
+            self.assertEqual("main", generate_report.call_args[0][2])
+            self.assertTrue(generate_report.call_args[1]["shards"])
+            self.assertTrue(generate_report.call_args[1]["compress"])
+
+        with self._patched_main(test_args + ["--report-gzip"]):
+            with self.assertRaises(SystemExit):
+                main()
+
+    def test_report_history(self):
+        """Test that --report-history adds the report under --report-tag to the database."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "/path/to/file.elf"]
+        test_args += ["--non-interactive", "--report-tag", "main"]
+        test_args += ["--report-history", "history.sqlite"]
+
+        with (
+            self._patched_main(test_args),
+            patch("puncover.puncover.history") as history,
+            patch("puncover.puncover.report.tag_entry") as tag_entry,
+        ):
+            main()
+            history.open_history.assert_called_once_with("history.sqlite")
+            history.add_tag.assert_called_once_with(
+                history.open_history.return_value, "main", tag_entry.return_value
+            )
+
+    def test_report_manifest(self):
+        """Test that --report-manifest reports the builds of the manifest instead of one."""
+        test_args = ["puncover", "--gcc_tools_base", "/path/to/gcc", "--jobs", "4"]
+        test_args += ["--report-manifest", "manifest.json", "--generate-report"]
+
+        with (
+            self._patched_main(test_args) as env,
+            patch("puncover.puncover.batch") as batch,
+        ):
+            main()
+            env.create_builder.assert_not_called()
+            batch.read_manifest.assert_called_once_with("manifest.json")
+            self.assertEqual(4, batch.analyze_builds.call_args[1]["jobs"])
+            self.assertEqual("report", batch.generate_reports.call_args[0][1])
+
+        for args in [["/path/to/file.elf"], ["--report-history", "h.sqlite", "--snapshot", "s"]]:
+            with self._patched_main(test_args + args):
+                with self.assertRaises(SystemExit):
+                    main()
+
+    def test_snapshot(self):
+        """Test that --snapshot serves a stored snapshot without building anything."""
+        test_args = ["puncover", "--snapshot", "firmware.sqlite"]
+
+        with (
+            self._patched_main(test_args) as env,
+            patch("puncover.puncover.StoreCollector") as store_collector,
+        ):
+            main()
+            env.create_builder.assert_not_called()
+            store_collector.return_value.open.assert_called_once_with("firmware.sqlite")
+            register_urls = renderers.register_urls
+            self.assertIs(store_collector.return_value, register_urls.call_args[0][1])
+
+        with self._patched_main(test_args + ["/path/to/file.elf"]):
+            with self.assertRaises(SystemExit):
+                main()
+
 
 class TestConfigFile(unittest.TestCase):
     def _create_mock_environment(self):
@@ -289,6 +495,8 @@ class TestConfigFile(unittest.TestCase):
             patch("puncover.puncover.create_builder", return_value=mock_builder),
             patch("puncover.puncover.renderers.register_jinja_filters"),
             patch("puncover.puncover.renderers.register_urls"),
+            patch("puncover.puncover.renderers.register_events"),
+            patch("puncover.puncover.renderers.register_metrics"),
             patch("puncover.puncover.app.run"),
             patch("puncover.puncover.is_port_in_use", return_value=False),
             patch(
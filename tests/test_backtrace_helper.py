@@ -65,7 +65,7 @@ class TestBacktraceHelperTreeSizes(unittest.TestCase):
         self.d = self.cc.add_symbol("d", "d", type=collector.TYPE_FUNCTION, stack_size=1000)
         self.e = self.cc.add_symbol("e", "e", type=collector.TYPE_FUNCTION, stack_size=10000)
         self.f = self.cc.add_symbol("f", "f", type=collector.TYPE_FUNCTION)
-        self.cc.enhance_call_tree()
+        self.cc.analyze_assembly()
         self.cc.add_function_call(self.a, self.b)
         self.cc.add_function_call(self.a, self.c)
         self.cc.add_function_call(self.b, self.a)
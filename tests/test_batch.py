@@ -0,0 +1,95 @@
+import contextlib
+import gc
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from puncover import batch, history, report
+from tests.test_store import FakeGccTools
+
+
+class CountingGccTools(FakeGccTools):
+    def __init__(self):
+        self.unmangled = []
+
+    def get_unmangled_names(self, symbol_names):
+        self.unmangled.append(symbol_names)
+        return super().get_unmangled_names(symbol_names)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(gc.unfreeze)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        for variant in ["debug", "release"]:
+            os.makedirs(os.path.join(self.tmp, variant))
+            open(os.path.join(self.tmp, variant, "app.elf"), "w").close()
+            with open(os.path.join(self.tmp, variant, "main.su"), "w") as f:
+                f.write("main.c:3:5:main\t16\tstatic\n")
+        self.manifest = os.path.join(self.tmp, "manifest.json")
+        self.write_manifest([
+            {"elf_file": "debug/app.elf", "su_dir": "debug", "tag": "debug"},
+            {"elf_file": "release/app.elf", "tag": "release"},
+        ])
+
+    def write_manifest(self, builds):
+        with open(self.manifest, "w") as f:
+            json.dump(builds, f)
+
+    def generate(self, gcc_tools, jobs, **kwargs):
+        builds = batch.read_manifest(self.manifest)
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch.generate_reports(batch.analyze_builds(builds, gcc_tools, jobs=jobs), **kwargs)
+
+    def test_read_manifest(self):
+        builds = batch.read_manifest(self.manifest)
+        self.assertEqual(os.path.join(self.tmp, "debug", "app.elf"), builds[0]["elf_file"])
+        self.assertEqual(os.path.join(self.tmp, "debug"), builds[0]["su_dir"])
+        self.assertNotIn("su_dir", builds[1])
+
+        self.write_manifest([{"elf_file": "a.elf", "tag": "a"}, {"elf_file": "b.elf", "tag": "a"}])
+        with self.assertRaises(Exception):
+            batch.read_manifest(self.manifest)
+        self.write_manifest([{"elf_file": "a.elf"}])
+        with self.assertRaises(Exception):
+            batch.read_manifest(self.manifest)
+
+    def test_single_file_shares_demangled_names(self):
+        gcc_tools = CountingGccTools()
+        filename = os.path.join(self.tmp, "report")
+        self.generate(gcc_tools, jobs=1, filename=filename)
+
+        with open(filename + ".json") as f:
+            written = json.load(f)
+        self.assertEqual(["debug", "release"], list(written.keys()))
+        functions = {f["name"]: f for f in written["debug"]["functions"]}
+        self.assertEqual(16, functions["main"]["stack_size"])
+        self.assertNotIn("stack_size", written["release"]["functions"][0])
+        # the release build has the same symbols as the debug build
+        self.assertEqual([["counter", "main", "helper", "leaf"]], gcc_tools.unmangled)
+
+    def test_pool_with_shards_and_history(self):
+        folder = os.path.join(self.tmp, "reports")
+        database = os.path.join(self.tmp, "history.sqlite")
+        self.generate(FakeGccTools(), jobs=2, filename=folder, shards=True, history_path=database)
+
+        index = report.read_index(folder)
+        self.assertEqual(["debug", "release"], list(index.keys()))
+        self.assertEqual([3, 3], [index[tag]["functions"] for tag in index])
+        db = history.open_history(database)
+        self.addCleanup(db.close)
+        self.assertEqual([("debug", 16), ("release", 16)], history.folder_trend(db, "src/app"))
+
+    def test_failing_build(self):
+        self.write_manifest([{"elf_file": "missing/app.elf", "tag": "missing"}])
+        with self.assertRaises(Exception) as e:
+            self.generate(FakeGccTools(), jobs=1, history_path=os.path.join(self.tmp, "h.sqlite"))
+        self.assertIn("missing", str(e.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+import contextlib
+import gc
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from puncover import collector
+from puncover.builders import Builder, ElfBuilder, SnapshotLock
+from puncover.collector import Collector, StubGccTool
+from puncover.middleware import SNAPSHOT_ENVIRON_KEY, BuilderMiddleware
+
+
+class TestSnapshotLock(unittest.TestCase):
+    def test_readers_share_lock(self):
+        lock = SnapshotLock()
+        lock.acquire_read()
+        lock.acquire_read()
+        self.assertEqual(2, lock.readers)
+        lock.release_read()
+        lock.release_read()
+        with lock.write():
+            self.assertTrue(lock.writer)
+        self.assertFalse(lock.writer)
+
+    def test_writer_waits_for_readers(self):
+        lock = SnapshotLock()
+        lock.acquire_read()
+        acquired = threading.Event()
+
+        def write():
+            with lock.write():
+                acquired.set()
+
+        t = threading.Thread(target=write)
+        t.start()
+        self.assertFalse(acquired.wait(0.05))
+        lock.release_read()
+        self.assertTrue(acquired.wait(1))
+        t.join()
+
+
+class TestBuilderMiddleware(unittest.TestCase):
+    class FakeBuilder(Builder):
+        def __init__(self):
+            Builder.__init__(self, Collector(None), ".")
+            self.pending = False
+            self.builds = 0
+
+        def needs_build(self):
+            return self.pending
+
+        def build(self):
+            self.pending = False
+            self.builds += 1
+            self.reset_collector()
+
+    def test_rebuild_leaves_streamed_snapshot_intact(self):
+        builder = self.FakeBuilder()
+        builder.collector.add_symbol("old", "00000100", size=4, type=collector.TYPE_FUNCTION)
+        old = builder.collector.symbol("old", False)
+
+        def app(environ, start_response):
+            start_response("200 OK", [])
+            snapshot = environ[SNAPSHOT_ENVIRON_KEY]
+            return (s[collector.NAME].encode() for s in snapshot.all_symbols())
+
+        middleware = BuilderMiddleware(app, builder)
+        response = middleware({}, lambda status, headers: None)
+        # the lock isn't held while the response is streamed
+        self.assertEqual(0, builder.lock.readers)
+
+        builder.pending = True
+        builder.build_if_needed()
+        self.assertEqual(1, builder.builds)
+        self.assertEqual([], builder.collector.all_symbols())
+        self.assertEqual([b"old"], list(response))
+        self.assertEqual("old", old[collector.NAME])
+
+        # the last response that read the replaced snapshot tears it down
+        response.close()
+        self.assertEqual({}, old)
+        self.assertIsNone(builder.snapshot)
+
+    def test_watch_reports_each_error_once(self):
+        builder = self.FakeBuilder()
+        errors = ["missing", "missing", "missing", "truncated", "truncated"]
+        stop = threading.Event()
+
+        def needs_build():
+            if errors:
+                raise Exception(errors.pop(0))
+            stop.set()
+            return False
+
+        builder.needs_build = needs_build
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            builder.watch(interval=0.001, stop=stop).join(1)
+        self.assertEqual(
+            ["rebuilding failed: missing", "rebuilding failed: truncated"],
+            output.getvalue().splitlines(),
+        )
+
+    def test_unlocked_paths_neither_build_nor_lock(self):
+        builder = self.FakeBuilder()
+        builder.pending = True
+
+        def app(environ, start_response):
+            start_response("200 OK", [])
+            return iter([b"event"])
+
+        middleware = BuilderMiddleware(app, builder, unlocked_paths=["/events/"])
+        response = middleware({"PATH_INFO": "/events/"}, lambda status, headers: None)
+        self.assertEqual(0, builder.builds)
+        self.assertEqual(0, builder.lock.readers)
+        self.assertEqual([b"event"], list(response))
+
+
+class TestBuilderGarbageCollection(unittest.TestCase):
+    class FakeBuilder(Builder):
+        def __init__(self, collector):
+            Builder.__init__(self, collector, ".")
+            self.gc_enabled_during_build = None
+
+        def get_elf_path(self):
+            return "a.elf"
+
+        def get_su_dir(self):
+            return None
+
+        def build_call_trees(self, collector):
+            self.gc_enabled_during_build = gc.isenabled()
+
+    def setUp(self):
+        self.addCleanup(gc.unfreeze)
+        self.collector = Collector(None)
+        self.collector.parse_elf = lambda path: None
+        self.collector.enhance = lambda src_root: None
+        self.collector.parse_su_dir = lambda path: None
+        self.collector.stages.listeners = []
+
+    def test_build_pauses_gc_and_freezes_snapshot(self):
+        builder = self.FakeBuilder(self.collector)
+        builder.build()
+        self.assertFalse(builder.gc_enabled_during_build)
+        self.assertTrue(gc.isenabled())
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+        builder.build()
+        self.assertTrue(gc.isenabled())
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+    def test_pause_gc_off(self):
+        builder = self.FakeBuilder(self.collector)
+        builder.pause_gc = False
+        builder.build()
+        self.assertTrue(builder.gc_enabled_during_build)
+        self.assertEqual(0, gc.get_freeze_count())
+
+
+class TestQuickStart(unittest.TestCase):
+    ASSEMBLY = [
+        "00000098 <main>:\n",
+        "  98:\tf000 f802 \tbl\ta0\n",
+        "  9c:\t4770      \tbx\tlr\n",
+        "\n",
+        "000000a0 <helper>:\n",
+        "  a0:\t4770      \tbx\tlr\n",
+    ]
+
+    class FakeGccTools(StubGccTool):
+        def __init__(self):
+            self.disassembled = []
+
+        def get_assembly_lines(self, elf_file):
+            return TestQuickStart.ASSEMBLY
+
+        def get_function_assembly_lines(self, elf_file, start, stop):
+            self.disassembled.append((start, stop))
+            return TestQuickStart.ASSEMBLY[:3]
+
+        def get_size_lines(self, elf_file):
+            return [
+                "00000098 00000006 T main\t/src/main.c:3\n",
+                "000000a0 00000002 T helper\t/src/main.c:9\n",
+            ]
+
+        def get_unmangled_names(self, symbol_names):
+            return {name: name for name in symbol_names}
+
+    def test_quick_snapshot_then_complete_analysis(self):
+        self.addCleanup(gc.unfreeze)
+        with tempfile.TemporaryDirectory() as tmp:
+            elf_file = os.path.join(tmp, "firmware.elf")
+            open(elf_file, "w").close()
+            tools = self.FakeGccTools()
+            c = Collector(tools)
+            c.stages.listeners = []
+            builder = ElfBuilder(c, tmp, elf_file, None)
+            builder.quick_start = True
+
+            # the background analysis waits for the quick snapshot to be released
+            with builder.lock.write():
+                builder.build()
+                main = c.symbol("main", False)
+                self.assertEqual([], main[collector.CALLEES])
+                self.assertNotIn(collector.ASM, main)
+                self.assertEqual(
+                    ["98:\tf000 f802 \tbl\ta0 <helper>", "9c:\t4770      \tbx\tlr"],
+                    c.assembly_lines(main),
+                )
+                c.assembly_lines(main)
+                self.assertEqual([(0x98, 0x9E)], tools.disassembled)
+
+            builder.background_analysis.join(5)
+            main = c.symbol("main", False)
+            self.assertEqual(["helper"], [f[collector.NAME] for f in main[collector.CALLEES]])
+            self.assertEqual(2, len(c.assembly_lines(main)))
+            self.assertEqual(1, len(tools.disassembled))
+
+    def test_superseded_analysis_is_torn_down(self):
+        self.addCleanup(gc.unfreeze)
+        with tempfile.TemporaryDirectory() as tmp:
+            elf_file = os.path.join(tmp, "firmware.elf")
+            open(elf_file, "w").close()
+            c = Collector(self.FakeGccTools())
+            c.stages.listeners = []
+            builder = ElfBuilder(c, tmp, elf_file, None)
+            builder.quick_start = True
+
+            torn_down = []
+            teardown = Collector.teardown
+
+            def record_teardown(collector):
+                torn_down.append(collector)
+                teardown(collector)
+
+            with patch.object(Collector, "teardown", record_teardown):
+                with builder.lock.write():
+                    builder.build()
+                    # as if another build had started meanwhile
+                    builder.generation += 1
+                builder.background_analysis.join(5)
+
+            # the first one is the previous snapshot of c, torn down by build()
+            staging = [t for t in torn_down if t is not c]
+            self.assertEqual(1, len(staging))
+            self.assertEqual({}, staging[0].symbols)
+            self.assertEqual([], c.symbol("main", False)[collector.CALLEES])
+
+    def test_waits_for_relinked_elf_file(self):
+        self.addCleanup(gc.unfreeze)
+        with tempfile.TemporaryDirectory() as tmp:
+            elf_file = os.path.join(tmp, "firmware.elf")
+            open(elf_file, "w").close()
+            tools = self.FakeGccTools()
+            c = Collector(tools)
+            c.stages.listeners = []
+            builder = ElfBuilder(c, tmp, elf_file, None)
+            builder.quick_start = True
+            with builder.lock.write():
+                builder.build()
+                # the linker removed the ELF file and hasn't written the new one yet
+                os.remove(elf_file)
+                self.assertEqual([], c.assembly_lines(c.symbol("main", False)))
+                self.assertEqual([], tools.disassembled)
+            builder.background_analysis.join(5)
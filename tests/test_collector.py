@@ -1,11 +1,13 @@
 import os
 import pathlib
+import threading
 import unittest
 
 from mock import patch
 
-from puncover import collector
+from puncover import collector, parallel
 from puncover.collector import Collector, left_strip_from_list
+from puncover.gcc_tools import GCCTools
 
 
 class TestCollector(unittest.TestCase):
@@ -185,7 +187,7 @@ pbl_table_addr():
         self.assertEqual(c.symbols[0x00000098]["name"], "pbl_table_addr")
         self.assertEqual(c.symbols[0x00000098]["asm"][1], " 568:\tf7ff ffca \tbl\t98")
 
-        c.enhance_assembly()
+        c.analyze_assembly()
         self.assertEqual(
             c.symbols[0x00000098]["asm"][1], " 568:\tf7ff ffca \tbl\t98 <pbl_table_addr>"
         )
@@ -211,47 +213,173 @@ $t():
         self.assertFalse("callers" in app_log)
         self.assertFalse("callees" in app_log)
 
-        c.enhance_call_tree()
+        c.analyze_assembly()
 
         self.assertEqual(pbl_table_addr["callers"], [])
         self.assertEqual(pbl_table_addr["callees"], [app_log])
         self.assertEqual(app_log["callers"], [pbl_table_addr])
         self.assertEqual(app_log["callees"], [])
 
-    def test_enhance_call_tree_from_assembly_line(self):
+    def test_resolve_references(self):
         c = Collector(None)
-        f1 = "f1"
+        f1 = {collector.TYPE: collector.TYPE_FUNCTION}
         f2 = {collector.ADDRESS: "00000088"}
         f3 = {collector.ADDRESS: "00000930"}
         c.symbols = {int(f2[collector.ADDRESS], 16): f2, int(f3[collector.ADDRESS], 16): f3}
 
-        with patch.object(c, "add_function_call") as m:
-            c.enhance_call_tree_from_assembly_line(
-                f1, " 89e:	e9d3 0100 	ldrd	r0, r1, [r3]"
-            )
-            self.assertFalse(m.called)
-        with patch.object(c, "add_function_call") as m:
-            c.enhance_call_tree_from_assembly_line(
-                f1, "934:	f7ff bba8 	b.w	88 <jump_to_pbl_function>"
-            )
-            m.assert_called_with(f1, f2)
-        with patch.object(c, "add_function_call") as m:
-            c.enhance_call_tree_from_assembly_line(f1, "8e4:	f000 f824 	bl	930 <app_log>")
-            m.assert_called_with(f1, f3)
-
-        with patch.object(c, "add_function_call") as m:
-            c.enhance_call_tree_from_assembly_line(
-                f1, "6c6:	d202      	bcs.n	88 <__aeabi_ddiv+0x6e>"
-            )
-            m.assert_called_with(f1, f2)
+        def callees(line):
+            return c.resolve_references(f1, [line], [0])
 
-        with patch.object(c, "add_function_call") as m:
-            c.enhance_call_tree_from_assembly_line(
-                f1, " 805bbac:	2471 0805 b64b 0804 b3c9 0804 b459 0804     q$..K.......Y..."
-            )
-            self.assertFalse(m.called)
+        self.assertEqual([], callees(" 89e:	e9d3 0100 	ldrd	r0, r1, [r3]"))
+        self.assertEqual([f2], callees("934:	f7ff bba8 	b.w	88 <jump_to_pbl_function>"))
+        self.assertEqual([f3], callees("8e4:	f000 f824 	bl	930 <app_log>"))
+        self.assertEqual([f2], callees("6c6:	d202      	bcs.n	88 <__aeabi_ddiv+0x6e>"))
+        self.assertEqual(
+            [], callees(" 805bbac:	2471 0805 b64b 0804 b3c9 0804 b459 0804     q$..K.......Y...")
+        )
 
-    def test_annotate_indirect_call(self):
+    def test_analyze_assembly(self):
+        assembly = """
+00000098 <small>:
+  98:	f000 f818 	bl	cc
+  9c:	4798      	blx	r3
+
+000000a0 <big>:
+  a0:	b500      	push	{lr}
+  a2:	f000 f813 	bl	cc <callee>
+  a6:	f7ff fff7 	bl	98 <small>
+  aa:	f000 f80f 	bl	cc <callee>
+  ae:	bd00      	pop	{pc}
+
+000000cc <callee>:
+  cc:	4770      	bx	lr
+"""
+        c = Collector(GCCTools("arm-none-eabi-"))
+        c.parse_assembly_text(assembly)
+        c.analyze_assembly()
+        actual = c.symbols
+
+        self.assertEqual(16, actual[0xA0][collector.SIZE])
+        self.assertFalse(actual[0xA0].get(collector.PERFORMS_INDIRECT_CALL, False))
+        self.assertEqual(
+            ["callee", "small"], [f[collector.NAME] for f in actual[0xA0][collector.CALLEES]]
+        )
+        self.assertEqual(["callee"], [f[collector.NAME] for f in actual[0x98][collector.CALLEES]])
+        self.assertEqual(6, actual[0x98][collector.SIZE])
+        self.assertTrue(actual[0x98][collector.PERFORMS_INDIRECT_CALL])
+        self.assertEqual("98:\tf000 f818 \tbl\tcc <callee>", actual[0x98][collector.ASM][0])
+        # bigger callers first
+        self.assertEqual(
+            ["big", "small"], [f[collector.NAME] for f in actual[0xCC][collector.CALLERS]]
+        )
+
+    def test_no_fork_while_other_threads_run(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            self.assertFalse(parallel.can_fork())
+        finally:
+            stop.set()
+            thread.join()
+
+    @unittest.skipUnless(parallel.can_fork(), "needs fork()")
+    def test_analyze_assembly_in_parallel(self):
+        def analyzed(jobs):
+            c = Collector(GCCTools("arm-none-eabi-"))
+            c.jobs = jobs
+            c.analysis_cache = {}
+            for i in range(40):
+                address = 0x100 + i * 8
+                callee = 0x100 + (i + 1) % 40 * 8
+                c.add_symbol(
+                    "f%d" % i,
+                    "%08x" % address,
+                    assembly_lines=[
+                        "%x:\tb500      \tpush\t{lr}" % address,
+                        "%x:\tf000 f818 \tbl\t%x" % (address + 2, callee),
+                        "%x:\t4798      \tblx\tr3" % (address + 6),
+                    ][: 2 + i % 2],
+                )
+            with patch("puncover.parallel.CHUNK_SIZE", 8):
+                c.analyze_assembly()
+            return c
+
+        serial = analyzed(1)
+        with patch("puncover.parallel.analyze_contents", wraps=parallel.analyze_contents) as pool:
+            sharded = analyzed(3)
+        pool.assert_called_once()
+        self.assertEqual(serial.analysis_cache, sharded.analysis_cache)
+        for address, s in serial.symbols.items():
+            p = sharded.symbols[address]
+            for key in [collector.SIZE, collector.ASM, collector.PERFORMS_INDIRECT_CALL]:
+                self.assertEqual(s.get(key), p.get(key), key)
+            for key in [collector.CALLEES, collector.CALLERS]:
+                self.assertEqual(
+                    [f[collector.NAME] for f in s[key]], [f[collector.NAME] for f in p[key]]
+                )
+        self.assertEqual(
+            ["f1"], [f[collector.NAME] for f in sharded.symbols[0x100][collector.CALLEES]]
+        )
+
+    def test_analyze_assembly_reuses_moved_functions(self):
+        def assembly(offset):
+            # only g changes, f and callee move by offset
+            return """
+%08x <g>:
+ %x:	4770      	bx	lr
+
+%08x <f>:
+ %x:	f000 f818 	bl	%x
+ %x:	4798      	blx	r3
+ %x:	f000 f813 	bl	%x <callee>
+
+%08x <callee>:
+ %x:	4770      	bx	lr
+""" % tuple([0x90, 0x90] + [a + offset for a in [0x98, 0x98, 0xCC, 0x9C, 0xA0, 0xCC, 0xCC, 0xCC]])
+
+        def analyzed(offset, cache):
+            c = Collector(GCCTools("arm-none-eabi-"))
+            c.analysis_cache = cache
+            c.parse_assembly_text(assembly(offset))
+            with patch.object(c, "analyze_symbol_lines", wraps=c.analyze_symbol_lines) as m:
+                c.analyze_assembly()
+            analyzed_names = [call.args[0][collector.NAME] for call in m.call_args_list]
+            return c, analyzed_names
+
+        first, analyzed_names = analyzed(0, {})
+        self.assertEqual(["g", "f", "callee"], analyzed_names)
+        second, analyzed_names = analyzed(0x10, first.analysis_cache)
+        self.assertEqual([], analyzed_names)
+        # g and callee have the same content
+        self.assertEqual(2, len(second.analysis_cache))
+
+        expected, _ = analyzed(0x10, None)
+        for addr in [0x90, 0xA8, 0xDC]:
+            for key in [collector.SIZE, collector.ASM, collector.PERFORMS_INDIRECT_CALL]:
+                self.assertEqual(expected.symbols[addr].get(key), second.symbols[addr].get(key))
+        f = second.symbols[0xA8]
+        self.assertEqual("a8:\tf000 f818 \tbl\tdc <callee>", f[collector.ASM][0])
+        self.assertEqual([second.symbols[0xDC]], f[collector.CALLEES])
+        self.assertEqual([f], second.symbols[0xDC][collector.CALLERS])
+
+    def test_assembly_content_key_ignores_encodings(self):
+        c = Collector(GCCTools("arm-none-eabi-"))
+        f = {collector.TYPE: collector.TYPE_FUNCTION}
+
+        def key(*lines):
+            return c.assembly_content_key(f, list(lines))
+
+        literal = " ac:\t080000dd \t.word\t0x080000dd"
+        moved = key(" a8:\tf000 f818 \tbl\tdc <callee>", literal)
+        self.assertEqual(
+            moved, key(" 98:\tf7ff ffa2 \tbl\tcc <callee>", " 9c:\t080000cd \t.word\t0x080000cd")
+        )
+        # a narrow branch has a different size
+        self.assertNotEqual(moved, key(" a8:\te018      \tbl\tdc <callee>", literal))
+        self.assertNotEqual(key(" 98:\t4668      \tmov\tr0, sp"), key(" 98:\t4770      \tbx\tlr"))
+
+    def test_detects_indirect_call(self):
         import re
         from unittest.mock import MagicMock
 
@@ -259,29 +387,25 @@ $t():
         gcc_tools.indirect_call_pattern = re.compile(
             r"^\s*([\da-f]+):\s+[\d\sa-f]{9}\s+BLX\s+(\w+)$", re.IGNORECASE
         )
+        gcc_tools.indirect_call_hint = None
         c = Collector(gcc_tools)
+        f = {collector.TYPE: collector.TYPE_FUNCTION}
 
-        # indirect call via register — should set flag
-        f = {}
-        self.assertTrue(c.annotate_indirect_call(f, "805d83c:\t47b0     \tblx\tr6"))
-        self.assertTrue(f.get("performs_indirect_call"))
-
-        # direct call with label — should NOT match
-        f2 = {}
-        self.assertFalse(c.annotate_indirect_call(f2, "8e4:\tf000 f824\tblx\t930 <app_log>"))
-        self.assertFalse(f2.get("performs_indirect_call"))
+        def performs_indirect_call(line):
+            return c.analyze_symbol_lines(f, [line])[1]
 
-        # unrelated instruction — should NOT match
-        f3 = {}
-        self.assertFalse(c.annotate_indirect_call(f3, " 89e:\te9d3 0100\tldrd\tr0, r1, [r3]"))
-        self.assertFalse(f3.get("performs_indirect_call"))
+        # indirect call via register
+        self.assertTrue(performs_indirect_call("805d83c:\t47b0     \tblx\tr6"))
+        # direct call with label
+        self.assertFalse(performs_indirect_call("8e4:\tf000 f824\tblx\t930 <app_log>"))
+        # unrelated instruction
+        self.assertFalse(performs_indirect_call(" 89e:\te9d3 0100\tldrd\tr0, r1, [r3]"))
 
-    def test_annotate_indirect_call_none_pattern(self):
-        # When indirect_call_pattern is None (e.g. RISC-V), should return False and not crash
+    def test_detects_indirect_call_none_pattern(self):
+        # When indirect_call_pattern is None (e.g. RISC-V), nothing is flagged
         c = Collector(None)
-        f = {}
-        self.assertFalse(c.annotate_indirect_call(f, "805d83c:\t47b0     \tblx\tr6"))
-        self.assertFalse(f.get("performs_indirect_call"))
+        f = {collector.TYPE: collector.TYPE_FUNCTION}
+        self.assertFalse(c.analyze_symbol_lines(f, ["805d83c:\t47b0     \tblx\tr6"])[1])
 
     def test_stack_usage_line(self):
         line = "puncover.c:14:40:0	16	dynamic,bounded"
@@ -427,14 +551,16 @@ $t():
 
     def test_count_bytes(self):
         c = Collector(None)
-        self.assertEqual(0, c.count_assembly_code_bytes("dynamic_stack2():"))
-        self.assertEqual(2, c.count_assembly_code_bytes(" 88e:	4668      	mov	r0, sp"))
-        self.assertEqual(
-            4, c.count_assembly_code_bytes(" 88a:	ebad 0d03 	sub.w	sp, sp, r3")
-        )
-        self.assertEqual(4, c.count_assembly_code_bytes("878:	000001ba 	.word	0x000001ba"))
 
-    def test_enhance_function_size_from_assembly(self):
+        def count_bytes(line):
+            return c.analyze_symbol_lines({}, [line])[0]
+
+        self.assertEqual(0, count_bytes("dynamic_stack2():"))
+        self.assertEqual(2, count_bytes(" 88e:	4668      	mov	r0, sp"))
+        self.assertEqual(4, count_bytes(" 88a:	ebad 0d03 	sub.w	sp, sp, r3"))
+        self.assertEqual(4, count_bytes("878:	000001ba 	.word	0x000001ba"))
+
+    def test_function_size_from_assembly(self):
         c = Collector(None)
         c.symbols = {
             int("0000009c", 16): {
@@ -450,7 +576,7 @@ $t():
 
         s = c.symbol_by_addr("9c")
         self.assertFalse(collector.SIZE in s)
-        c.enhance_function_size_from_assembly()
+        c.analyze_assembly()
         self.assertEqual(8, s[collector.SIZE])
 
     def test_derive_filename_from_assembly(self):
@@ -501,6 +627,22 @@ uses_doubles2():
         self.assertEqual(aeabi_dsub, adddf3.get(collector.PREV_FUNCTION))
         self.assertFalse(collector.NEXT_FUNCTION in adddf3)
 
+    def test_teardown_breaks_reference_cycles(self):
+        c = Collector(None)
+        f = c.add_symbol("f", "00000100", file="src/a.c", type=collector.TYPE_FUNCTION)
+        g = c.add_symbol("g", "00000200", file="src/a.c", type=collector.TYPE_FUNCTION)
+        for s in [f, g]:
+            s[collector.CALLERS] = []
+            s[collector.CALLEES] = []
+        c.add_function_call(f, g)
+        c.add_function_call(g, f)
+        c.derive_folders()
+
+        c.teardown()
+        self.assertEqual({}, c.symbols)
+        self.assertEqual({}, f)
+        self.assertEqual({}, c.file_elements)
+
     def test_derive_file_elements(self):
         c = Collector(None)
         path_to_derive_1 = (
@@ -639,7 +781,7 @@ class TestReportMaxStaticStackUsage(unittest.TestCase):
         self.middle_fn[collector.DISPLAY_NAME] = "middle_fn"
         self.leaf_fn[collector.DISPLAY_NAME] = "leaf_fn"
 
-        self.cc.enhance_call_tree()
+        self.cc.analyze_assembly()
         self.cc.add_function_call(self.thread_fn, self.middle_fn)
         self.cc.add_function_call(self.middle_fn, self.leaf_fn)
 
@@ -22,6 +22,14 @@ class TestGCCTools(unittest.TestCase):
         t = GCCTools("riscv32-unknown-elf-")
         self.assertIsNone(t.indirect_call_pattern)
 
+    def test_objdump_profiles(self):
+        self.assertEqual(["-dslw"], GCCTools("arm-none-eabi-").objdump_args())
+        self.assertEqual(["-dlw"], GCCTools("arm-none-eabi-", "lean").objdump_args())
+        t = GCCTools("arm-none-eabi-", "lean", [".text", ".isr_vector"], line_numbers=False)
+        self.assertEqual(["-dw", "--section=.text", "--section=.isr_vector"], t.objdump_args())
+        with self.assertRaises(Exception):
+            GCCTools("arm-none-eabi-", "tiny")
+
     def test_chunks_and_rstrip(self):
         t = GCCTools("somePath")
         with patch.object(t, "gcc_tool_lines") as f:
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from puncover import batch, headless
+
+
+class TestHeadless(unittest.TestCase):
+    def test_imports_no_website(self):
+        """Test that analyzing and reporting don't import the website's dependencies."""
+        code = (
+            "import sys\n"
+            "from puncover import batch, builders, headless, history, report, store\n"
+            "print(' '.join(m for m in ['flask', 'jinja2', 'configargparse',"
+            " 'puncover.renderers'] if m in sys.modules))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], check=True, capture_output=True, text=True
+        ).stdout
+        self.assertEqual("", output.strip())
+
+    def test_report(self):
+        args = ["--gcc-tools-base", "/path/to/gcc", "/path/to/file.elf", "--build-dir", "/b"]
+        args += ["--report-tag", "main", "--report-shards", "--jobs", "2"]
+        with (
+            patch("puncover.builders.ElfBuilder") as builder,
+            patch("puncover.report.generate_report") as generate_report,
+        ):
+            headless.main(args)
+            self.assertEqual(("/path/to/file.elf", "/b"), builder.call_args[0][2:])
+            self.assertEqual(2, builder.return_value.jobs)
+            builder.return_value.build.assert_called_once()
+            self.assertIs(builder.return_value.collector, generate_report.call_args[0][0])
+            self.assertEqual(("report", "main"), generate_report.call_args[0][1:])
+            self.assertTrue(generate_report.call_args[1]["shards"])
+
+    def test_manifest(self):
+        args = ["--gcc-tools-base", "/path/to/gcc", "--report-manifest", "builds.json"]
+        with (
+            patch.object(batch, "read_manifest") as read_manifest,
+            patch.object(batch, "analyze_builds"),
+            patch.object(batch, "generate_reports") as generate_reports,
+        ):
+            headless.main(args + ["--report-history", "history.sqlite"])
+            read_manifest.assert_called_once_with("builds.json")
+            self.assertEqual("report", generate_reports.call_args[0][1])
+            self.assertEqual("history.sqlite", generate_reports.call_args[1]["history_path"])
+
+        # neither or both an ELF file and a manifest, --report-gzip without --report-shards
+        for invalid in [args[:2], args + ["/path/to/file.elf"], args + ["--report-gzip"]]:
+            with self.assertRaises(SystemExit):
+                headless.main(invalid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from puncover import history, report
+
+
+def function(name, path, size, stack_size=None):
+    f = {"name": name, "file": "/" + path, "address": 0x100, "size": size}
+    if stack_size is not None:
+        f["stack_size"] = stack_size
+    return f
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.db = history.open_history(os.path.join(self.tmp, "history.sqlite"))
+        self.addCleanup(self.db.close)
+
+        history.add_tag(
+            self.db,
+            "v1",
+            {
+                "timestamp": "2026-01-01T00:00:00",
+                "stack_report": {"led_thread": {"max_static_stack_size": 64, "call_stack": []}},
+                "functions": [
+                    function("main", "src/app/main.c", 100),
+                    function("draw", "src/app/gfx/draw.c", 40),
+                    function("init", "src/drivers/uart.c", 20),
+                ],
+                "variables": [
+                    {"name": "buffer", "file": "/src/app/main.c", "address": 0, "size": 8}
+                ],
+            },
+        )
+        history.add_tag(
+            self.db,
+            "v2",
+            {
+                "timestamp": "2026-01-02T00:00:00",
+                "stack_report": {"led_thread": {"max_static_stack_size": 96, "call_stack": []}},
+                "functions": report.Stream([
+                    function("main", "src/app/main.c", 110),
+                    function("draw", "src/app/gfx/draw.c", 80),
+                    function("blit", "src/app/gfx/blit.c", 30),
+                    function("init", "src/drivers/uart.c", 10),
+                ]),
+                "variables": report.Stream([]),
+            },
+        )
+
+    def test_trends(self):
+        self.assertEqual([("v1", 140), ("v2", 220)], history.folder_trend(self.db, "src/app"))
+        self.assertEqual([("v1", 40), ("v2", 110)], history.folder_trend(self.db, "/src/app/gfx/"))
+        self.assertEqual([("v1", 160), ("v2", 230)], history.folder_trend(self.db))
+        self.assertEqual(
+            [("v1", 8), ("v2", 0)], history.folder_trend(self.db, "src", table="variables")
+        )
+        self.assertEqual([("v1", 0), ("v2", 30)], history.symbol_trend(self.db, "blit"))
+        self.assertEqual([("v1", 64), ("v2", 96)], history.stack_trend(self.db, "led_thread"))
+        self.assertEqual([("v1", None), ("v2", None)], history.stack_trend(self.db, "other"))
+
+    def test_growers(self):
+        self.assertEqual(
+            [
+                ("draw", "src/app/gfx/draw.c", 40, 80),
+                ("blit", "src/app/gfx/blit.c", 0, 30),
+                ("main", "src/app/main.c", 100, 110),
+            ],
+            history.growers(self.db, "v1", "v2"),
+        )
+        self.assertEqual(
+            [("draw", "src/app/gfx/draw.c", 40, 80)],
+            history.growers(self.db, "v1", "v2", folder="src/app/gfx", limit=1),
+        )
+        self.assertEqual(
+            [("init", "src/drivers/uart.c", 10, 20)], history.growers(self.db, "v2", "v1")
+        )
+        with self.assertRaises(Exception):
+            history.growers(self.db, "v1", "v3")
+
+    def test_replace_tag(self):
+        history.add_tag(self.db, "v1", {"timestamp": "later", "functions": []})
+        self.assertEqual([("v1", 0), ("v2", 230)], history.folder_trend(self.db))
+        self.assertEqual(
+            [("v1", "later", 0, 0), ("v2", "2026-01-02T00:00:00", 4, 0)], history.tags(self.db)
+        )
+
+    def test_import_and_query(self):
+        filename = os.path.join(self.tmp, "report.json")
+        with open(filename, "w") as f:
+            json.dump(
+                {"v3": {"timestamp": "t", "functions": [function("main", "src/main.c", 5)]}}, f
+            )
+        database = os.path.join(self.tmp, "history.sqlite")
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            history.main([database, "import", filename])
+            history.main([database, "trend", "--folder", "src"])
+            history.main([database, "growers", "v2", "v3", "--limit", "1"])
+        lines = output.getvalue().splitlines()
+        self.assertEqual("imported v3", lines[0])
+        self.assertEqual(["v1", "160"], lines[1].split())
+        self.assertEqual(["v3", "5", "-225"], lines[3].split())
+        self.assertEqual(["+5", "0", "5", "main", "src/main.c"], lines[4].split())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+
+from flask import Flask
+from werkzeug.test import Client
+
+from puncover import collector, renderers
+from puncover.collector import Collector
+from puncover.metrics import Histogram, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.collector = Collector(None)
+        self.metrics = Metrics(self.collector)
+        self.collector.stages.listeners = [self.metrics]
+
+    def build(self):
+        c = self.collector
+        with c.stages.build():
+            c.reset()
+            with c.stages.stage("parse_elf"):
+                c.add_symbol("f", "00000100", size=4, file="src/a.c", type=collector.TYPE_FUNCTION)
+                c.add_symbol("v", "00000200", size=8, file="src/a.c", type=collector.TYPE_VARIABLE)
+            with c.stages.stage("folders"):
+                c.derive_folders()
+
+    def test_build_metrics(self):
+        self.build()
+        self.build()
+        text = self.metrics.render()
+
+        self.assertIn("puncover_builds_total 2\n", text)
+        self.assertIn("puncover_build_failures_total 0\n", text)
+        self.assertIn('puncover_stage_duration_seconds{stage="parse_elf"} ', text)
+        self.assertIn('puncover_stage_seconds_total{stage="folders"} ', text)
+        self.assertIn('puncover_snapshot_elements{kind="symbols"} 2\n', text)
+        self.assertIn('puncover_snapshot_elements{kind="functions"} 1\n', text)
+        self.assertIn('puncover_snapshot_elements{kind="files"} 1\n', text)
+        self.assertIn(
+            "# TYPE puncover_snapshot_age_seconds gauge\npuncover_snapshot_age_seconds ", text
+        )
+
+    def test_failed_build(self):
+        with self.assertRaises(ValueError):
+            with self.collector.stages.build():
+                raise ValueError()
+        text = self.metrics.render()
+        self.assertIn("puncover_build_failures_total 1\n", text)
+        # no snapshot has been published yet
+        self.assertNotRegex(text, r"(?m)^puncover_snapshot_age_seconds ")
+
+    def test_histogram(self):
+        h = Histogram(buckets=(0.1, 1))
+        h.observe(0.05)
+        h.observe(0.5)
+        h.observe(5)
+        self.assertEqual([1, 2], h.counts)
+        self.assertEqual(3, h.count)
+        self.assertEqual(5.55, h.sum)
+
+    def test_endpoint(self):
+        self.build()
+        app = Flask("puncover.puncover")
+        renderers.register_jinja_filters(app.jinja_env)
+        renderers.register_urls(app, self.collector)
+        renderers.register_metrics(app, self.metrics)
+        client = Client(app)
+
+        client.get("/")
+        client.get("/")
+        client.get("/nothing/here")
+        response = client.get("/metrics")
+
+        self.assertEqual("text/plain", response.mimetype)
+        text = response.get_data(as_text=True)
+        self.assertIn('puncover_request_duration_seconds_count{endpoint="overview"} 2\n', text)
+        self.assertIn(
+            'puncover_request_duration_seconds_bucket{endpoint="overview",le="+Inf"} 2', text
+        )
+        self.assertIn('puncover_request_duration_seconds_count{endpoint="unknown"} 1\n', text)
+        self.assertNotIn('endpoint="metrics"', text)
+
+    def test_per_worker(self):
+        metrics = Metrics(self.collector, per_worker=True)
+        self.collector.stages.listeners = [metrics]
+        self.build()
+        metrics.observe_request("overview", 0.01)
+        text = metrics.render()
+
+        worker = 'worker="%d"' % os.getpid()
+        self.assertIn("puncover_builds_total{%s} 1\n" % worker, text)
+        self.assertIn('puncover_snapshot_elements{%s,kind="symbols"} 2\n' % worker, text)
+        self.assertIn(
+            'puncover_request_duration_seconds_count{%s,endpoint="overview"} 1\n' % worker, text
+        )
+        self.assertNotRegex(text, r"(?m)^puncover_\w+ ")
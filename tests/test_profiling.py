@@ -0,0 +1,125 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from puncover import collector
+from puncover.collector import Collector
+from puncover.profiling import (
+    StageProfiler,
+    estimate_structure_sizes,
+    peak_rss,
+    resident_memory,
+)
+from puncover.stages import Stages
+
+
+class TestStageProfiler(unittest.TestCase):
+    def build(self, profiler):
+        stages = Stages()
+        stages.listeners = [profiler]
+        with stages.build():
+            with stages.stage("parse_elf"):
+                pass
+            with stages.stage("sizes"):
+                list(stages.track(range(3)))
+
+    def test_summary_and_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = io.StringIO()
+            output_file = os.path.join(tmp, "profile.json")
+            self.build(StageProfiler(output_file=output_file, out=out))
+
+            with open(output_file) as f:
+                report = json.load(f)
+
+        self.assertEqual(["parse_elf", "sizes"], [s["name"] for s in report["stages"]])
+        self.assertEqual(3, report["stages"][1]["items"])
+        self.assertGreaterEqual(report["total"]["wall"], report["stages"][1]["wall"])
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("stage"))
+        self.assertTrue(lines[1].startswith("parse_elf"))
+        self.assertTrue(lines[3].startswith("total"))
+        self.assertTrue(lines[4].startswith("peak rss"))
+
+    def test_cprofile_per_stage(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.build(StageProfiler(cprofile_dir=tmp, out=io.StringIO()))
+            self.assertEqual(["01-parse_elf.prof", "02-sizes.prof"], sorted(os.listdir(tmp)))
+
+    def test_memory(self):
+        out = io.StringIO()
+        profiler = StageProfiler(out=out, memory=True)
+        stages = Stages()
+        stages.listeners = [profiler]
+        with stages.build():
+            with stages.stage("parse_elf"):
+                data = [bytearray(1000) for _ in range(1000)]
+
+        report = profiler.report()
+        self.assertGreater(report["stages"][0]["allocated"], 1000 * 1000)
+        self.assertGreaterEqual(report["stages"][0]["allocated_peak"], 1000 * 1000)
+        self.assertIn("alloc MiB", out.getvalue())
+        self.assertEqual(1000, len(data))
+
+    def test_rss_per_stage(self):
+        if resident_memory() is None:
+            self.skipTest("resident memory unknown on this platform")
+        profiler = StageProfiler(out=io.StringIO())
+        stages = Stages()
+        stages.listeners = [profiler]
+        with stages.build():
+            with stages.stage("parse_elf"):
+                data = bytearray(64 * 1024 * 1024)
+                data[::4096] = b"x" * len(data[::4096])
+            with stages.stage("sizes"):
+                del data
+
+        report = profiler.report()
+        parse_elf, sizes = report["stages"]
+        # the process peak can't tell these apart, the resident memory per stage can
+        self.assertGreater(parse_elf["rss_delta"], 32 * 1024 * 1024)
+        self.assertLess(sizes["rss_delta"], -32 * 1024 * 1024)
+        self.assertEqual(sizes["rss"], report["total"]["rss"])
+
+    def test_rss_peak_within_stage(self):
+        if peak_rss() is None:
+            self.skipTest("peak resident memory unknown on this platform")
+        profiler = StageProfiler(out=io.StringIO())
+        stages = Stages()
+        stages.listeners = [profiler]
+        with stages.build():
+            with stages.stage("parse_elf"):
+                data = bytearray(160 * 1024 * 1024)
+                data[::4096] = b"x" * len(data[::4096])
+                del data
+
+        parse_elf = profiler.report()["stages"][0]
+        # freed before the stage ended, the delta doesn't show it but the peak does
+        self.assertGreater(parse_elf["rss_peak"] - parse_elf["rss"], 64 * 1024 * 1024)
+
+    def test_estimate_structure_sizes(self):
+        c = Collector(None)
+        f = c.add_symbol("f", "00000100", file="src/a.c", type=collector.TYPE_FUNCTION)
+        g = c.add_symbol("g", "00000200", file="src/a.c", type=collector.TYPE_FUNCTION)
+        f[collector.ASM] = ["  100:\tb570      \tpush\t{r4, r5, r6, lr}"]
+        for s in [f, g]:
+            s[collector.CALLERS] = []
+            s[collector.CALLEES] = []
+        c.add_function_call(f, g)
+        f[collector.DEEPEST_CALLEE_TREE] = (0, [f, g])
+        c.derive_folders()
+        c.cache["base_urls"] = {id(f): (f, "/path/src/a.c/f/")}
+
+        sizes = estimate_structure_sizes(c)
+        for name in ["symbols", "asm", "call_graph", "deepest_trees", "paths", "file_elements"]:
+            self.assertGreater(sizes[name], 0, name)
+        # only the cache's own dicts, tuple and string; the symbol has been counted before
+        self.assertLess(sizes["cache"], 1024)
+
+    def test_peak_rss(self):
+        rss = peak_rss()
+        if rss is not None:
+            self.assertGreater(rss, 1024 * 1024)
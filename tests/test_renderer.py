@@ -1,6 +1,8 @@
 import unittest
 from unittest.mock import Mock
 
+import markupsafe
+
 from puncover import collector, renderers
 
 
@@ -347,3 +349,227 @@ class TestRenderer(unittest.TestCase):
         self.assertEqual(c, actual[2])
         self.assertIn(a, actual[:2])
         self.assertIn(b, actual[:2])
+
+    def test_assembly_html_matches_assembly_filter(self):
+        from flask import Flask
+
+        from puncover.collector import Collector
+
+        c = Collector(None)
+        callee = c.add_symbol("callee", "00000100", file="src/a.c", type=collector.TYPE_FUNCTION)
+        callee[collector.DISPLAY_NAME] = "callee"
+        f = c.add_symbol(
+            "caller",
+            "00000200",
+            file="src/a.c",
+            assembly_lines=[
+                "  200:\tf000 f824 \tbl\t100 <callee>",
+                "_ZN6Stream9readBytesEPcj():",
+                "  204:\t4668      \tmov\tr0, sp",
+                "  206:\tf000 f824 \tbl\t300 <unknown>",
+            ],
+        )
+        f[collector.DISPLAY_NAME] = "caller"
+
+        app = Flask(__name__)
+        app.add_url_rule("/path/<path:path>/", "path")
+        with app.test_request_context():
+            renderer = renderers.HTMLRenderer(c)
+            ctx = Mock()
+            ctx.parent = {"renderer": renderer}
+
+            expected = "".join([
+                renderers.assembly_filter(ctx, markupsafe.escape(line)) + "\n"
+                for line in f[collector.ASM]
+            ])
+            actual = renderers.symbol_assembly_filter(ctx, f)
+            self.assertEqual(expected, actual)
+            self.assertIn('&lt;<a href="/path/src/a.c/callee/">callee</a>&gt;', actual)
+            self.assertIn("&lt;unknown&gt;", actual)
+
+            # rendered once per snapshot
+            f[collector.ASM] = []
+            self.assertEqual(actual, renderers.symbol_assembly_filter(ctx, f))
+            c.reset()
+            self.assertEqual("", renderers.symbol_assembly_filter(ctx, f))
+
+        # one entry per symbol, whatever the query string
+        c.reset()
+        callee = c.add_symbol("callee", "00000100", file="src/a.c", type=collector.TYPE_FUNCTION)
+        # display names aren't escaped, a template argument must survive the query suffix
+        callee[collector.DISPLAY_NAME] = "Queue<query>::push()"
+        f[collector.ASM] = ["  200:\tf000 f824 \tbl\t100 <callee>"]
+        for sort in ["code_desc", "stack_asc", "name_asc"]:
+            with app.test_request_context("/?sort=%s" % sort):
+                renderer = renderers.HTMLRenderer(c)
+                ctx.parent = {"renderer": renderer}
+                actual = renderers.symbol_assembly_filter(ctx, f)
+                self.assertIn('href="/path/src/a.c/callee/?sort=%s"' % sort, actual)
+                self.assertIn(">Queue<query>::push()</a>", actual)
+        self.assertEqual(1, len(c.cache["assembly_html"]))
+
+    def test_url_for_symbol_reuses_base_url(self):
+        from unittest.mock import patch
+
+        from flask import Flask
+
+        from puncover.collector import Collector
+
+        c = Collector(None)
+        f = c.add_symbol("f", "00000100", file="src/a.c", type=collector.TYPE_FUNCTION)
+        folder = {collector.TYPE: collector.TYPE_FOLDER, collector.PATH: "src"}
+        unknown = {collector.TYPE: collector.TYPE_FOLDER}
+
+        app = Flask(__name__)
+        app.add_url_rule("/path/<path:path>/", "path")
+        with app.test_request_context(query_string="sort=code_desc"):
+            renderer = renderers.HTMLRenderer(c)
+            self.assertEqual("/path/src/a.c/f/?sort=code_desc", renderer.url_for_symbol(f))
+            self.assertEqual("/path/src/?sort=code_desc", renderer.url_for_symbol(folder))
+            self.assertEqual("", renderer.url_for_symbol(unknown))
+
+        with app.test_request_context():
+            renderer = renderers.HTMLRenderer(c)
+            with patch("puncover.renderers.url_for") as url_for:
+                self.assertEqual("/path/src/a.c/f/", renderer.url_for_symbol(f))
+                url_for.assert_not_called()
+
+            c.reset()
+            self.assertEqual("/path/src/a.c/f/", renderer.url_for_symbol(f))
+            self.assertEqual(1, len(c.cache["base_urls"]))
+
+    def test_buffered_stream(self):
+        chunks = ["<html>", "a" * 3, "b" * 3, "c", "</html>"]
+        actual = list(renderers.buffered_stream(iter(chunks), chunk_size=4))
+        self.assertEqual(["<html>", "aaabbb", "c</html>"], actual)
+        self.assertEqual([], list(renderers.buffered_stream(iter([]))))
+
+    def test_streamed_page_matches_rendered_page(self):
+        from flask import Flask
+        from werkzeug.test import Client
+
+        from puncover.collector import Collector
+
+        c = Collector(None)
+        c.add_symbol("f", "00000100", size=4, file="src/a.c", type=collector.TYPE_FUNCTION)
+        c.add_symbol("v", "00000200", size=8, file="src/a.c", type=collector.TYPE_VARIABLE)
+        for s in c.all_symbols():
+            s[collector.DISPLAY_NAME] = s[collector.NAME]
+        c.derive_folders()
+        c.enhance_file_elements()
+
+        pages = []
+        for stream in [False, True]:
+            app = Flask("puncover.puncover")
+            renderers.register_jinja_filters(app.jinja_env)
+            renderers.register_urls(app, c, stream=stream)
+            response = Client(app).get("/all/")
+            self.assertEqual(200, response.status_code)
+            # streamed responses don't know their length upfront
+            self.assertEqual(stream, response.content_length is None)
+            pages.append(response.get_data(as_text=True))
+
+        self.assertIn(">f</a>", pages[0])
+        self.assertEqual(pages[0], pages[1])
+
+    def test_call_tree_renderer(self):
+        from flask import Flask
+        from werkzeug.test import Client
+
+        from puncover.collector import Collector
+
+        c = Collector(None)
+        hub = c.add_symbol("hub", "00000100", size=4, file="src/a.c", type=collector.TYPE_FUNCTION)
+        callers = [
+            c.add_symbol(
+                "caller%d" % i,
+                "0000020%d" % i,
+                size=i,
+                file="src/b.c",
+                type=collector.TYPE_FUNCTION,
+            )
+            for i in range(1, 4)
+        ]
+        for f in c.all_symbols():
+            f[collector.CALLERS] = []
+            f[collector.CALLEES] = []
+        for i, f in enumerate(callers):
+            c.add_function_call(f, hub)
+            f[collector.DEEPEST_CALLER_TREE] = (10 * (3 - i), [f])
+
+        app = Flask("puncover.puncover")
+        renderers.register_jinja_filters(app.jinja_env)
+        renderers.register_urls(app, c)
+        client = Client(app)
+
+        data = client.get("/callers/src/a.c/hub/?limit=2").get_json()
+        self.assertEqual(3, data["total"])
+        self.assertEqual(["caller1", "caller2"], [i["name"] for i in data["items"]])
+        self.assertEqual(30, data["items"][0]["deepest_stack_size"])
+        self.assertEqual("/path/src/b.c/caller1/", data["items"][0]["url"])
+        self.assertEqual("/callers/src/b.c/caller1/", data["items"][0]["tree_url"])
+        self.assertEqual(0, data["items"][0]["count"])
+
+        data = client.get("/callers/src/a.c/hub/?sort=size&offset=1").get_json()
+        self.assertEqual(["caller2", "caller1"], [i["name"] for i in data["items"]])
+
+        # links keep the query string of the symbol page, not the one of the tree
+        data = client.get("/callers/src/a.c/hub/?sort=size&page=sort%3Dcode_desc").get_json()
+        self.assertEqual("/path/src/b.c/caller3/?sort=code_desc", data["items"][0]["url"])
+        self.assertEqual("/callers/src/b.c/caller3/", data["items"][0]["tree_url"])
+
+        data = client.get("/callees/src/b.c/caller3/").get_json()
+        self.assertEqual(["hub"], [i["name"] for i in data["items"]])
+        self.assertEqual(1, data["symbol"]["count"])
+        self.assertEqual(0, data["items"][0]["count"])
+
+        self.assertEqual(400, client.get("/callers/src/a.c/hub/?sort=foo").status_code)
+        self.assertEqual(404, client.get("/callers/src/a.c/nothing/").status_code)
+
+    def test_events_stream(self):
+        from flask import Flask
+        from werkzeug.test import Client
+
+        from puncover.stages import ProgressBroadcaster
+
+        broadcaster = ProgressBroadcaster()
+        app = Flask("puncover.puncover")
+        renderers.register_events(app, broadcaster)
+        self.assertTrue(app.jinja_env.globals["live_updates"])
+
+        response = Client(app).get("/events/")
+        self.assertEqual("text/event-stream", response.mimetype)
+        chunks = response.iter_encoded()
+        self.assertEqual(b"retry: 2000\n\n", next(chunks))
+        self.assertEqual(1, len(broadcaster.subscribers))
+
+        broadcaster.build_finished()
+        event = next(chunks)
+        self.assertTrue(event.startswith(b'event: snapshot\ndata: {"published": '))
+        self.assertTrue(event.endswith(b"}\n\n"))
+
+        response.close()
+        self.assertEqual(0, len(broadcaster.subscribers))
+
+    def test_live_updates_script(self):
+        from flask import Flask
+        from werkzeug.test import Client
+
+        from puncover.collector import Collector
+        from puncover.stages import ProgressBroadcaster
+
+        def head(live_updates):
+            app = Flask("puncover.puncover")
+            renderers.register_jinja_filters(app.jinja_env)
+            renderers.register_urls(app, Collector(None))
+            if live_updates:
+                renderers.register_events(app, ProgressBroadcaster())
+            return Client(app).get("/").get_data(as_text=True).split("</head>")[0]
+
+        # the head is unchanged without live updates
+        self.assertIn('bootstrap.min.js"></script>\n\n    <title>', head(False))
+        self.assertIn(
+            'bootstrap.min.js"></script>\n    <script src="/static/js/live.js" '
+            'data-events-url="/events/" defer></script>\n\n    <title>',
+            head(True),
+        )
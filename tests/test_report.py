@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from puncover import collector, report
+from puncover.collector import Collector
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def collector(self, functions=2):
+        c = Collector(None)
+        for i in range(functions):
+            c.add_symbol("f%d" % i, "%08x" % (0x100 + i * 4), size=4, type=collector.TYPE_FUNCTION)
+        c.add_symbol("größe", "20000000", size=8, type=collector.TYPE_VARIABLE)
+        return c
+
+    def test_write_json_like_json_dump(self):
+        for value in [
+            {"a": report.Stream([{"b": [1, 2]}, {}]), "c": {"d": report.Stream([])}},
+            {"tag": {"timestamp": "now", "functions": report.Stream(["ä", None, []])}},
+            report.Stream([{"x": report.Stream([1])}]),
+        ]:
+            f = io.StringIO()
+            report.write_json(f, value)
+
+            def lists(v):
+                if isinstance(v, report.Stream):
+                    return [lists(i) for i in v.items]
+                if isinstance(v, dict):
+                    return {k: lists(i) for k, i in v.items()}
+                return v
+
+            expected = json.dumps(lists(value), indent=4, ensure_ascii=False)
+            self.assertEqual(expected, f.getvalue())
+
+    def test_report_symbols(self):
+        c = self.collector()
+        expected = {}
+        c.prepare_report_for_json_export(expected)
+        self.assertEqual(expected["functions"], list(c.report_symbols(functions=True)))
+        self.assertEqual(expected["variables"], list(c.report_symbols(functions=False)))
+        self.assertEqual(["f0", "f1"], [f["name"] for f in expected["functions"]])
+        self.assertEqual(["größe"], [v["name"] for v in expected["variables"]])
+
+    def test_single_file_keeps_other_tags(self):
+        filename = os.path.join(self.tmp, "report")
+        with open(filename + ".json", "w") as f:
+            json.dump({"old": {"timestamp": "then", "functions": []}}, f)
+
+        c = self.collector()
+        report.generate_report(c, filename, "new")
+        with open(filename + ".json", encoding="utf-8") as f:
+            text = f.read()
+        written = json.loads(text)
+        self.assertEqual(["old", "new"], list(written.keys()))
+        self.assertEqual({"timestamp": "then", "functions": []}, written["old"])
+        self.assertEqual(["f0", "f1"], [f["name"] for f in written["new"]["functions"]])
+        self.assertEqual(json.dumps(written, indent=4, ensure_ascii=False), text)
+        self.assertFalse(os.path.exists(filename + ".json.new"))
+
+    def test_shards(self):
+        folder = os.path.join(self.tmp, "reports")
+        report.generate_report(self.collector(2), folder, "main", shards=True)
+        report.generate_report(self.collector(3), folder, "feature/x", shards=True, compress=True)
+
+        index = report.read_index(folder)
+        self.assertEqual(["main", "feature/x"], list(index.keys()))
+        self.assertEqual("feature%2Fx.json.gz", index["feature/x"]["file"])
+        self.assertEqual(3, index["feature/x"]["functions"])
+        self.assertEqual(1, index["feature/x"]["variables"])
+        self.assertEqual(3, len(report.read_tag(folder, "feature/x")["functions"]))
+        self.assertEqual(2, len(report.read_tag(folder, "main")["functions"]))
+
+        # a tag written again replaces its file
+        report.generate_report(self.collector(1), folder, "feature/x", shards=True)
+        self.assertEqual(1, len(report.read_tag(folder, "feature/x")["functions"]))
+        self.assertEqual(
+            sorted(["index.json", "main.json", "feature%2Fx.json"]), sorted(os.listdir(folder))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -40,7 +40,7 @@ class TestSchemaValidatesOutput(unittest.TestCase):
         )
         thread_fn[collector.DISPLAY_NAME] = "thread_fn"
         callee_fn[collector.DISPLAY_NAME] = "callee_fn"
-        cc.enhance_call_tree()
+        cc.analyze_assembly()
         cc.add_function_call(thread_fn, callee_fn)
 
         h = BacktraceHelper(cc)
@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from flask import Flask
+from werkzeug.test import Client
+
+from puncover import collector, renderers
+from puncover.builders import Builder
+from puncover.collector import Collector
+from puncover.middleware import BuilderMiddleware
+from puncover.server_timing import ServerTiming, ServerTimingMiddleware
+
+
+class TestServerTiming(unittest.TestCase):
+    def test_nested_phases_are_exclusive(self):
+        timing = ServerTiming()
+        with timing.measure("render"):
+            time.sleep(0.01)
+            for _ in range(2):
+                with timing.measure("filters"):
+                    time.sleep(0.01)
+
+        self.assertGreaterEqual(timing.durations["filters"], 0.02)
+        self.assertGreaterEqual(timing.durations["render"], 0.01)
+        self.assertLess(timing.durations["render"], 0.02)
+        self.assertEqual([], timing.running)
+
+    def test_header(self):
+        timing = ServerTiming()
+        timing.durations = {"build": 0.5, "custom": 0.25}
+        header = timing.header().split(", ")
+        self.assertEqual('build;desc="build_if_needed";dur=500.00', header[0])
+        self.assertEqual("custom;dur=250.00", header[1])
+        self.assertTrue(header[2].startswith('other;desc="routing and everything else";dur='))
+        self.assertTrue(header[3].startswith("total;dur="))
+
+    def test_page_phases(self):
+        c = Collector(None)
+        c.add_symbol("f", "00000100", size=4, file="src/a.c", type=collector.TYPE_FUNCTION)
+        c.symbol("f", False)[collector.DISPLAY_NAME] = "f"
+        c.derive_folders()
+        c.enhance_file_elements()
+        builder = Builder(c, ".")
+
+        app = Flask("puncover.puncover")
+        renderers.register_jinja_filters(app.jinja_env, server_timing=True)
+        renderers.register_urls(app, c)
+        app.wsgi_app = ServerTimingMiddleware(BuilderMiddleware(app.wsgi_app, builder))
+
+        response = Client(app).get("/all/")
+        self.assertEqual(200, response.status_code)
+        self.assertIn(">f</a>", response.get_data(as_text=True))
+        phases = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(["build", "lock", "init", "filters", "render", "other", "total"], phases)
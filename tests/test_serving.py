@@ -0,0 +1,37 @@
+import contextlib
+import gc
+import io
+import os
+import signal
+import unittest
+
+from mock import patch
+
+from puncover import serving
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "needs fork()")
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        handlers = {s: signal.getsignal(s) for s in [signal.SIGINT, signal.SIGTERM]}
+        self.addCleanup(lambda: [signal.signal(s, h) for s, h in handlers.items()])
+        self.addCleanup(gc.unfreeze)
+
+    def test_gives_up_on_workers_that_cannot_start(self):
+        out = io.StringIO()
+        with (
+            patch("puncover.serving.run_worker", side_effect=RuntimeError("no")),
+            patch("puncover.serving.time.sleep") as sleep,
+            contextlib.redirect_stdout(out),
+            contextlib.redirect_stderr(io.StringIO()),
+        ):
+            with self.assertRaises(Exception):
+                serving.serve(None, "127.0.0.1", 0, 2)
+
+        # the workers report their failure instead of a clean exit
+        self.assertIn("exited unexpectedly (1)", out.getvalue())
+        self.assertIn("giving up", out.getvalue())
+        # restarts back off
+        delays = [c.args[0] for c in sleep.call_args_list]
+        self.assertEqual(sorted(delays), delays)
+        self.assertLess(delays[0], delays[-1])
@@ -0,0 +1,78 @@
+import json
+import unittest
+
+from puncover import collector
+from puncover.collector import Collector
+from puncover.gcc_tools import GCCTools
+from puncover.spill import SpilledLines, SpillFile
+
+
+class TestSpillFile(unittest.TestCase):
+    def setUp(self):
+        self.spill_file = SpillFile()
+        self.addCleanup(self.spill_file.close)
+
+    def test_round_trip(self):
+        a = self.spill_file.append(["push {r4, lr}", "bl\t8000 <f>"])
+        b = self.spill_file.append(["bx lr µ"])
+        self.spill_file.seal()
+
+        self.assertEqual(2, len(a))
+        self.assertEqual(["push {r4, lr}", "bl\t8000 <f>"], list(a))
+        self.assertEqual("bl\t8000 <f>", a[1])
+        self.assertEqual(["bx lr µ"], b)
+        self.assertNotEqual(a, b)
+
+    def test_empty(self):
+        empty = self.spill_file.append([""])
+        self.spill_file.seal()
+        self.assertEqual([""], empty)
+        self.assertEqual(1, len(empty))
+
+
+class TestCollectorSpill(unittest.TestCase):
+    assembly = """
+00000098 <small>:
+  98:	f000 f818 	bl	cc
+  9c:	4798      	blx	r3
+
+000000cc <callee>:
+  cc:	4770      	bx	lr
+"""
+
+    def analyzed(self, spill):
+        c = Collector(GCCTools("arm-none-eabi-"))
+        if spill:
+            c.spill_assembly()
+        c.parse_assembly_text(self.assembly)
+        c.analyze_assembly()
+        self.addCleanup(c.reset)
+        return c
+
+    def test_analysis_matches_unspilled(self):
+        expected = self.analyzed(spill=False)
+        c = self.analyzed(spill=True)
+        small = c.symbols[0x98]
+        self.assertIsInstance(small[collector.ASM], SpilledLines)
+        self.assertEqual(expected.symbols[0x98][collector.ASM], small[collector.ASM])
+        self.assertEqual("98:\tf000 f818 \tbl\tcc <callee>", small[collector.ASM][0])
+        self.assertEqual(6, small[collector.SIZE])
+        self.assertTrue(small[collector.PERFORMS_INDIRECT_CALL])
+        self.assertEqual(["callee"], [f[collector.NAME] for f in small[collector.CALLEES]])
+        self.assertEqual(small[collector.ASM], c.assembly_lines(small))
+
+    def test_report_export(self):
+        c = self.analyzed(spill=True)
+        c.derive_folders()
+        report = {}
+        c.prepare_report_for_json_export(report)
+        exported = json.loads(json.dumps(report))
+        disasm = {f["name"]: f["disasm"] for f in exported["functions"]}
+        self.assertEqual(["cc:\t4770      \tbx\tlr"], disasm["callee"])
+
+    def test_reset_closes_spill_file(self):
+        c = self.analyzed(spill=True)
+        spill_file = c.spill_file
+        c.reset()
+        self.assertIsNone(c.spill_file)
+        self.assertTrue(spill_file.file.closed)
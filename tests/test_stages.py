@@ -0,0 +1,110 @@
+import unittest
+
+from puncover.stages import ProgressBroadcaster, StageListener, Stages
+
+
+class RecordingListener(StageListener):
+    def __init__(self):
+        self.events = []
+
+    def build_started(self):
+        self.events.append(("build_started",))
+
+    def stage_started(self, stage):
+        self.events.append(("stage_started", stage.name))
+
+    def stage_progress(self, stage):
+        self.events.append(("stage_progress", stage.name, stage.done))
+
+    def stage_finished(self, stage):
+        self.events.append(("stage_finished", stage.name, stage.done, stage.total))
+
+    def build_finished(self):
+        self.events.append(("build_finished",))
+
+    def build_failed(self, error):
+        self.events.append(("build_failed", str(error)))
+
+
+class TestStages(unittest.TestCase):
+    def setUp(self):
+        self.stages = Stages()
+        self.listener = RecordingListener()
+        self.stages.listeners = [self.listener]
+
+    def test_build_reports_stages_and_counts(self):
+        with self.stages.build():
+            with self.stages.stage("a"):
+                self.assertEqual([1, 2, 3], list(self.stages.track([1, 2, 3])))
+            with self.stages.stage("b"):
+                list(self.stages.track(iter("xy")))
+
+        self.assertEqual(
+            [
+                ("build_started",),
+                ("stage_started", "a"),
+                ("stage_finished", "a", 3, 3),
+                ("stage_started", "b"),
+                ("stage_finished", "b", 2, None),
+                ("build_finished",),
+            ],
+            self.listener.events,
+        )
+
+    def test_progress_is_throttled(self):
+        self.stages.PROGRESS_BATCH = 2
+        self.stages.PROGRESS_INTERVAL = 0
+        with self.stages.stage("a"):
+            list(self.stages.track(range(5)))
+        self.assertEqual(
+            [("stage_progress", "a", 2), ("stage_progress", "a", 4)],
+            [e for e in self.listener.events if e[0] == "stage_progress"],
+        )
+
+    def test_track_outside_of_stage(self):
+        items = [1, 2]
+        self.assertIs(items, self.stages.track(items))
+
+    def test_failed_build(self):
+        with self.assertRaises(ValueError):
+            with self.stages.build():
+                with self.stages.stage("a"):
+                    raise ValueError("broken ELF")
+        self.assertEqual(("build_failed", "broken ELF"), self.listener.events[-1])
+        self.assertIsNone(self.stages.current)
+
+    def test_eta(self):
+        with self.stages.stage("a", total=4) as stage:
+            self.assertIsNone(stage.eta())
+            stage.done = 2
+            self.assertGreaterEqual(stage.eta(), 0)
+        self.assertEqual(0, stage.eta())
+
+
+class TestProgressBroadcaster(unittest.TestCase):
+    def test_publishes_to_subscribers(self):
+        broadcaster = ProgressBroadcaster()
+        stages = Stages()
+        stages.listeners = [broadcaster]
+        subscription = broadcaster.subscribe()
+
+        with stages.build():
+            with stages.stage("a", "doing a"):
+                pass
+
+        events = [subscription.get_nowait() for _ in range(subscription.qsize())]
+        self.assertEqual(["build", "stage", "stage", "snapshot"], [e for e, _ in events])
+        self.assertEqual("doing a", events[1][1]["message"])
+        self.assertTrue(events[2][1]["finished"])
+
+        broadcaster.unsubscribe(subscription)
+        broadcaster.publish("build", {})
+        self.assertTrue(subscription.empty())
+
+    def test_slow_subscriber_gets_latest_event(self):
+        broadcaster = ProgressBroadcaster(max_queued=2)
+        subscription = broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish("stage", {"done": i})
+        self.assertEqual(("stage", {"done": 2}), subscription.get_nowait())
+        self.assertTrue(subscription.empty())
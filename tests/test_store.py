@@ -0,0 +1,161 @@
+import gc
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from flask import Flask
+from werkzeug.test import Client
+
+from puncover import collector, renderers, store
+from puncover.builders import ElfBuilder
+from puncover.collector import Collector, StubGccTool
+from puncover.store import StoreCollector
+
+
+def create_app(c):
+    app = Flask("puncover.puncover")
+    renderers.register_jinja_filters(app.jinja_env)
+    renderers.register_urls(app, c)
+    return app
+
+
+class FakeGccTools(StubGccTool):
+    def get_assembly_lines(self, elf_file):
+        return [
+            "00000098 <main>:\n",
+            "  98:\tf000 f802 \tbl\ta4\n",
+            "  9c:\tf000 f804 \tbl\ta8\n",
+            "  a0:\t4770      \tbx\tlr\n",
+            "\n",
+            "000000a4 <helper>:\n",
+            "  a4:\tf000 f802 \tbl\ta8\n",
+            "  a6:\t4770      \tbx\tlr\n",
+            "\n",
+            "000000a8 <leaf>:\n",
+            "  a8:\t4770      \tbx\tlr\n",
+        ]
+
+    def get_size_lines(self, elf_file):
+        return [
+            "00000098 0000000c T main\t/src/app/main.c:3\n",
+            "000000a4 00000004 T helper\t/src/app/main.c:9\n",
+            "000000a8 00000002 t leaf\t/src/lib/leaf.c:1\n",
+            "20000000 00000010 D counter\t/src/lib/leaf.c:5\n",
+        ]
+
+    def get_unmangled_names(self, symbol_names):
+        return {name: name for name in symbol_names}
+
+
+class TestStore(unittest.TestCase):
+    PAGES = [
+        "/",
+        "/all/",
+        "/all/?sort=code_asc",
+        "/path/src/",
+        "/path/src/app/",
+        "/path/src/app/main.c/",
+        "/path/src/app/main.c/main/",
+        "/path/src/lib/leaf.c/leaf/",
+        "/symbol/helper",
+        "/callees/src/app/main.c/main/",
+        "/callers/src/lib/leaf.c/leaf/",
+    ]
+
+    def setUp(self):
+        self.addCleanup(gc.unfreeze)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.elf_file = os.path.join(self.tmp, "firmware.elf")
+        open(self.elf_file, "w").close()
+        for name, lines in {
+            "main.su": ["main.c:3:5:main\t16\tstatic", "main.c:9:6:helper\t8\tstatic"],
+            "leaf.su": ["leaf.c:1:13:leaf\t4\tstatic"],
+        }.items():
+            with open(os.path.join(self.tmp, name), "w") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def build(self, c, store_path=None):
+        c.stages.listeners = []
+        builder = ElfBuilder(c, self.tmp, self.elf_file, self.tmp)
+        builder.store_path = store_path
+        builder.build()
+        return builder
+
+    def test_pages_match_memory(self):
+        memory = Collector(FakeGccTools())
+        self.build(memory)
+        stored = StoreCollector(FakeGccTools())
+        self.build(stored, os.path.join(self.tmp, "report.sqlite"))
+        self.addCleanup(stored.reset)
+
+        memory_client = Client(create_app(memory))
+        stored_client = Client(create_app(stored))
+        for page in self.PAGES:
+            expected = memory_client.get(page)
+            actual = stored_client.get(page)
+            self.assertIn(expected.status_code, [200, 302], page)
+            self.assertEqual(expected.status_code, actual.status_code, page)
+            self.assertEqual(expected.location, actual.location, page)
+            self.assertEqual(expected.get_data(), actual.get_data(), page)
+
+    def test_queries(self):
+        c = StoreCollector(FakeGccTools())
+        builder = self.build(c, os.path.join(self.tmp, "report.sqlite"))
+        self.addCleanup(c.reset)
+        self.assertFalse(os.path.exists(builder.store_path + ".new"))
+
+        main = c.symbol("main", False)
+        self.assertIs(main, c.symbol_by_addr("00000098"))
+        self.assertIs(main, c.symbol(c.qualified_symbol_name(main)))
+        self.assertIsNone(c.symbol("nothing"))
+        self.assertEqual(["helper", "leaf"], [f[collector.NAME] for f in main[collector.CALLEES]])
+        self.assertIs(main, c.symbol("helper", False)[collector.CALLERS][0])
+        self.assertEqual(["main", "helper", "leaf"], [f[collector.NAME] for f in c.all_functions()])
+        self.assertEqual(["counter"], [v[collector.NAME] for v in c.all_variables()])
+        self.assertEqual(4, len(c.all_symbols()))
+        self.assertEqual("leaf", c.all_functions()[-1][collector.NAME])
+
+        tree = main[collector.DEEPEST_CALLEE_TREE]
+        self.assertEqual(["main", "helper", "leaf"], [f[collector.NAME] for f in tree[1]])
+
+        folder = c.symbol("leaf", False)[collector.FILE][collector.FOLDER]
+        self.assertEqual(2, folder[collector.CODE_SIZE_TOTAL])
+        self.assertEqual(16, folder[collector.VAR_SIZE_TOTAL])
+
+        # analyzing the changed ELF file replaces the store
+        builder.build()
+        self.assertEqual(3, len(c.all_functions()))
+
+    def test_snapshot(self):
+        path = os.path.join(self.tmp, "report.sqlite")
+        self.build(StoreCollector(FakeGccTools()), path).collector.reset()
+
+        # served without the ELF file or a toolchain
+        os.remove(self.elf_file)
+        c = StoreCollector(None)
+        c.open(path)
+        self.addCleanup(c.reset)
+        self.assertEqual(self.elf_file, c.store.meta()["elf_file"])
+        client = Client(create_app(c))
+        for page in self.PAGES:
+            self.assertIn(client.get(page).status_code, [200, 302], page)
+        self.assertIn("bl\ta4", client.get("/path/src/app/main.c/main/").get_data(as_text=True))
+
+    def test_snapshot_version(self):
+        path = os.path.join(self.tmp, "report.sqlite")
+        self.build(StoreCollector(FakeGccTools()), path).collector.reset()
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA user_version = %d" % (store.SNAPSHOT_VERSION + 1))
+        connection.close()
+        with self.assertRaisesRegex(Exception, "version"):
+            StoreCollector(None).open(path)
+
+        with self.assertRaisesRegex(Exception, "not a puncover snapshot"):
+            StoreCollector(None).open(self.elf_file)
+
+
+if __name__ == "__main__":
+    unittest.main()